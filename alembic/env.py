@@ -6,6 +6,7 @@ from sqlalchemy import pool
 from alembic import context
 
 from app.db import Base
+from app.models import ARCHIVE_TABLE_PREFIX
 
 config = context.config
 
@@ -14,6 +15,14 @@ if config.config_file_name is not None:
 
 target_metadata = Base.metadata
 
+
+def include_object(object, name, type_, reflected, compare_to):
+    # Помесячные архивные таблицы создает run.py maintain, миграции их не касаются
+    if type_ == "table" and name.startswith(ARCHIVE_TABLE_PREFIX):
+        return False
+    return True
+
+
 def run_migrations_offline() -> None:
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
@@ -21,6 +30,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
     with context.begin_transaction():
         context.run_migrations()
@@ -35,6 +45,7 @@ def run_migrations_online() -> None:
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_object=include_object,
         )
         with context.begin_transaction():
             context.run_migrations()
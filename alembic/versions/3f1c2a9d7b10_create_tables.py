@@ -0,0 +1,56 @@
+"""Create tables
+
+Revision ID: 3f1c2a9d7b10
+Revises: 
+Create Date: 2025-06-12 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Базы, созданные раньше локальной autogenerate-ревизией, уже содержат эти таблицы
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'daily_stats' not in existing:
+        _create_daily_stats()
+    if 'last_update_time' not in existing:
+        _create_last_update_time()
+
+
+def _create_daily_stats() -> None:
+    op.create_table(
+        'daily_stats',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('campaign_id', sa.String(), nullable=False),
+        sa.Column('spend', sa.Float(), nullable=False),
+        sa.Column('conversions', sa.Integer(), nullable=False),
+        sa.Column('cpa', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('date', 'campaign_id')
+    )
+
+
+def _create_last_update_time() -> None:
+    op.create_table(
+        'last_update_time',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('last_updated_at', sa.DateTime(), nullable=False),
+        sa.Column('is_complete', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('date')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('last_update_time')
+    op.drop_table('daily_stats')
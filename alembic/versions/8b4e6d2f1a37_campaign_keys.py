@@ -0,0 +1,73 @@
+"""Campaigns dimension table and integer campaign_key in daily_stats
+
+Revision ID: 8b4e6d2f1a37
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e6d2f1a37'
+down_revision: Union[str, None] = '3f1c2a9d7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'campaigns',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('campaign_id', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('campaign_id')
+    )
+    op.execute(
+        "INSERT INTO campaigns (campaign_id) "
+        "SELECT DISTINCT campaign_id FROM daily_stats ORDER BY campaign_id"
+    )
+
+    # Первичный ключ меняется, поэтому таблица пересоздается целиком (работает и в SQLite)
+    op.create_table(
+        'daily_stats_new',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('campaign_key', sa.Integer(), nullable=False),
+        sa.Column('spend', sa.Float(), nullable=False),
+        sa.Column('conversions', sa.Integer(), nullable=False),
+        sa.Column('cpa', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['campaign_key'], ['campaigns.id']),
+        sa.PrimaryKeyConstraint('date', 'campaign_key')
+    )
+    op.execute(
+        "INSERT INTO daily_stats_new (date, campaign_key, spend, conversions, cpa) "
+        "SELECT ds.date, c.id, ds.spend, ds.conversions, ds.cpa "
+        "FROM daily_stats ds JOIN campaigns c ON c.campaign_id = ds.campaign_id"
+    )
+    op.drop_table('daily_stats')
+    op.rename_table('daily_stats_new', 'daily_stats')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table(
+        'daily_stats_old',
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('campaign_id', sa.String(), nullable=False),
+        sa.Column('spend', sa.Float(), nullable=False),
+        sa.Column('conversions', sa.Integer(), nullable=False),
+        sa.Column('cpa', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('date', 'campaign_id')
+    )
+    op.execute(
+        "INSERT INTO daily_stats_old (date, campaign_id, spend, conversions, cpa) "
+        "SELECT ds.date, c.campaign_id, ds.spend, ds.conversions, ds.cpa "
+        "FROM daily_stats ds JOIN campaigns c ON c.id = ds.campaign_key"
+    )
+    op.drop_table('daily_stats')
+    op.rename_table('daily_stats_old', 'daily_stats')
+    op.drop_table('campaigns')
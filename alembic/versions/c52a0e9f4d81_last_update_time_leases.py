@@ -0,0 +1,31 @@
+"""Lease owner and expiry columns in last_update_time
+
+Revision ID: c52a0e9f4d81
+Revises: 8b4e6d2f1a37
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52a0e9f4d81'
+down_revision: Union[str, None] = '8b4e6d2f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('last_update_time', sa.Column('lease_owner', sa.String(), nullable=True))
+    op.add_column('last_update_time', sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('last_update_time') as batch_op:
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('lease_owner')
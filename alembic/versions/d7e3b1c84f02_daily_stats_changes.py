@@ -0,0 +1,43 @@
+"""Outbox table with changes of daily_stats rows
+
+Revision ID: d7e3b1c84f02
+Revises: c52a0e9f4d81
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7e3b1c84f02'
+down_revision: Union[str, None] = 'c52a0e9f4d81'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'daily_stats_changes',
+        sa.Column('seq', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('campaign_key', sa.Integer(), nullable=False),
+        sa.Column('old_spend', sa.Float(), nullable=True),
+        sa.Column('new_spend', sa.Float(), nullable=False),
+        sa.Column('old_conversions', sa.Integer(), nullable=True),
+        sa.Column('new_conversions', sa.Integer(), nullable=False),
+        sa.Column('old_cpa', sa.Float(), nullable=True),
+        sa.Column('new_cpa', sa.Float(), nullable=True),
+        sa.Column('changed_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['campaign_key'], ['campaigns.id']),
+        sa.PrimaryKeyConstraint('seq'),
+        sqlite_autoincrement=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_stats_changes')
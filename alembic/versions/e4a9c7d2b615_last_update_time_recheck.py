@@ -0,0 +1,29 @@
+"""Learned recheck interval in last_update_time
+
+Revision ID: e4a9c7d2b615
+Revises: d7e3b1c84f02
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a9c7d2b615'
+down_revision: Union[str, None] = 'd7e3b1c84f02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('last_update_time', sa.Column('recheck_seconds', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('last_update_time') as batch_op:
+        batch_op.drop_column('recheck_seconds')
@@ -0,0 +1,47 @@
+"""Archive partitions and monthly rollups of daily_stats
+
+Revision ID: f1b8d3a6c920
+Revises: e4a9c7d2b615
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b8d3a6c920'
+down_revision: Union[str, None] = 'e4a9c7d2b615'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'archive_partitions',
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('archived_through', sa.Date(), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('month')
+    )
+    op.create_table(
+        'daily_stats_monthly',
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('campaign_key', sa.Integer(), nullable=False),
+        sa.Column('spend', sa.Float(), nullable=False),
+        sa.Column('conversions', sa.Integer(), nullable=False),
+        sa.Column('days', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['campaign_key'], ['campaigns.id']),
+        sa.PrimaryKeyConstraint('month', 'campaign_key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_stats_monthly')
+    op.drop_table('archive_partitions')
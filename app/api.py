@@ -1,5 +1,8 @@
 import json
-from typing import List, Dict, Any
+import os
+import time
+from typing import List, Dict, Any, Optional
+from urllib.parse import urljoin
 import requests
 import logging
 
@@ -7,25 +10,81 @@ logger = logging.getLogger(__name__)
 
 from app.data_models import SpendEntry, ConversionEntry
 
+DEFAULT_FB_SPEND_URL = "https://179c1438-5a21-4e5c-b700-3412c1473e22.mock.pstmn.io/fb_spend"
+DEFAULT_NETWORK_CONV_URL = "https://179c1438-5a21-4e5c-b700-3412c1473e22.mock.pstmn.io/network_conv"
+
+
 class ApiDataSource:
-    def __init__(self):
+    def __init__(
+        self,
+        fb_spend_url: Optional[str] = None,
+        network_conv_url: Optional[str] = None,
+        timeout: float = 10,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5
+    ):
         """
         Инициализирует источник данных API с указанными URL-адресами.
+        Если URL не переданы, они берутся из переменных окружения FB_SPEND_URL
+        и NETWORK_CONV_URL, а затем из адресов по умолчанию.
+
+        Args:
+            timeout: Таймаут одного HTTP-запроса в секундах.
+            max_retries: Количество повторов при таймауте, ошибке соединения или ответе 5xx.
+            retry_backoff: Базовая пауза между повторами (удваивается с каждой попыткой).
+        """
+        self.fb_spend_url = fb_spend_url or os.environ.get("FB_SPEND_URL", DEFAULT_FB_SPEND_URL)
+        self.network_conv_url = network_conv_url or os.environ.get("NETWORK_CONV_URL", DEFAULT_NETWORK_CONV_URL)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        # Одна сессия на источник: keep-alive между страницами и запросами
+        self.session = requests.Session()
+
+    def _get_json(self, url: str) -> Any:
+        """
+        Выполняет GET-запрос с повторами при временных ошибках и возвращает разобранный JSON.
         """
-        self.fb_spend_url = "https://179c1438-5a21-4e5c-b700-3412c1473e22.mock.pstmn.io/fb_spend"
-        self.network_conv_url = "https://179c1438-5a21-4e5c-b700-3412c1473e22.mock.pstmn.io/network_conv"
+        attempt = 0
+        while True:
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code >= 500 and attempt < self.max_retries:
+                    logger.warning(f"Ответ {response.status_code} от {url}, повтор {attempt + 1}/{self.max_retries}.")
+                else:
+                    response.raise_for_status()  # Викличе HTTPError для поганих відповідей (4xx або 5xx)
+                    return response.json()
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"Временная ошибка запроса к {url}: {e}, повтор {attempt + 1}/{self.max_retries}.")
+            time.sleep(self.retry_backoff * (2 ** attempt))
+            attempt += 1
 
     def _fetch_data_from_api(self, url: str) -> List[Dict[str, Any]]:
         """
         Выполняет HTTP GET-запрос к указанному URL и возвращает JSON-ответ.
-        Включает в себя базовую обработку ошибок.
+        Поддерживает постраничные ответы вида {"data": [...], "next": "<url следующей страницы>"}.
+        Включает в себя базовую обработку ошибок: при ошибке на любой странице
+        возвращается пустой список, чтобы не сохранить неполные данные.
         """
         try:
             logger.info(f"Выполнение GET-запроса к: {url}")
-            response = requests.get(url, timeout=10) # Додаємо таймаут
-            response.raise_for_status()  # Викличе HTTPError для поганих відповідей (4xx або 5xx)
-            logger.info(f"Успешно получены данные из {url}")
-            return response.json()
+            items: List[Dict[str, Any]] = []
+            page_url: Optional[str] = url
+            pages = 0
+            while page_url:
+                payload = self._get_json(page_url)
+                pages += 1
+                if isinstance(payload, dict):
+                    items.extend(payload.get("data", []))
+                    next_url = payload.get("next")
+                    page_url = urljoin(page_url, next_url) if next_url else None
+                else:
+                    items.extend(payload)
+                    page_url = None
+            logger.info(f"Успешно получены данные из {url} ({len(items)} записей, страниц: {pages})")
+            return items
         except requests.exceptions.Timeout:
             logger.error(f"Таймаут запроса к {url}. Сервер не отвечает.")
             return []
@@ -33,7 +92,7 @@ class ApiDataSource:
             logger.error(f"Ошибка соединения при запросе {url}. Проверьте подключение к Интернету.")
             return []
         except requests.exceptions.HTTPError as e:
-            logger.error(f"HTTP ошибка при получении данных из {url}: {e} - Статус: {response.status_code}")
+            logger.error(f"HTTP ошибка при получении данных из {url}: {e} - Статус: {e.response.status_code}")
             return []
         except requests.exceptions.RequestException as e:
             logger.error(f"Неизвестная ошибка при получении данных из {url}: {e}")
@@ -0,0 +1,110 @@
+import datetime
+import logging
+import time
+from typing import Callable, Optional
+
+from app.crud import ArchiveCRUD
+from app.data_models import MaintenanceStats
+from app.db import Database
+
+logger = logging.getLogger(__name__)
+
+# SQLite: значение PRAGMA auto_vacuum для режима INCREMENTAL
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+class DailyStatsArchiver:
+    def __init__(
+            self,
+            database: Database,
+            retention_days: int = 365,
+            pause_seconds: float = 0.05,
+            vacuum_pages_per_step: int = 1000,
+            clock: Callable[[], datetime.datetime] = datetime.datetime.utcnow
+    ):
+        """
+        Обслуживание базы: перенос старых дат daily_stats в помесячные архивные
+        таблицы, освобождение места и обновление статистики планировщика.
+
+        Args:
+            database: База данных.
+            retention_days: Сколько последних дней остается в daily_stats.
+            pause_seconds: Пауза между датами, чтобы параллельный синк успевал
+                получить блокировку записи.
+            vacuum_pages_per_step: Сколько свободных страниц SQLite возвращать за один шаг
+                incremental_vacuum.
+            clock: Часы (для тестов).
+        """
+        self.database = database
+        self.retention_days = retention_days
+        self.pause_seconds = pause_seconds
+        self.vacuum_pages_per_step = vacuum_pages_per_step
+        self.clock = clock
+
+    @property
+    def horizon(self) -> datetime.date:
+        """Даты раньше горизонта переносятся в архив."""
+        return self.clock().date() - datetime.timedelta(days=self.retention_days)
+
+    def archive(self, max_days: Optional[int] = None, stats: Optional[MaintenanceStats] = None) -> MaintenanceStats:
+        """
+        Переносит в архив даты раньше горизонта, по одной дате на транзакцию.
+        Прерванный запуск можно просто повторить: он продолжит с первой неперенесенной даты.
+        """
+        stats = stats or MaintenanceStats()
+        started = time.perf_counter()
+        with self.database.get_db() as session:
+            archive_crud = ArchiveCRUD(session)
+            dates = archive_crud.get_dates_to_archive(self.horizon, limit=max_days)
+            logger.info(f"К переносу в архив (раньше {self.horizon.isoformat()}): {len(dates)} дат.")
+            for record_date in dates:
+                stats.rows_archived += archive_crud.archive_date(record_date)
+                stats.days_archived += 1
+                if self.pause_seconds:
+                    time.sleep(self.pause_seconds)
+            stats.archived_through = archive_crud.get_archived_through()
+        stats.stage_seconds["archive"] = time.perf_counter() - started
+        return stats
+
+    def vacuum(self, full: bool = False, stats: Optional[MaintenanceStats] = None) -> MaintenanceStats:
+        """
+        Возвращает свободные страницы SQLite и обновляет статистику (ANALYZE).
+        incremental_vacuum выполняется короткими шагами вне транзакции. Если база
+        создана без auto_vacuum=INCREMENTAL, нужен однократный full=True (полный VACUUM).
+        """
+        stats = stats or MaintenanceStats()
+        started = time.perf_counter()
+        with self.database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if connection.dialect.name == "sqlite":
+                mode = connection.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+                if full:
+                    logger.info("Полный VACUUM с переключением auto_vacuum в INCREMENTAL.")
+                    connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+                    connection.exec_driver_sql("VACUUM")
+                elif mode == _AUTO_VACUUM_INCREMENTAL:
+                    free_pages = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+                    while free_pages:
+                        # Каждый шаг — отдельная короткая транзакция. executescript() выполняет PRAGMA
+                        # до конца: обычный execute() делает один шаг и освобождает одну страницу
+                        connection.connection.driver_connection.executescript(
+                            f"PRAGMA incremental_vacuum({self.vacuum_pages_per_step})")
+                        remaining = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+                        stats.pages_freed += free_pages - remaining
+                        if remaining >= free_pages:
+                            break
+                        free_pages = remaining
+                else:
+                    logger.warning(
+                        "База создана без auto_vacuum=INCREMENTAL: место не освобождается. "
+                        "Запустите один раз maintain --full-vacuum.")
+            connection.exec_driver_sql("ANALYZE")
+        stats.stage_seconds["vacuum"] = time.perf_counter() - started
+        return stats
+
+    def run(self, max_days: Optional[int] = None, full_vacuum: bool = False) -> MaintenanceStats:
+        stats = self.archive(max_days=max_days)
+        self.vacuum(full=full_vacuum, stats=stats)
+        logger.info(
+            f"Обслуживание завершено: в архив перенесено {stats.days_archived} дат ({stats.rows_archived} строк), "
+            f"архив по {stats.archived_through}, освобождено страниц: {stats.pages_freed}.")
+        return stats
@@ -0,0 +1,80 @@
+import datetime
+import json
+import logging
+import os
+import re
+from dataclasses import asdict
+from typing import Iterator, List, Sequence, Tuple
+
+from app.data_models import ChangeRecord
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_RE = re.compile(r"^changes-(\d+)-(\d+)\.ndjson$")
+
+
+def change_record_to_json(record: ChangeRecord) -> str:
+    data = asdict(record)
+    data["date"] = record.date.isoformat()
+    return json.dumps(data, separators=(",", ":"))
+
+
+def change_record_from_json(line: str) -> ChangeRecord:
+    data = json.loads(line)
+    data["date"] = datetime.date.fromisoformat(data["date"])
+    return ChangeRecord(**data)
+
+
+class ChangeSegmentSink:
+    def __init__(self, directory: str):
+        """
+        Пишет ленту изменений DailyStats в NDJSON-сегменты в каталоге directory.
+        Каждый сегмент соответствует одной транзакции и называется
+        changes-<первый seq>-<последний seq>.ndjson.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, records: Sequence[ChangeRecord]):
+        """Атомарно записывает сегмент (через временный файл и os.replace)."""
+        if not records:
+            return
+        name = f"changes-{records[0].seq:012d}-{records[-1].seq:012d}.ndjson"
+        path = os.path.join(self.directory, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(change_record_to_json(record))
+                f.write("\n")
+        os.replace(tmp_path, path)
+        logger.debug(f"Записан сегмент изменений {name} ({len(records)} записей).")
+
+    def segments(self) -> List[Tuple[int, int, str]]:
+        """Возвращает сегменты (первый seq, последний seq, путь), упорядоченные по seq."""
+        result = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                result.append((int(match.group(1)), int(match.group(2)), os.path.join(self.directory, name)))
+        return sorted(result)
+
+    def read_since(self, since_seq: int = 0) -> Iterator[ChangeRecord]:
+        """Читает изменения с seq > since_seq, пропуская целиком прочитанные сегменты."""
+        for _, last_seq, path in self.segments():
+            if last_seq <= since_seq:
+                continue
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    record = change_record_from_json(line)
+                    if record.seq > since_seq:
+                        yield record
+
+    def compact(self, upto_seq: int) -> int:
+        """Удаляет сегменты, все изменения которых имеют seq <= upto_seq. Возвращает их количество."""
+        removed = 0
+        for _, last_seq, path in self.segments():
+            if last_seq <= upto_seq:
+                os.remove(path)
+                removed += 1
+        logger.info(f"Удалено {removed} прочитанных сегментов изменений (seq <= {upto_seq}).")
+        return removed
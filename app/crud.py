@@ -1,22 +1,232 @@
+from sqlalchemy import Date, and_, bindparam, delete, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
-from app.models import DailyStats, LastUpdateTime
-from datetime import date, datetime
-from typing import Optional
+from app.changefeed import ChangeSegmentSink
+from app.data_models import ChangeRecord, CombinedDailyStatData
+from app.models import (
+    ArchivePartition, Campaign, DailyStats, DailyStatsChange, DailyStatsMonthly, LastUpdateTime,
+    archive_table, month_end, month_start
+)
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ограничение на размер IN (...) / многострочного INSERT за один запрос
+_CHUNK_SIZE = 500
 
-class DailyStatsCRUD:
+
+def _chunks(items: List, size: int = _CHUNK_SIZE) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class ArchivedDateError(ValueError):
+    """Запись за дату, уже перенесенную в архив: архивные даты только читаются."""
+
+
+def _archived_through(db: Session) -> Optional[date]:
+    return db.execute(select(func.max(ArchivePartition.archived_through))).scalar()
+
+
+def _dialect_insert(db: Session, table):
+    """
+    Возвращает insert() диалекта текущего подключения, поддерживающий ON CONFLICT
+    для SQLite и PostgreSQL, и обычный insert() для остальных баз.
+    """
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    return insert(table)
+
+
+class CampaignCRUD:
     def __init__(self, db_session: Session):
         self.db = db_session
+        # Кэш соответствий строкового ID кампании и целочисленного ключа.
+        # Ключи никогда не меняются, поэтому кэш не требует инвалидации.
+        self._keys: Dict[str, int] = {}
+
+    def get_campaign_key(self, campaign_id: str) -> Optional[int]:
+        """Возвращает ключ кампании, не создавая новую запись."""
+        if campaign_id not in self._keys:
+            key = self.db.execute(
+                select(Campaign.id).where(Campaign.campaign_id == campaign_id)
+            ).scalar_one_or_none()
+            if key is None:
+                return None
+            self._keys[campaign_id] = key
+        return self._keys[campaign_id]
+
+    def resolve_campaign_keys(self, campaign_ids: Iterable[str]) -> Dict[str, int]:
+        """
+        Возвращает ключи для всех переданных ID кампаний, создавая недостающие
+        записи в campaigns одним пакетом.
+        """
+        campaign_ids = set(campaign_ids)
+        missing = sorted(cid for cid in campaign_ids if cid not in self._keys)
+        if missing:
+            self._load_keys(missing)
+            new_ids = [cid for cid in missing if cid not in self._keys]
+            if new_ids:
+                for chunk in _chunks(new_ids):
+                    stmt = _dialect_insert(self.db, Campaign.__table__).values(
+                        [{"campaign_id": cid} for cid in chunk]
+                    )
+                    if hasattr(stmt, "on_conflict_do_nothing"):
+                        # Другой процесс мог успеть создать ту же кампанию
+                        stmt = stmt.on_conflict_do_nothing(index_elements=["campaign_id"])
+                    self.db.execute(stmt)
+                self.db.commit()
+                self._load_keys(new_ids)
+                logger.debug(f"Добавлено {len(new_ids)} новых кампаний.")
+        return {cid: self._keys[cid] for cid in campaign_ids}
+
+    def _load_keys(self, campaign_ids: List[str]):
+        for chunk in _chunks(campaign_ids):
+            rows = self.db.execute(
+                select(Campaign.campaign_id, Campaign.id).where(Campaign.campaign_id.in_(chunk))
+            )
+            self._keys.update({row.campaign_id: row.id for row in rows})
+
+
+class DailyStatsCRUD:
+    def __init__(
+        self,
+        db_session: Session,
+        campaign_crud: Optional[CampaignCRUD] = None,
+        change_sink: Optional[ChangeSegmentSink] = None
+    ):
+        """
+        Args:
+            campaign_crud: CRUD кампаний с кэшем ключей (по умолчанию создается новый).
+            change_sink: Если задан, изменения строк дополнительно пишутся в NDJSON-сегменты.
+        """
+        self.db = db_session
+        self.campaigns = campaign_crud or CampaignCRUD(db_session)
+        self.change_sink = change_sink
+
+    @staticmethod
+    def _change_row(
+        record_date: date,
+        campaign_key: int,
+        old_values: Optional[Tuple[float, int, Optional[float]]],
+        new_values: Tuple[float, int, Optional[float]]
+    ) -> Optional[Dict]:
+        """Возвращает строку outbox, если значения строки действительно изменились."""
+        if old_values == new_values:
+            return None
+        old_spend, old_conversions, old_cpa = old_values or (None, None, None)
+        return {
+            "date": record_date,
+            "campaign_key": campaign_key,
+            "old_spend": old_spend,
+            "new_spend": new_values[0],
+            "old_conversions": old_conversions,
+            "new_conversions": new_values[1],
+            "old_cpa": old_cpa,
+            "new_cpa": new_values[2],
+            "changed_at": datetime.utcnow()
+        }
+
+    def _commit_changes(self, changes: List[Tuple[Dict, str]]):
+        """
+        Записывает строки outbox в текущую транзакцию, фиксирует ее
+        и после коммита публикует изменения в change_sink.
+        """
+        records: List[ChangeRecord] = []
+        if changes:
+            rows = [row for row, _ in changes]
+            table = DailyStatsChange.__table__
+            dialect = self.db.get_bind().dialect
+            if dialect.name == "sqlite":
+                # Для autoincrement-ключа без sentinel SQLAlchemy выполняет INSERT ... RETURNING
+                # в SQLite по строке на запрос. Вместо этого — один executemany без RETURNING:
+                # транзакция держит блокировку записи, строки получают seq подряд в порядке
+                # параметров, и последний из них — max(seq)
+                self.db.execute(insert(table), rows)
+                last_seq = self.db.execute(select(func.max(table.c.seq))).scalar_one()
+                seqs = list(range(last_seq - len(rows) + 1, last_seq + 1))
+            elif dialect.insert_executemany_returning_sort_by_parameter_order:
+                # INSERT ... VALUES (...), (...) RETURNING seq пакетами (insertmanyvalues)
+                seqs = self.db.execute(
+                    insert(table).returning(table.c.seq, sort_by_parameter_order=True), rows
+                ).scalars().all()
+            else:
+                seqs = [self.db.execute(insert(table), row).inserted_primary_key[0] for row in rows]
+            records = [
+                ChangeRecord(
+                    seq=seq,
+                    date=row["date"],
+                    campaign_id=campaign_id,
+                    old_spend=row["old_spend"],
+                    new_spend=row["new_spend"],
+                    old_conversions=row["old_conversions"],
+                    new_conversions=row["new_conversions"],
+                    old_cpa=row["old_cpa"],
+                    new_cpa=row["new_cpa"]
+                )
+                for seq, (row, campaign_id) in zip(seqs, changes)
+            ]
+        self.db.commit()
+        if self.change_sink and records:
+            self.change_sink.write(records)
+
+    def resolve_campaign_keys(self, campaign_ids: Iterable[str]) -> Dict[str, int]:
+        """Заранее разрешает ключи кампаний одним пакетом (см. CampaignCRUD)."""
+        return self.campaigns.resolve_campaign_keys(campaign_ids)
 
     def get_daily_stat(self, record_date: date, campaign_id: str) -> Optional[DailyStats]:
-        """Получает статистику по дате и ID кампании."""
+        """
+        Получает статистику по дате и ID кампании. Для даты, перенесенной в архив,
+        строка читается из архивной партиции и возвращается как объект DailyStats
+        вне сессии (изменять его нельзя).
+        """
+        return self._get_daily_stat(record_date, campaign_id, _archived_through(self.db))
+
+    def _get_daily_stat(
+        self,
+        record_date: date,
+        campaign_id: str,
+        archived_through: Optional[date]
+    ) -> Optional[DailyStats]:
+        """get_daily_stat с уже прочитанной границей архива archived_through."""
+        campaign_key = self.campaigns.get_campaign_key(campaign_id)
+        if campaign_key is None:
+            return None
+        if archived_through is not None and record_date <= archived_through:
+            if self.db.get(ArchivePartition, month_start(record_date)) is None:
+                return None  # за этот месяц в архив не попало ни одной строки
+            table = archive_table(month_start(record_date))
+            row = self.db.execute(
+                select(table.c.spend, table.c.conversions, table.c.cpa)
+                .where(table.c.date == record_date, table.c.campaign_key == campaign_key)
+            ).first()
+            if row is None:
+                return None
+            return DailyStats(
+                date=record_date,
+                campaign_key=campaign_key,
+                campaign=self.db.get(Campaign, campaign_key),
+                spend=row.spend,
+                conversions=row.conversions,
+                cpa=row.cpa
+            )
         return self.db.query(DailyStats).filter_by(
-            date=record_date, campaign_id=campaign_id
+            date=record_date, campaign_key=campaign_key
         ).first()
 
+    @staticmethod
+    def _check_not_archived(record_date: date, archived_through: Optional[date]):
+        if archived_through is not None and record_date <= archived_through:
+            raise ArchivedDateError(
+                f"Дата {record_date.isoformat()} перенесена в архив (по {archived_through.isoformat()}) "
+                f"и не может быть изменена.")
+
     def create_daily_stat(
         self,
         record_date: date,
@@ -25,16 +235,29 @@ class DailyStatsCRUD:
         conversions: int,
         cpa: Optional[float] = None
     ) -> DailyStats:
-        """Создает новую запись DailyStats."""
+        """Создает новую запись DailyStats. Для архивной даты поднимает ArchivedDateError."""
+        self._check_not_archived(record_date, _archived_through(self.db))
+        return self._create_daily_stat(record_date, campaign_id, spend, conversions, cpa)
+
+    def _create_daily_stat(
+        self,
+        record_date: date,
+        campaign_id: str,
+        spend: float,
+        conversions: int,
+        cpa: Optional[float]
+    ) -> DailyStats:
+        campaign_key = self.campaigns.resolve_campaign_keys([campaign_id])[campaign_id]
         db_stat = DailyStats(
             date=record_date,
-            campaign_id=campaign_id,
+            campaign_key=campaign_key,
             spend=spend,
             conversions=conversions,
             cpa=cpa
         )
         self.db.add(db_stat)
-        self.db.commit()
+        change = self._change_row(record_date, campaign_key, None, (spend, conversions, cpa))
+        self._commit_changes([(change, campaign_id)])
         self.db.refresh(db_stat)
         logger.debug(f"Создана новая запись: {record_date} - {campaign_id}")
         return db_stat
@@ -46,11 +269,27 @@ class DailyStatsCRUD:
         conversions: int,
         cpa: Optional[float] = None
     ) -> DailyStats:
-        """Обновляет существующую запись DailyStats."""
+        """Обновляет существующую запись DailyStats. Для архивной даты поднимает ArchivedDateError."""
+        self._check_not_archived(db_stat.date, _archived_through(self.db))
+        return self._update_daily_stat(db_stat, spend, conversions, cpa)
+
+    def _update_daily_stat(
+        self,
+        db_stat: DailyStats,
+        spend: float,
+        conversions: int,
+        cpa: Optional[float]
+    ) -> DailyStats:
+        change = self._change_row(
+            db_stat.date,
+            db_stat.campaign_key,
+            (db_stat.spend, db_stat.conversions, db_stat.cpa),
+            (spend, conversions, cpa)
+        )
         db_stat.spend = spend
         db_stat.conversions = conversions
         db_stat.cpa = cpa
-        self.db.commit()
+        self._commit_changes([(change, db_stat.campaign_id)] if change else [])
         self.db.refresh(db_stat)
         logger.debug(f"Обновлена существующая запись: {db_stat.date} - {db_stat.campaign_id}")
         return db_stat
@@ -66,13 +305,315 @@ class DailyStatsCRUD:
         """
         Создание или обновление записи DailyStats.
         Если запись существует, она обновляется; иначе создается новый.
+        Для даты, перенесенной в архив, поднимает ArchivedDateError.
         """
-        existing_stat = self.get_daily_stat(record_date, campaign_id)
+        # Граница архива читается один раз на вызов и передается вспомогательным методам
+        archived_through = _archived_through(self.db)
+        self._check_not_archived(record_date, archived_through)
+        existing_stat = self._get_daily_stat(record_date, campaign_id, archived_through)
 
         if existing_stat:
-            return self.update_daily_stat(existing_stat, spend, conversions, cpa)
+            return self._update_daily_stat(existing_stat, spend, conversions, cpa)
         else:
-            return self.create_daily_stat(record_date, campaign_id, spend, conversions, cpa)
+            return self._create_daily_stat(record_date, campaign_id, spend, conversions, cpa)
+
+    def _load_existing_values(self, rows: List[Dict]) -> Dict[Tuple[date, int], Tuple[float, int, Optional[float]]]:
+        """Читает текущие значения (spend, conversions, cpa) для ключей пакета."""
+        dates = sorted({row["date"] for row in rows})
+        campaign_keys = sorted({row["campaign_key"] for row in rows})
+        existing = {}
+        for keys_chunk in _chunks(campaign_keys):
+            result = self.db.execute(
+                select(DailyStats.date, DailyStats.campaign_key, DailyStats.spend, DailyStats.conversions, DailyStats.cpa)
+                .where(DailyStats.date.in_(dates), DailyStats.campaign_key.in_(keys_chunk))
+            )
+            existing.update({(r.date, r.campaign_key): (r.spend, r.conversions, r.cpa) for r in result})
+        return existing
+
+    def get_daily_values(self, dates: Iterable[date]) -> Dict[Tuple[date, str], Tuple[float, int, Optional[float]]]:
+        """Снимок текущих значений (spend, conversions, cpa) всех кампаний за указанные даты."""
+        snapshot = {}
+        for dates_chunk in _chunks(sorted(set(dates))):
+            result = self.db.execute(
+                select(DailyStats.date, Campaign.campaign_id, DailyStats.spend, DailyStats.conversions, DailyStats.cpa)
+                .join(Campaign, Campaign.id == DailyStats.campaign_key)
+                .where(DailyStats.date.in_(dates_chunk))
+            )
+            snapshot.update({(r.date, r.campaign_id): (r.spend, r.conversions, r.cpa) for r in result})
+        return snapshot
+
+    def bulk_upsert_daily_stats(self, items: Sequence[CombinedDailyStatData]) -> int:
+        """
+        Создание или обновление пакета записей DailyStats одной транзакцией.
+        Записываются только новые и изменившиеся строки; для каждой из них
+        в той же транзакции добавляется запись outbox (daily_stats_changes).
+        Для SQLite и PostgreSQL используется INSERT ... ON CONFLICT DO UPDATE.
+        Строки за даты, уже перенесенные в архив (их мог поставить в очередь синк,
+        начавшийся до архивации), отбрасываются с предупреждением.
+        Возвращает количество записанных строк.
+        """
+        if not items:
+            return 0
+        archived_through = _archived_through(self.db)
+        if archived_through is not None:
+            late = [item for item in items if item.date <= archived_through]
+            if late:
+                logger.warning(
+                    f"Отброшено {len(late)} строк за даты, перенесенные в архив (по {archived_through.isoformat()}): "
+                    f"{sorted({item.date.isoformat() for item in late})}")
+                items = [item for item in items if item.date > archived_through]
+                if not items:
+                    self.db.commit()
+                    return 0
+        keys = self.campaigns.resolve_campaign_keys({item.campaign_id for item in items})
+        campaign_ids = {key: campaign_id for campaign_id, key in keys.items()}
+        # При повторе ключа в пакете побеждает последнее значение
+        rows = list({
+            (item.date, keys[item.campaign_id]): {
+                "date": item.date,
+                "campaign_key": keys[item.campaign_id],
+                "spend": item.spend,
+                "conversions": item.conversions,
+                "cpa": item.cpa
+            }
+            for item in items
+        }.values())
+
+        existing = self._load_existing_values(rows)
+        rows = [
+            row for row in rows
+            if existing.get((row["date"], row["campaign_key"])) != (row["spend"], row["conversions"], row["cpa"])
+        ]
+        if not rows:
+            self.db.commit()
+            return 0
+
+        if self.db.get_bind().dialect.name in ("sqlite", "postgresql"):
+            # Один кэшируемый оператор на весь пакет (executemany) вместо
+            # компиляции нового .values(<chunk>) на каждый кусок
+            stmt = _dialect_insert(self.db, DailyStats.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["date", "campaign_key"],
+                set_={
+                    "spend": stmt.excluded.spend,
+                    "conversions": stmt.excluded.conversions,
+                    "cpa": stmt.excluded.cpa
+                }
+            )
+            self.db.execute(stmt, rows)
+        else:
+            for row in rows:
+                self.db.merge(DailyStats(**row))
+
+        changes = []
+        for row in rows:
+            key = (row["date"], row["campaign_key"])
+            change = self._change_row(
+                row["date"], row["campaign_key"], existing.get(key), (row["spend"], row["conversions"], row["cpa"])
+            )
+            changes.append((change, campaign_ids[row["campaign_key"]]))
+        self._commit_changes(changes)
+        logger.debug(f"Пакетно сохранено {len(rows)} записей DailyStats.")
+        return len(rows)
+
+    @staticmethod
+    def _filter_dates(stmt, start_date: Optional[date], end_date: Optional[date], column=DailyStats.date):
+        if start_date:
+            stmt = stmt.where(column >= start_date)
+        if end_date:
+            stmt = stmt.where(column <= end_date)
+        return stmt
+
+    def _archived_months(self, start_date: Optional[date], end_date: Optional[date]) -> List[date]:
+        stmt = select(ArchivePartition.month).order_by(ArchivePartition.month)
+        if start_date:
+            stmt = stmt.where(ArchivePartition.month >= month_start(start_date))
+        if end_date:
+            stmt = stmt.where(ArchivePartition.month <= end_date)
+        return list(self.db.execute(stmt).scalars())
+
+    def _stats_rows(
+        self,
+        start_date: Optional[date],
+        end_date: Optional[date],
+        campaign_key: Optional[int] = None,
+        rollup: bool = False
+    ):
+        """
+        Подзапрос со строками daily_stats за период, включая перенесенные в архивные
+        партиции (колонки date, campaign_key, spend, conversions, cpa).
+        При rollup=True отдаются только campaign_key, spend и conversions, а архивные
+        месяцы, целиком покрытые периодом, берутся из помесячных итогов.
+        """
+        def rows(table):
+            if rollup:
+                stmt = select(table.c.campaign_key, table.c.spend, table.c.conversions)
+            else:
+                stmt = select(table.c.date, table.c.campaign_key, table.c.spend, table.c.conversions, table.c.cpa)
+            if campaign_key is not None:
+                stmt = stmt.where(table.c.campaign_key == campaign_key)
+            return self._filter_dates(stmt, start_date, end_date, table.c.date)
+
+        # Для дат по archived_through включительно архив — единственный источник: строки,
+        # оставшиеся в daily_stats после гонки с архивацией, не учитываются дважды
+        live = rows(DailyStats.__table__)
+        archived_through = _archived_through(self.db)
+        if archived_through is not None:
+            live = live.where(DailyStats.__table__.c.date > archived_through)
+        branches = [live]
+        for month in self._archived_months(start_date, end_date):
+            covered = (start_date is None or start_date <= month) and (end_date is None or end_date >= month_end(month))
+            if rollup and covered:
+                monthly = DailyStatsMonthly.__table__
+                stmt = select(monthly.c.campaign_key, monthly.c.spend, monthly.c.conversions).where(monthly.c.month == month)
+                if campaign_key is not None:
+                    stmt = stmt.where(monthly.c.campaign_key == campaign_key)
+                branches.append(stmt)
+            else:
+                branches.append(rows(archive_table(month)))
+        stmt = branches[0] if len(branches) == 1 else union_all(*branches)
+        return stmt.subquery("stats")
+
+    def get_campaign_series(
+        self,
+        campaign_id: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> List[Row]:
+        """Возвращает временной ряд (date, spend, conversions, cpa) кампании, упорядоченный по дате."""
+        campaign_key = self.campaigns.get_campaign_key(campaign_id)
+        if campaign_key is None:
+            return []
+        stats = self._stats_rows(start_date, end_date, campaign_key=campaign_key)
+        stmt = select(stats.c.date, stats.c.spend, stats.c.conversions, stats.c.cpa).order_by(stats.c.date)
+        return list(self.db.execute(stmt))
+
+    def get_totals(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Row:
+        """Возвращает суммарные spend, conversions и количество кампаний за период."""
+        stats = self._stats_rows(start_date, end_date, rollup=True)
+        stmt = select(
+            func.coalesce(func.sum(stats.c.spend), 0.0).label("spend"),
+            func.coalesce(func.sum(stats.c.conversions), 0).label("conversions"),
+            func.count(func.distinct(stats.c.campaign_key)).label("campaigns")
+        )
+        return self.db.execute(stmt).one()
+
+    def get_top_campaigns(
+        self,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        limit: int = 10,
+        order_by: str = "spend"
+    ) -> List[Row]:
+        """
+        Возвращает limit кампаний (campaign_id, spend, conversions, cpa) за период.
+        order_by: "spend" и "conversions" — по убыванию, "cpa" — по возрастанию
+        (кампании без конверсий не учитываются).
+        """
+        stats = self._stats_rows(start_date, end_date, rollup=True)
+        spend = func.sum(stats.c.spend)
+        conversions = func.sum(stats.c.conversions)
+        cpa = spend / func.nullif(conversions, 0)
+        stmt = (
+            select(
+                Campaign.campaign_id,
+                spend.label("spend"),
+                conversions.label("conversions"),
+                cpa.label("cpa")
+            )
+            .join(Campaign, stats.c.campaign_key == Campaign.id)
+            .group_by(Campaign.campaign_id)
+            .limit(limit)
+        )
+        if order_by == "spend":
+            stmt = stmt.order_by(spend.desc(), Campaign.campaign_id)
+        elif order_by == "conversions":
+            stmt = stmt.order_by(conversions.desc(), Campaign.campaign_id)
+        elif order_by == "cpa":
+            stmt = stmt.having(conversions > 0).order_by(cpa, Campaign.campaign_id)
+        else:
+            raise ValueError(f"Неподдерживаемая сортировка: {order_by}")
+        return list(self.db.execute(stmt))
+
+    def iter_daily_stats_rows(
+        self,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        campaign_ids: Optional[Sequence[str]] = None,
+        batch_size: int = 1000
+    ) -> Iterator[Row]:
+        """
+        Потоково отдает строки daily_stats (date, campaign_id, spend, conversions, cpa),
+        включая архивные партиции.
+        Использует Core select() без ORM identity map и серверный курсор (yield_per),
+        поэтому потребление памяти не зависит от размера таблицы.
+        """
+        stats = self._stats_rows(start_date, end_date)
+        stmt = select(
+            stats.c.date,
+            Campaign.campaign_id,
+            stats.c.spend,
+            stats.c.conversions,
+            stats.c.cpa
+        ).join(Campaign, stats.c.campaign_key == Campaign.id).order_by(stats.c.date, Campaign.campaign_id)
+        if campaign_ids:
+            stmt = stmt.where(Campaign.campaign_id.in_(campaign_ids))
+
+        result = self.db.execute(stmt.execution_options(yield_per=batch_size))
+        try:
+            for partition in result.partitions():
+                yield from partition
+        finally:
+            result.close()
+
+
+class DailyStatsChangeCRUD:
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def get_last_seq(self) -> int:
+        """Возвращает последний seq в outbox (0, если изменений нет)."""
+        return self.db.execute(select(func.max(DailyStatsChange.seq))).scalar() or 0
+
+    def read_changes(self, since_seq: int = 0, limit: int = 1000) -> List[ChangeRecord]:
+        """Возвращает до limit изменений с seq > since_seq в порядке seq."""
+        result = self.db.execute(
+            select(
+                DailyStatsChange.seq,
+                DailyStatsChange.date,
+                Campaign.campaign_id,
+                DailyStatsChange.old_spend,
+                DailyStatsChange.new_spend,
+                DailyStatsChange.old_conversions,
+                DailyStatsChange.new_conversions,
+                DailyStatsChange.old_cpa,
+                DailyStatsChange.new_cpa
+            )
+            .join(Campaign, DailyStatsChange.campaign_key == Campaign.id)
+            .where(DailyStatsChange.seq > since_seq)
+            .order_by(DailyStatsChange.seq)
+            .limit(limit)
+        )
+        return [ChangeRecord(**row._asdict()) for row in result]
+
+    def iter_changes(self, since_seq: int = 0, batch_size: int = 1000) -> Iterator[List[ChangeRecord]]:
+        """
+        Курсор по ленте изменений: отдает пакеты изменений после since_seq.
+        Потребитель сохраняет seq последней обработанной записи и передает его при следующем запуске.
+        """
+        while True:
+            batch = self.read_changes(since_seq, limit=batch_size)
+            if not batch:
+                return
+            yield batch
+            since_seq = batch[-1].seq
+
+    def compact(self, upto_seq: int) -> int:
+        """Удаляет прочитанные потребителями изменения с seq <= upto_seq."""
+        result = self.db.execute(delete(DailyStatsChange).where(DailyStatsChange.seq <= upto_seq))
+        self.db.commit()
+        logger.info(f"Удалено {result.rowcount} прочитанных записей outbox (seq <= {upto_seq}).")
+        return result.rowcount
 
 
 class LastUpdateTimeCRUD:
@@ -82,6 +623,10 @@ class LastUpdateTimeCRUD:
     def get_last_update_info(self, record_date: date) -> Optional[LastUpdateTime]:
         return self.db.query(LastUpdateTime).filter_by(date=record_date).first()
 
+    def get_data_version(self) -> Optional[datetime]:
+        """Возвращает время последнего обновления данных (максимальный last_updated_at)."""
+        return self.db.execute(select(func.max(LastUpdateTime.last_updated_at))).scalar()
+
     def set_last_update_info(self, record_date: date, is_complete: bool = False) -> LastUpdateTime:
         existing_info = self.get_last_update_info(record_date)
         if existing_info:
@@ -98,3 +643,220 @@ class LastUpdateTimeCRUD:
             self.db.refresh(new_info)
             logger.debug(f"Обновлено LastUpdateTime для {record_date}: complete={is_complete}")
             return new_info
+
+    def _claimable(self, owner: str, now: datetime, stale_before: Optional[datetime]):
+        """Условие: дата свободна (или аренда истекла / уже наша) и не была завершена после stale_before."""
+        conditions = [
+            or_(
+                LastUpdateTime.lease_owner.is_(None),
+                LastUpdateTime.lease_expires_at < now,
+                LastUpdateTime.lease_owner == owner
+            )
+        ]
+        if stale_before is not None:
+            conditions.append(
+                or_(
+                    LastUpdateTime.is_complete.is_not(True),
+                    LastUpdateTime.last_updated_at < stale_before
+                )
+            )
+        return and_(*conditions)
+
+    def _insert_placeholders(self, dates: List[date], now: datetime):
+        """Создает недостающие строки last_update_time, не трогая существующие."""
+        for chunk in _chunks(dates):
+            stmt = _dialect_insert(self.db, LastUpdateTime.__table__).values(
+                [{"date": d, "last_updated_at": now, "is_complete": False} for d in chunk]
+            )
+            if hasattr(stmt, "on_conflict_do_nothing"):
+                stmt = stmt.on_conflict_do_nothing(index_elements=["date"])
+            self.db.execute(stmt)
+
+    def ensure_dates(self, dates: Iterable[date]):
+        """
+        Создает строки last_update_time для дат, которых еще нет. Вызывается один раз
+        перед серией claim_dates(..., ensure_rows=False), чтобы каждая аренда
+        не вставляла заново строки для всех оставшихся дат.
+        """
+        dates = sorted(set(dates))
+        if not dates:
+            return
+        self._insert_placeholders(dates, datetime.utcnow())
+        self.db.commit()
+
+    def claim_dates(
+        self,
+        candidate_dates: Sequence[date],
+        owner: str,
+        lease_seconds: int = 300,
+        limit: Optional[int] = None,
+        stale_before: Optional[datetime] = None,
+        ensure_rows: bool = True
+    ) -> List[date]:
+        """
+        Атомарно арендует для воркера owner свободные даты из candidate_dates.
+        Даты, арендованные другими воркерами, пропускаются; даты, завершенные
+        другим воркером после stale_before, тоже. Возвращает список полученных дат.
+
+        В PostgreSQL используется SELECT ... FOR UPDATE SKIP LOCKED, в остальных
+        базах (SQLite) — условный UPDATE по каждой дате (compare-and-set).
+        При ensure_rows=False строки дат должны быть созданы заранее (ensure_dates).
+        """
+        candidate_dates = sorted(set(candidate_dates))
+        if not candidate_dates:
+            return []
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=lease_seconds)
+
+        if ensure_rows:
+            # Строка в last_update_time должна существовать, чтобы ее можно было заблокировать
+            self._insert_placeholders(candidate_dates, now)
+
+        claimed: List[date] = []
+        if self.db.get_bind().dialect.name == "postgresql":
+            for chunk in _chunks(candidate_dates):
+                remaining = None if limit is None else limit - len(claimed)
+                if remaining is not None and remaining <= 0:
+                    break
+                stmt = (
+                    select(LastUpdateTime.date)
+                    .where(LastUpdateTime.date.in_(chunk), self._claimable(owner, now, stale_before))
+                    .order_by(LastUpdateTime.date)
+                    .with_for_update(skip_locked=True)
+                )
+                if remaining is not None:
+                    stmt = stmt.limit(remaining)
+                locked = list(self.db.execute(stmt).scalars())
+                if locked:
+                    self.db.execute(
+                        update(LastUpdateTime)
+                        .where(LastUpdateTime.date.in_(locked))
+                        .values(lease_owner=owner, lease_expires_at=expires_at)
+                    )
+                    claimed.extend(locked)
+        else:
+            for candidate in candidate_dates:
+                if limit is not None and len(claimed) >= limit:
+                    break
+                result = self.db.execute(
+                    update(LastUpdateTime)
+                    .where(LastUpdateTime.date == candidate, self._claimable(owner, now, stale_before))
+                    .values(lease_owner=owner, lease_expires_at=expires_at)
+                )
+                if result.rowcount == 1:
+                    claimed.append(candidate)
+        self.db.commit()
+        logger.debug(f"Воркер {owner} арендовал даты: {[d.isoformat() for d in claimed]}")
+        return claimed
+
+    def heartbeat(self, claimed_dates: Sequence[date], owner: str, lease_seconds: int = 300) -> int:
+        """Продлевает аренду дат воркера owner. Возвращает количество продленных аренд."""
+        result = self.db.execute(
+            update(LastUpdateTime)
+            .where(LastUpdateTime.date.in_(list(claimed_dates)), LastUpdateTime.lease_owner == owner)
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        )
+        self.db.commit()
+        if result.rowcount != len(claimed_dates):
+            logger.warning(f"Воркер {owner} потерял аренду части дат ({result.rowcount} из {len(claimed_dates)}).")
+        return result.rowcount
+
+    def release_dates(self, claimed_dates: Sequence[date], owner: str, is_complete: bool = True) -> int:
+        """
+        Освобождает даты воркера owner. При is_complete=True даты отмечаются
+        как полностью загруженные.
+        """
+        values = {"lease_owner": None, "lease_expires_at": None}
+        if is_complete:
+            values.update(is_complete=True, last_updated_at=datetime.utcnow())
+        result = self.db.execute(
+            update(LastUpdateTime)
+            .where(LastUpdateTime.date.in_(list(claimed_dates)), LastUpdateTime.lease_owner == owner)
+            .values(**values)
+        )
+        self.db.commit()
+        logger.debug(f"Воркер {owner} освободил даты: {[d.isoformat() for d in claimed_dates]}, complete={is_complete}")
+        return result.rowcount
+
+    def set_recheck_intervals(self, intervals: Dict[date, float]) -> int:
+        """Сохраняет интервалы перепроверки дат, подобранные политикой свежести."""
+        if not intervals:
+            return 0
+        table = LastUpdateTime.__table__
+        result = self.db.execute(
+            update(table).where(table.c.date == bindparam("record_date")).values(recheck_seconds=bindparam("interval")),
+            [{"record_date": d, "interval": interval} for d, interval in intervals.items()]
+        )
+        self.db.commit()
+        logger.debug(f"Обновлены интервалы перепроверки для {len(intervals)} дат.")
+        return result.rowcount
+
+
+class ArchiveCRUD:
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def get_partitions(self) -> List[ArchivePartition]:
+        return list(self.db.execute(select(ArchivePartition).order_by(ArchivePartition.month)).scalars())
+
+    def get_archived_through(self) -> Optional[date]:
+        """Последняя перенесенная в архив дата: данные до нее включительно больше не синхронизируются."""
+        return _archived_through(self.db)
+
+    def get_dates_to_archive(self, before: date, limit: Optional[int] = None) -> List[date]:
+        """Даты раньше before, для которых в daily_stats или last_update_time еще остались строки."""
+        dates = set(self.db.execute(select(DailyStats.date).where(DailyStats.date < before).distinct()).scalars())
+        dates.update(self.db.execute(select(LastUpdateTime.date).where(LastUpdateTime.date < before)).scalars())
+        dates = sorted(dates)
+        return dates[:limit] if limit is not None else dates
+
+    def archive_date(self, record_date: date) -> int:
+        """
+        Переносит строки daily_stats за дату в архивную таблицу ее месяца, пересчитывает
+        помесячные итоги и удаляет строки даты из daily_stats и last_update_time.
+        Все выполняется одной короткой транзакцией, поэтому повторный запуск после
+        сбоя безопасен. Возвращает количество перенесенных строк.
+        """
+        month = month_start(record_date)
+        table = archive_table(month)
+        table.create(self.db.connection(), checkfirst=True)
+
+        source = DailyStats.__table__
+        columns = ["date", "campaign_key", "spend", "conversions", "cpa"]
+        stmt = _dialect_insert(self.db, table).from_select(
+            columns, select(*(source.c[name] for name in columns)).where(source.c.date == record_date)
+        )
+        if hasattr(stmt, "on_conflict_do_update"):
+            # Дата уже в архиве, а в daily_stats осталась строка после гонки записи с архивацией
+            # (до этого момента чтения ее не учитывают): новые значения важнее
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["date", "campaign_key"],
+                set_={"spend": stmt.excluded.spend, "conversions": stmt.excluded.conversions, "cpa": stmt.excluded.cpa}
+            )
+        self.db.execute(stmt)
+        moved = self.db.execute(delete(source).where(source.c.date == record_date)).rowcount
+        self.db.execute(delete(LastUpdateTime).where(LastUpdateTime.date == record_date))
+
+        monthly = DailyStatsMonthly.__table__
+        self.db.execute(delete(monthly).where(monthly.c.month == month))
+        self.db.execute(insert(monthly).from_select(
+            ["month", "campaign_key", "spend", "conversions", "days"],
+            select(
+                literal(month, Date),
+                table.c.campaign_key,
+                func.sum(table.c.spend),
+                func.sum(table.c.conversions),
+                func.count()
+            ).group_by(table.c.campaign_key)
+        ))
+
+        partition = self.db.get(ArchivePartition, month)
+        if partition is None:
+            partition = ArchivePartition(month=month, table_name=table.name, archived_through=record_date)
+            self.db.add(partition)
+        partition.archived_through = max(partition.archived_through, record_date)
+        partition.row_count = self.db.execute(select(func.count()).select_from(table)).scalar()
+        partition.updated_at = datetime.utcnow()
+        self.db.commit()
+        logger.debug(f"Дата {record_date.isoformat()} перенесена в {table.name}: {moved} строк.")
+        return moved
@@ -1,13 +1,20 @@
 import datetime
+import time
 from collections import defaultdict
-from typing import List, Optional
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Set
 import logging
 
 logger = logging.getLogger(__name__)
 
-from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.crud import ArchiveCRUD, ArchivedDateError, DailyStatsCRUD, LastUpdateTimeCRUD
 from app.api import ApiDataSource
-from app.data_models import SpendEntry, ConversionEntry, CombinedDailyStatData
+from app.dedup import RowDeduplicator
+from app.data_models import SpendEntry, ConversionEntry, CombinedDailyStatData, SyncRunStats
+from app.freshness import FixedIntervalPolicy, FreshnessPolicy
+from app.leases import LeaseKeeper
+from app.profiling import RunProfiler
+from app.writer import BatchedStatsWriter
 
 
 class DataLoader:
@@ -15,129 +22,347 @@ class DataLoader:
             self,
             api_data_source: ApiDataSource,
             db_crud: DailyStatsCRUD,
-            update_crud: LastUpdateTimeCRUD
+            update_crud: LastUpdateTimeCRUD,
+            lease_owner: Optional[str] = None,
+            lease_seconds: int = 300,
+            claim_batch_size: int = 1,
+            writer: Optional[BatchedStatsWriter] = None,
+            freshness_policy: Optional[FreshnessPolicy] = None,
+            dedup_exact_limit: int = 100000,
+            dedup_false_positive_rate: float = 0.001,
+            dedup_bloom_capacity: Optional[int] = None,
+            archive_crud: Optional[ArchiveCRUD] = None,
+            profiler: Optional[RunProfiler] = None,
+            lease_keeper: Optional[LeaseKeeper] = None
     ):
+        """
+        Args:
+            lease_owner: ID воркера. Если задан, даты обрабатываются только после их аренды
+                в LastUpdateTime, что позволяет запускать несколько экземпляров на одной базе.
+            lease_seconds: Срок аренды даты; продлевается во время обработки.
+            claim_batch_size: Сколько дат арендовать за один раз.
+            writer: Фоновый писатель. Если задан, строки и отметки о завершении
+                передаются ему, а загрузчик не ждет коммитов базы данных.
+            freshness_policy: Политика свежести, решающая, какие даты загружать заново.
+                По умолчанию — обновление раз в 24 часа (FixedIntervalPolicy).
+            dedup_exact_limit: До скольких уникальных строк дубли фидов ищутся точным
+                множеством; после этого — фильтром Блума с проверкой на диске.
+            dedup_false_positive_rate: Доля ложных срабатываний фильтра Блума.
+            dedup_bloom_capacity: Ожидаемое число уникальных строк: размер первой ступени
+                фильтра Блума (по умолчанию выводится из dedup_exact_limit).
+            archive_crud: Если задан, даты, уже перенесенные в архив (run.py maintain),
+                не загружаются.
+            profiler: Профилировщик прогона (run.py --profile); получает границы этапов.
+            lease_keeper: Продление аренды по таймеру в отдельном потоке. Нужен вместе
+                с writer: аренда держится, пока писатель не применит отметку о завершении.
+                Без него аренда продлевается только между датами одной аренды.
+        """
         self.api_data_source = api_data_source
         self.db_crud = db_crud
         self.update_crud = update_crud
+        self.lease_owner = lease_owner
+        self.lease_seconds = lease_seconds
+        self.claim_batch_size = claim_batch_size
+        self.writer = writer
+        self.freshness_policy = freshness_policy or FixedIntervalPolicy()
+        self.dedup_exact_limit = dedup_exact_limit
+        self.dedup_false_positive_rate = dedup_false_positive_rate
+        self.dedup_bloom_capacity = dedup_bloom_capacity
+        self.archive_crud = archive_crud
+        self.profiler = profiler
+        self.lease_keeper = lease_keeper
+        self.stats = SyncRunStats()
 
-    def _should_fetch_data(self, record_date: datetime.date) -> bool:
+    def _should_fetch_data(self, record_date: datetime.date, last_update=None) -> bool:
         """
         Проверяет, нужно ли загружать данные для определенной даты,
-        учитывая стратегию "обновления 1 раз в день" и полноту данных.
+        согласно политике свежести и полноте данных.
         """
-        last_update = self.update_crud.get_last_update_info(record_date)
-        current_utc_time = datetime.datetime.now()
+        if last_update is None:
+            last_update = self.update_crud.get_last_update_info(record_date)
 
         if not last_update:
             logger.info(f"Данных для {record_date.isoformat()} еще нет в системе. Загружаем.")
             return True
 
-        # Если данные неполны или последнее обновление было более 24 часов назад
-        if not last_update.is_complete or \
-                (current_utc_time - last_update.last_updated_at).total_seconds() > (24 * 3600):
+        if self.freshness_policy.should_fetch(record_date, last_update):
             logger.info(
-                f"Данные для {record_date.isoformat()} неполны или устаревшие (последнее обновление: {last_update.last_updated_at.isoformat()}). Загружаем.")
+                f"Данные для {record_date.isoformat()} неполны или требуют перепроверки (последнее обновление: {last_update.last_updated_at.isoformat()}). Загружаем.")
             return True
 
         logger.info(
             f"Данные для {record_date.isoformat()} полны и актуальны (обновлено {last_update.last_updated_at.isoformat()}). Пропускаем.")
         return False
 
+    def _find_changed_dates(
+            self,
+            processed_data: List[CombinedDailyStatData],
+            rechecked_dates: List[datetime.date]
+    ) -> Set[datetime.date]:
+        """Возвращает повторно загруженные даты, данные которых отличаются от сохраненных."""
+        if not rechecked_dates:
+            return set()
+        rechecked = set(rechecked_dates)
+        snapshot = self.db_crud.get_daily_values(rechecked)
+        changed = set()
+        for data_item in processed_data:
+            if data_item.date in rechecked and data_item.date not in changed and \
+                    snapshot.get((data_item.date, data_item.campaign_id)) != \
+                    (data_item.spend, data_item.conversions, data_item.cpa):
+                changed.add(data_item.date)
+        return changed
+
+    @contextmanager
+    def _stage(self, name: str):
+        """Замеряет длительность этапа прогона и накапливает ее в self.stats.stage_seconds."""
+        if self.profiler:
+            self.profiler.on_stage_start(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if self.profiler:
+                self.profiler.on_stage_end(name)
+            self.stats.stage_seconds[name] = self.stats.stage_seconds.get(name, 0.0) + elapsed
+            logger.debug(f"Этап {name}: {elapsed:.3f} с")
+
+    def _save_processed_data(self, processed_data: List[CombinedDailyStatData]):
+        if self.writer:
+            for data_item in processed_data:
+                self.writer.put(data_item)
+            return
+
+        # Новые кампании регистрируются одним пакетом, дальше ключи берутся из кэша
+        self.db_crud.resolve_campaign_keys({data_item.campaign_id for data_item in processed_data})
+        for data_item in processed_data:
+            try:
+                self.db_crud.upsert_daily_stat(
+                    record_date=data_item.date,
+                    campaign_id=data_item.campaign_id,
+                    spend=data_item.spend,
+                    conversions=data_item.conversions,
+                    cpa=data_item.cpa
+                )
+            except ArchivedDateError as e:
+                # maintain перенес дату в архив уже после планирования прогона
+                logger.warning(f"{e} Строка кампании {data_item.campaign_id} пропущена.")
+
+    def _save_with_leases(
+            self,
+            processed_data: List[CombinedDailyStatData],
+            dates_to_process: List[datetime.date],
+            run_started_at: datetime.datetime,
+            recheck_seconds: Dict[datetime.date, float]
+    ):
+        """
+        Сохраняет данные по датам, предварительно арендуя их, чтобы параллельные
+        воркеры не обрабатывали одни и те же даты.
+        """
+        data_by_date: Dict[datetime.date, List[CombinedDailyStatData]] = defaultdict(list)
+        for data_item in processed_data:
+            data_by_date[data_item.date].append(data_item)
+
+        remaining = list(dates_to_process)
+        # Строки дат создаются один раз, а не при каждой аренде очередной порции
+        self.update_crud.ensure_dates(remaining)
+        while remaining:
+            claimed = self.update_crud.claim_dates(
+                remaining,
+                self.lease_owner,
+                lease_seconds=self.lease_seconds,
+                limit=self.claim_batch_size,
+                stale_before=run_started_at,
+                ensure_rows=False
+            )
+            if not claimed:
+                break
+            logger.info(f"Воркер {self.lease_owner} арендовал даты: {[d.isoformat() for d in claimed]}")
+
+            if self.lease_keeper:
+                self.lease_keeper.hold(claimed)
+            last_heartbeat = time.monotonic()
+            for claimed_date in claimed:
+                if not self.lease_keeper and time.monotonic() - last_heartbeat > self.lease_seconds / 3:
+                    self.update_crud.heartbeat(claimed, self.lease_owner, lease_seconds=self.lease_seconds)
+                    last_heartbeat = time.monotonic()
+                self._save_processed_data(data_by_date.get(claimed_date, []))
+
+            claimed_intervals = {d: recheck_seconds[d] for d in claimed if d in recheck_seconds}
+            if self.writer:
+                # Аренда продлевается, пока писатель не дойдет до отметки и не освободит даты
+                self.writer.mark_complete(
+                    claimed,
+                    lease_owner=self.lease_owner,
+                    recheck_seconds=claimed_intervals,
+                    on_release=self.lease_keeper.release if self.lease_keeper else None
+                )
+            else:
+                if self.lease_keeper:
+                    self.lease_keeper.release(claimed)
+                self.update_crud.release_dates(claimed, self.lease_owner, is_complete=True)
+                if claimed_intervals:
+                    self.update_crud.set_recheck_intervals(claimed_intervals)
+            claimed_set = set(claimed)
+            remaining = [d for d in remaining if d not in claimed_set]
+
+        if remaining:
+            logger.info(
+                f"Даты {[d.isoformat() for d in remaining]} обрабатываются другими воркерами или уже обработаны. Пропускаем.")
+
     def process_daily_stats(
             self,
             start_date: Optional[datetime.date] = None,
             end_date: Optional[datetime.date] = None
-    ):
+    ) -> SyncRunStats:
+        """
+        Загружает, агрегирует и сохраняет данные. Возвращает статистику прогона
+        (она же доступна как self.stats).
+        """
+        self.stats = SyncRunStats()
+        run_started_at = datetime.datetime.utcnow()
         logger.info("Загрузка сырых данных о расходах по API Data Source...")
-        spend_data: List[SpendEntry] = self.api_data_source.fetch_fb_spend_data()
+        with self._stage("fetch_spend"):
+            spend_data: List[SpendEntry] = self.api_data_source.fetch_fb_spend_data()
         logger.info("Загрузка сырых данных о конверсиях с API Data Source...")
-        conversions_data: List[ConversionEntry] = self.api_data_source.fetch_network_conversions_data()
+        with self._stage("fetch_conversions"):
+            conversions_data: List[ConversionEntry] = self.api_data_source.fetch_network_conversions_data()
+        self.stats.spend_rows_fetched = len(spend_data)
+        self.stats.conversion_rows_fetched = len(conversions_data)
 
         if not spend_data and not conversions_data:
             logger.warning("Не получены данные ни из источника затрат, ни из источника конверсий. Пропускаем обработку.")
-            return
+            return self.stats
 
         combined_raw_data = defaultdict(lambda: {"spend": 0.0, "conversions": 0})
 
-        # Собираем все уникальные даты из полученных данных
-        all_dates_in_data = set()
-        for entry in spend_data:
-            all_dates_in_data.add(datetime.date.fromisoformat(entry.date))
-        for entry in conversions_data:
-            all_dates_in_data.add(datetime.date.fromisoformat(entry.date))
-
-        # Определяем, какие даты требуют обработки на основе фильтров и стратегии обновления
-        dates_to_process = []
-        for current_date in sorted(list(all_dates_in_data)):  # Сортируем для консистентности
-            # Фильтруем по аргументам командной строки
-            if (start_date and current_date < start_date) or \
-                    (end_date and current_date > end_date):
-                logger.debug(f"Дата {current_date.isoformat()} выходит за указанный диапазон. Пропускаем.")
-                continue
-
-            # Фильтруем по стратегии "1 раз в день"
-            if self._should_fetch_data(current_date):
-                dates_to_process.append(current_date)
+        with self._stage("plan"):
+            # Собираем все уникальные даты из полученных данных
+            all_dates_in_data = set()
+            for entry in spend_data:
+                all_dates_in_data.add(datetime.date.fromisoformat(entry.date))
+            for entry in conversions_data:
+                all_dates_in_data.add(datetime.date.fromisoformat(entry.date))
+
+            # Определяем, какие даты требуют обработки на основе фильтров и политики свежести
+            dates_to_process = []
+            rechecked_dates = []
+            last_updates = {}
+            archived_through = self.archive_crud.get_archived_through() if self.archive_crud else None
+            for current_date in sorted(list(all_dates_in_data)):  # Сортируем для консистентности
+                # Фильтруем по аргументам командной строки
+                if (start_date and current_date < start_date) or \
+                        (end_date and current_date > end_date):
+                    logger.debug(f"Дата {current_date.isoformat()} выходит за указанный диапазон. Пропускаем.")
+                    continue
+
+                # Архивные даты неизменяемы: их строк больше нет в daily_stats и last_update_time
+                if archived_through and current_date <= archived_through:
+                    logger.debug(f"Дата {current_date.isoformat()} уже перенесена в архив. Пропускаем.")
+                    self.stats.dates_skipped += 1
+                    continue
+
+                last_update = self.update_crud.get_last_update_info(current_date)
+                last_updates[current_date] = last_update
+                if self._should_fetch_data(current_date, last_update):
+                    dates_to_process.append(current_date)
+                    if last_update and last_update.is_complete:
+                        rechecked_dates.append(current_date)
+                else:
+                    self.stats.dates_skipped += 1
+            self.stats.dates_rechecked = len(rechecked_dates)
 
         if not dates_to_process:
             logger.info("Нет новых или устаревших данных для обработки в указанном диапазоне.")
-            return
+            return self.stats
 
         logger.info(f"Будут обработаны данные для следующих дат: {[d.isoformat() for d in dates_to_process]}")
 
-        # Агрегация данных из обоих источников, но только для дат, которые мы решили обрабатывать
-        for entry in spend_data:
-            entry_date = datetime.date.fromisoformat(entry.date)
-            if entry_date in dates_to_process:
-                key = (entry.date, entry.campaign_id)
-                combined_raw_data[key]["spend"] += entry.spend
-
-        for entry in conversions_data:
-            entry_date = datetime.date.fromisoformat(entry.date)
-            if entry_date in dates_to_process:
-                key = (entry.date, entry.campaign_id)
-                combined_raw_data[key]["conversions"] += entry.conversions
-
-        processed_data: List[CombinedDailyStatData] = []
-        # Конвертируем агрегированные данные в CombinedDailyStatData
-        for (date_str, campaign_id), values in combined_raw_data.items():
-            record_date = datetime.date.fromisoformat(date_str)
-
-            # Ця перевірка по суті повторна, але гарантує, що ми додаємо лише ті, що були обрані
-            # if record_date not in dates_to_process:
-            #     continue
-
-            spend = values["spend"]
-            conversions = values["conversions"]
-            cpa = spend / conversions if conversions > 0 else None
-
-            processed_data.append(
-                CombinedDailyStatData(
-                    date=record_date,
-                    campaign_id=campaign_id,
-                    spend=spend,
-                    conversions=conversions,
-                    cpa=cpa
+        with self._stage("aggregate"):
+            # Агрегация данных из обоих источников, но только для дат, которые мы решили обрабатывать.
+            # Проверка по множеству ISO-строк: без разбора даты и линейного поиска на каждую запись
+            # Повторы строк (в том числе между страницами фида) отбрасываются, чтобы не завышать суммы
+            wanted_dates = {d.isoformat() for d in dates_to_process}
+            with RowDeduplicator(
+                    self.dedup_exact_limit,
+                    self.dedup_false_positive_rate,
+                    bloom_capacity=self.dedup_bloom_capacity
+            ) as deduplicator:
+                for entry in spend_data:
+                    if entry.date in wanted_dates and not deduplicator.is_duplicate("fb_spend", entry):
+                        key = (entry.date, entry.campaign_id)
+                        combined_raw_data[key]["spend"] += entry.spend
+
+                for entry in conversions_data:
+                    if entry.date in wanted_dates and not deduplicator.is_duplicate("network_conv", entry):
+                        key = (entry.date, entry.campaign_id)
+                        combined_raw_data[key]["conversions"] += entry.conversions
+            self.stats.duplicate_rows = deduplicator.duplicate_counts()
+            for source, counts in self.stats.duplicate_rows.items():
+                logger.warning(
+                    f"Отброшено {sum(counts.values())} повторных строк фида {source}: "
+                    f"{', '.join(f'{d}: {n}' for d, n in counts.items())}")
+
+            processed_data: List[CombinedDailyStatData] = []
+            # Конвертируем агрегированные данные в CombinedDailyStatData
+            for (date_str, campaign_id), values in combined_raw_data.items():
+                record_date = datetime.date.fromisoformat(date_str)
+
+                # Ця перевірка по суті повторна, але гарантує, що ми додаємо лише ті, що були обрані
+                # if record_date not in dates_to_process:
+                #     continue
+
+                spend = values["spend"]
+                conversions = values["conversions"]
+                cpa = spend / conversions if conversions > 0 else None
+
+                processed_data.append(
+                    CombinedDailyStatData(
+                        date=record_date,
+                        campaign_id=campaign_id,
+                        spend=spend,
+                        conversions=conversions,
+                        cpa=cpa
+                    )
                 )
-            )
 
         if not processed_data:
             logger.info("После фильтрации не осталось данных для сохранения.")
-            return
+            return self.stats
 
+        with self._stage("diff"):
+            # Сравнение с сохраненными данными: по нему политика подбирает интервалы перепроверки
+            changed_dates = self._find_changed_dates(processed_data, rechecked_dates)
+            recheck_seconds = {}
+            for processed_date in dates_to_process:
+                interval = self.freshness_policy.next_recheck_seconds(
+                    processed_date,
+                    last_updates.get(processed_date),
+                    changed=processed_date in changed_dates
+                )
+                if interval is not None:
+                    recheck_seconds[processed_date] = interval
+
+        self.stats.dates_processed = len(dates_to_process)
+        self.stats.dates_changed = len(changed_dates)
+        self.stats.rows_processed = len(processed_data)
         logger.info(f"Сохранение {len(processed_data)} обработанных записей в базу данных...")
-        for data_item in processed_data:
-            self.db_crud.upsert_daily_stat(
-                record_date=data_item.date,
-                campaign_id=data_item.campaign_id,
-                spend=data_item.spend,
-                conversions=data_item.conversions,
-                cpa=data_item.cpa
-            )
+        with self._stage("save"):
+            if self.lease_owner:
+                self._save_with_leases(processed_data, dates_to_process, run_started_at, recheck_seconds)
+            else:
+                self._save_processed_data(processed_data)
 
-        # Обновляем LastUpdateTime
-        for processed_date in dates_to_process:
-            self.update_crud.set_last_update_info(processed_date, is_complete=True)
+                # Обновляем LastUpdateTime
+                if self.writer:
+                    self.writer.mark_complete(dates_to_process, recheck_seconds=recheck_seconds)
+                else:
+                    for processed_date in dates_to_process:
+                        self.update_crud.set_last_update_info(processed_date, is_complete=True)
+                    if recheck_seconds:
+                        self.update_crud.set_recheck_intervals(recheck_seconds)
 
-        logger.info("Загрузка данных завершена.")
+        logger.info(
+            f"Загрузка данных завершена. Дат пропущено: {self.stats.dates_skipped}, "
+            f"перепроверено: {self.stats.dates_rechecked}, изменилось: {self.stats.dates_changed}.")
+        return self.stats
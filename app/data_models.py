@@ -1,6 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import date
-from typing import Optional
+from typing import Dict, Optional
 
 
 @dataclass
@@ -9,6 +9,7 @@ class SpendEntry:
     date: str
     campaign_id: str
     spend: float
+    row_id: Optional[str] = None  # ID строки в upstream, если фид его передает
 
 @dataclass
 class ConversionEntry:
@@ -16,6 +17,7 @@ class ConversionEntry:
     date: str
     campaign_id: str
     conversions: int
+    row_id: Optional[str] = None  # ID строки в upstream, если фид его передает
 
 @dataclass
 class CombinedDailyStatData:
@@ -24,4 +26,45 @@ class CombinedDailyStatData:
     campaign_id: str
     spend: float
     conversions: int
-    cpa: Optional[float] = None
\ No newline at end of file
+    cpa: Optional[float] = None
+
+@dataclass
+class ChangeRecord:
+    """Представляет изменение строки DailyStats в ленте изменений (outbox)."""
+    seq: int
+    date: date
+    campaign_id: str
+    old_spend: Optional[float]
+    new_spend: float
+    old_conversions: Optional[int]
+    new_conversions: int
+    old_cpa: Optional[float]
+    new_cpa: Optional[float]
+
+
+@dataclass
+class SyncRunStats:
+    """Статистика одного прогона синхронизации: длительность этапов и объемы данных."""
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    spend_rows_fetched: int = 0
+    conversion_rows_fetched: int = 0
+    dates_processed: int = 0
+    # Решения политики свежести: пропущенные даты, повторно загруженные и из них изменившиеся
+    dates_skipped: int = 0
+    dates_rechecked: int = 0
+    dates_changed: int = 0
+    rows_processed: int = 0
+    # Отброшенные повторные строки фидов: {источник: {дата: количество}}
+    duplicate_rows: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    rows_written: int = 0
+    write_seconds: float = 0.0
+
+
+@dataclass
+class MaintenanceStats:
+    """Статистика запуска обслуживания базы (архивация, VACUUM, ANALYZE)."""
+    stage_seconds: Dict[str, float] = field(default_factory=dict)
+    days_archived: int = 0
+    rows_archived: int = 0
+    archived_through: Optional[date] = None
+    pages_freed: int = 0
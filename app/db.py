@@ -1,6 +1,9 @@
+import threading
 from contextlib import contextmanager
+from typing import Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, Session
 
 from app.models import Base
@@ -18,7 +21,16 @@ class Database:
         self.engine = create_engine(
             self.database_url, connect_args={"check_same_thread": False}
         )
+        if self.engine.dialect.name == "sqlite":
+            @event.listens_for(self.engine, "connect")
+            def _set_incremental_vacuum(dbapi_connection, connection_record):
+                # Действует только для новой (пустой) базы; см. DailyStatsArchiver.vacuum
+                dbapi_connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self._read_only_engine: Optional[Engine] = None
+        self._read_only_session_factory: Optional[sessionmaker] = None
+        # get_read_only_engine вызывается из потоков HTTP-сервера
+        self._read_only_lock = threading.Lock()
 
     @contextmanager
     def get_db(self) -> Session:
@@ -32,4 +44,43 @@ class Database:
         finally:
             db.close()
 
+    def get_read_only_engine(self, pool_size: int = 5) -> Engine:
+        """
+        Возвращает (и при первом вызове создает) пул соединений только для чтения.
+        Для SQLite соединения открываются с PRAGMA query_only, для PostgreSQL —
+        в режиме READ ONLY транзакций. Потокобезопасен: пул создается один раз.
+        """
+        if self._read_only_engine is not None:
+            return self._read_only_engine
+        with self._read_only_lock:
+            if self._read_only_engine is not None:
+                return self._read_only_engine
+            engine = create_engine(
+                self.database_url,
+                connect_args={"check_same_thread": False} if self.database_url.startswith("sqlite") else {},
+                pool_size=pool_size
+            )
+            if engine.dialect.name == "sqlite":
+                @event.listens_for(engine, "connect")
+                def _set_query_only(dbapi_connection, connection_record):
+                    dbapi_connection.execute("PRAGMA query_only = ON")
+            elif engine.dialect.name == "postgresql":
+                engine = engine.execution_options(postgresql_readonly=True)
+            # Фабрика сессий публикуется раньше движка: проверка без блокировки смотрит на движок
+            self._read_only_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            self._read_only_engine = engine
+            return engine
+
+    @contextmanager
+    def get_read_only_db(self) -> Session:
+        """
+        Аналог get_db() для сессий поверх пула только для чтения.
+        """
+        self.get_read_only_engine()
+        db = self._read_only_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
 database = Database()
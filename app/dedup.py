@@ -0,0 +1,220 @@
+import hashlib
+import math
+import os
+import sqlite3
+import tempfile
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+from app.data_models import ConversionEntry, SpendEntry
+
+Entry = Union[SpendEntry, ConversionEntry]
+
+# Сколько подозрительных на дубль отпечатков копить в памяти перед записью на диск
+_SPILL_BATCH_SIZE = 10000
+
+# Бит в 64-битном слове для каждого значения байта отпечатка (по младшим 6 битам)
+_WORD_BITS = tuple(1 << (value & 63) for value in range(256))
+
+# Во сколько раз каждая следующая ступень фильтра Блума больше предыдущей
+_BLOOM_GROWTH = 4
+
+
+def row_fingerprint(source: str, entry: Entry) -> bytes:
+    """
+    Отпечаток строки фида: по row_id из upstream, если он есть, иначе по содержимому строки.
+    Источник входит в отпечаток, чтобы одинаковые строки разных фидов не считались дублями.
+    """
+    if entry.row_id is not None:
+        key = f"{source}\x1fid\x1f{entry.row_id}"
+    else:
+        value = entry.spend if isinstance(entry, SpendEntry) else entry.conversions
+        key = f"{source}\x1f{entry.date}\x1f{entry.campaign_id}\x1f{value!r}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float = 0.001):
+        """
+        Блочный фильтр Блума на capacity элементов с заданной долей ложных срабатываний.
+        Все биты элемента лежат в одном 64-битном слове: проверка и вставка — одна
+        операция над словом вместо hash_count обращений к битовому массиву.
+        Элементы — 16-байтовые отпечатки: первые 4 байта выбирают слово, каждый
+        из следующих hash_count байт — один бит в нем.
+        """
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate должен быть в интервале (0, 1)")
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.count = 0
+        bits = -capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        # Биты внутри слова распределены неравномерно; запас в 2 раза возвращает
+        # долю ложных срабатываний к заданной
+        self.word_count = max(1, int(math.ceil(bits * 2 / 64)))
+        self.hash_count = min(10, max(1, round(bits / capacity * math.log(2))))
+        self._words = array("Q", bytes(8 * self.word_count))
+
+    def _locate(self, fingerprint: bytes) -> Tuple[int, int]:
+        index = int.from_bytes(fingerprint[:4], "little") % self.word_count
+        mask = 0
+        for value in fingerprint[4:4 + self.hash_count]:
+            mask |= _WORD_BITS[value]
+        return index, mask
+
+    def add(self, fingerprint: bytes) -> bool:
+        """Добавляет отпечаток. Возвращает True, если он, возможно, уже был в фильтре."""
+        index, mask = self._locate(fingerprint)
+        word = self._words[index]
+        if word & mask == mask:
+            return True
+        self._words[index] = word | mask
+        self.count += 1
+        return False
+
+    def __contains__(self, fingerprint: bytes) -> bool:
+        index, mask = self._locate(fingerprint)
+        return self._words[index] & mask == mask
+
+    @property
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.word_count * 8
+
+
+class RowDeduplicator:
+    def __init__(
+            self,
+            exact_limit: int = 100000,
+            false_positive_rate: float = 0.001,
+            bloom_capacity: Optional[int] = None,
+            spill_dir: Optional[str] = None
+    ):
+        """
+        Отбрасывает повторные строки фидов и считает дубли по источникам и датам.
+
+        Пока уникальных строк не больше exact_limit, отпечатки хранятся в множестве.
+        Дальше они переносятся в фильтр Блума (несколько бит на строку вместо
+        ~80 байт в множестве), а при срабатывании фильтра дубль подтверждается по
+        точному хранилищу отпечатков во временной базе SQLite на диске, так что
+        ложные срабатывания не приводят к потере строк.
+
+        Фильтр растет ступенями: когда ступень заполнена, добавляется новая,
+        в _BLOOM_GROWTH раз больше и с вдвое меньшей долей ложных срабатываний,
+        так что суммарная доля остается в пределах false_positive_rate, а память —
+        пропорциональной фактическому числу строк.
+
+        Args:
+            exact_limit: Порог переключения с точного множества на фильтр Блума.
+            false_positive_rate: Доля ложных срабатываний фильтра (обращений к диску).
+            bloom_capacity: Ожидаемое количество уникальных строк: размер первой ступени
+                фильтра. По умолчанию — _BLOOM_GROWTH * exact_limit.
+            spill_dir: Каталог временной базы отпечатков (по умолчанию системный temp).
+        """
+        self.exact_limit = exact_limit
+        self.false_positive_rate = false_positive_rate
+        self.bloom_capacity = bloom_capacity
+        self.spill_dir = spill_dir
+        self._exact: Optional[Set[bytes]] = set()
+        self._blooms: List[BloomFilter] = []
+        self._pending: Set[bytes] = set()
+        self._spill: Optional[sqlite3.Connection] = None
+        self._spill_path: Optional[str] = None
+        self.duplicates: Dict[str, Counter] = defaultdict(Counter)
+        self.false_positives = 0
+
+    def __enter__(self) -> "RowDeduplicator":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def uses_bloom_filter(self) -> bool:
+        return bool(self._blooms)
+
+    @property
+    def bloom_memory_bytes(self) -> int:
+        return sum(bloom.memory_bytes for bloom in self._blooms)
+
+    def _add_bloom_stage(self, capacity: int):
+        # Доли ступеней fp/2, fp/4, ... в сумме не превышают false_positive_rate
+        stage_rate = self.false_positive_rate / 2 ** (len(self._blooms) + 1)
+        self._blooms.append(BloomFilter(capacity, stage_rate))
+        logger.debug(f"Фильтр Блума: ступень {len(self._blooms)} на {capacity} строк, "
+                     f"всего {self.bloom_memory_bytes / 2 ** 20:.1f} МБ.")
+
+    def is_duplicate(self, source: str, entry: Entry) -> bool:
+        """Возвращает True, если такая строка источника уже встречалась; иначе запоминает ее."""
+        fingerprint = row_fingerprint(source, entry)
+        if self._exact is not None:
+            seen = fingerprint in self._exact
+            if not seen:
+                self._exact.add(fingerprint)
+                if len(self._exact) > self.exact_limit:
+                    self._switch_to_bloom_filter()
+        else:
+            seen = self._seen_in_bloom_filter(fingerprint)
+        if seen:
+            self.duplicates[source][entry.date] += 1
+        return seen
+
+    def duplicate_counts(self) -> Dict[str, Dict[str, int]]:
+        """Количество отброшенных дублей: {источник: {дата: количество}}."""
+        return {source: dict(sorted(counts.items())) for source, counts in self.duplicates.items()}
+
+    def _switch_to_bloom_filter(self):
+        logger.info(
+            f"Уникальных строк больше {self.exact_limit}: дедупликация переключается на фильтр Блума "
+            f"(вероятность ложного срабатывания {self.false_positive_rate}).")
+        self._add_bloom_stage(max(self.bloom_capacity or _BLOOM_GROWTH * self.exact_limit, len(self._exact)))
+        fd, self._spill_path = tempfile.mkstemp(prefix="dedup-", suffix=".sqlite3", dir=self.spill_dir)
+        os.close(fd)
+        self._spill = sqlite3.connect(self._spill_path)
+        self._spill.execute("PRAGMA journal_mode=OFF")
+        self._spill.execute("PRAGMA synchronous=OFF")
+        self._spill.execute("PRAGMA cache_size=-16384")  # 16 МБ страниц индекса отпечатков
+        self._spill.execute("CREATE TABLE seen (fingerprint BLOB PRIMARY KEY) WITHOUT ROWID")
+        for fingerprint in self._exact:
+            self._blooms[-1].add(fingerprint)
+        self._pending = self._exact
+        self._exact = None
+        self._flush_pending()
+
+    def _seen_in_bloom_filter(self, fingerprint: bytes) -> bool:
+        current = self._blooms[-1]
+        # Проверка и вставка в текущую ступень — одна операция; прежние ступени только проверяются
+        if current.add(fingerprint) or any(fingerprint in bloom for bloom in self._blooms[:-1]):
+            # Фильтр мог ошибиться: подтверждаем дубль по точному хранилищу
+            if fingerprint in self._pending or self._spill.execute(
+                    "SELECT 1 FROM seen WHERE fingerprint = ?", (fingerprint,)).fetchone():
+                return True
+            self.false_positives += 1
+        if current.is_full:
+            self._add_bloom_stage(current.capacity * _BLOOM_GROWTH)
+        self._pending.add(fingerprint)
+        if len(self._pending) >= _SPILL_BATCH_SIZE:
+            self._flush_pending()
+        return False
+
+    def _flush_pending(self):
+        # Сортировка ускоряет вставку в B-дерево первичного ключа
+        self._spill.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((fp,) for fp in sorted(self._pending)))
+        self._spill.commit()
+        self._pending = set()
+
+    def close(self):
+        """Удаляет временную базу отпечатков."""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self._spill_path is not None:
+            os.remove(self._spill_path)
+            self._spill_path = None
@@ -0,0 +1,99 @@
+import csv
+import datetime
+import gzip
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from typing import IO, Iterator, Optional, Sequence
+
+from app.crud import DailyStatsCRUD
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("csv", "ndjson")
+EXPORT_COLUMNS = ("date", "campaign_id", "spend", "conversions", "cpa")
+
+
+class DailyStatsExporter:
+    def __init__(self, db_crud: DailyStatsCRUD, batch_size: int = 1000):
+        """
+        Выгружает daily_stats в файл потоково, строка за строкой.
+
+        Args:
+            db_crud: CRUD для чтения DailyStats.
+            batch_size: Количество строк, забираемых из курсора за один раз.
+        """
+        self.db_crud = db_crud
+        self.batch_size = batch_size
+
+    @contextmanager
+    def _open_output(self, output_path: str, compress: bool) -> Iterator[IO[str]]:
+        """
+        Открывает файл для записи (или stdout для "-"), при необходимости через gzip.
+        """
+        if output_path == "-":
+            if compress:
+                with gzip.open(sys.stdout.buffer, "wt", encoding="utf-8", newline="") as stream:
+                    yield stream
+            else:
+                yield sys.stdout
+            return
+
+        if compress:
+            with gzip.open(output_path, "wt", encoding="utf-8", newline="") as stream:
+                yield stream
+        else:
+            with open(output_path, "w", encoding="utf-8", newline="") as stream:
+                yield stream
+
+    def export(
+        self,
+        output_path: str,
+        fmt: str = "csv",
+        start_date: Optional[datetime.date] = None,
+        end_date: Optional[datetime.date] = None,
+        campaign_ids: Optional[Sequence[str]] = None,
+        compress: bool = False
+    ) -> int:
+        """
+        Записывает строки daily_stats в output_path в формате fmt.
+        Возвращает количество выгруженных строк.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат экспорта: {fmt}. Доступны: {', '.join(EXPORT_FORMATS)}")
+
+        rows = self.db_crud.iter_daily_stats_rows(
+            start_date=start_date,
+            end_date=end_date,
+            campaign_ids=campaign_ids,
+            batch_size=self.batch_size
+        )
+
+        started = time.perf_counter()
+        count = 0
+        with self._open_output(output_path, compress) as stream:
+            if fmt == "csv":
+                writer = csv.writer(stream)
+                writer.writerow(EXPORT_COLUMNS)
+                for row in rows:
+                    writer.writerow((row.date.isoformat(), row.campaign_id, row.spend, row.conversions,
+                                     "" if row.cpa is None else row.cpa))
+                    count += 1
+            else:
+                for row in rows:
+                    stream.write(json.dumps({
+                        "date": row.date.isoformat(),
+                        "campaign_id": row.campaign_id,
+                        "spend": row.spend,
+                        "conversions": row.conversions,
+                        "cpa": row.cpa
+                    }, separators=(",", ":")))
+                    stream.write("\n")
+                    count += 1
+
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else float(count)
+        logger.info(f"Экспортировано {count} строк в {output_path} ({fmt}) за {elapsed:.2f} с ({rate:.0f} строк/с).")
+        return count
@@ -0,0 +1,111 @@
+import datetime
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from app.models import LastUpdateTime
+
+Clock = Callable[[], datetime.datetime]
+
+
+class FreshnessPolicy(ABC):
+    """
+    Политика свежести: решает, нужно ли заново загружать дату, и сколько ждать
+    до следующей перепроверки. Часы передаются явно, чтобы политику можно было
+    тестировать с фейковым временем.
+    """
+
+    def __init__(self, clock: Clock = datetime.datetime.utcnow):
+        self.clock = clock
+
+    @abstractmethod
+    def should_fetch(self, record_date: datetime.date, last_update: Optional[LastUpdateTime]) -> bool:
+        """Нужно ли загрузить дату заново (last_update — None, если дата еще не загружалась)."""
+
+    def next_recheck_seconds(
+            self,
+            record_date: datetime.date,
+            last_update: Optional[LastUpdateTime],
+            changed: bool
+    ) -> Optional[float]:
+        """
+        Интервал до следующей перепроверки даты после ее загрузки.
+        changed — изменились ли данные при этой загрузке. None — интервал не хранится.
+        """
+        return None
+
+
+class FixedIntervalPolicy(FreshnessPolicy):
+    def __init__(self, max_age_seconds: float = 24 * 3600, clock: Clock = datetime.datetime.utcnow):
+        """
+        Стратегия "обновления 1 раз в день": дата загружается заново, если она
+        неполна или последнее обновление было более max_age_seconds назад.
+        Часы — UTC, как и last_updated_at в базе.
+        """
+        super().__init__(clock)
+        self.max_age_seconds = max_age_seconds
+
+    def should_fetch(self, record_date: datetime.date, last_update: Optional[LastUpdateTime]) -> bool:
+        if not last_update or not last_update.is_complete:
+            return True
+        return (self.clock() - last_update.last_updated_at).total_seconds() > self.max_age_seconds
+
+
+class AdaptiveFreshnessPolicy(FreshnessPolicy):
+    def __init__(
+            self,
+            settle_days: int = 7,
+            initial_interval: float = 6 * 3600,
+            min_interval: float = 3600,
+            max_interval: float = 24 * 3600,
+            backoff: float = 2.0,
+            clock: Clock = datetime.datetime.utcnow
+    ):
+        """
+        Перепроверяет только окно поздних данных.
+
+        Дата считается устоявшейся, когда с ее конца прошло settle_days дней.
+        Устоявшаяся дата загружается последний раз, если ее предыдущая загрузка
+        была до этого момента, и больше не перепроверяется никогда.
+
+        Внутри окна интервал перепроверки подбирается по истории даты: если
+        данные изменились, интервал делится на backoff, если нет — умножается,
+        в пределах [min_interval, max_interval]. Новая дата начинает с initial_interval.
+        """
+        super().__init__(clock)
+        self.settle_days = settle_days
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+    def settles_at(self, record_date: datetime.date) -> datetime.datetime:
+        """Момент, после которого данные за record_date больше не меняются."""
+        return datetime.datetime.combine(
+            record_date + datetime.timedelta(days=self.settle_days + 1), datetime.time.min
+        )
+
+    def _recheck_interval(self, last_update: LastUpdateTime) -> float:
+        return getattr(last_update, "recheck_seconds", None) or self.initial_interval
+
+    def should_fetch(self, record_date: datetime.date, last_update: Optional[LastUpdateTime]) -> bool:
+        if not last_update or not last_update.is_complete:
+            return True
+        settles_at = self.settles_at(record_date)
+        if last_update.last_updated_at >= settles_at:
+            return False
+        now = self.clock()
+        if now >= settles_at:
+            return True
+        return (now - last_update.last_updated_at).total_seconds() >= self._recheck_interval(last_update)
+
+    def next_recheck_seconds(
+            self,
+            record_date: datetime.date,
+            last_update: Optional[LastUpdateTime],
+            changed: bool
+    ) -> Optional[float]:
+        if not last_update or not last_update.is_complete:
+            return self.initial_interval
+        interval = self._recheck_interval(last_update)
+        interval = interval / self.backoff if changed else interval * self.backoff
+        return min(self.max_interval, max(self.min_interval, interval))
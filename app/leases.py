@@ -0,0 +1,96 @@
+import datetime
+import logging
+import threading
+from typing import Callable, Iterable, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from app.crud import LastUpdateTimeCRUD
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseKeeper:
+    def __init__(
+            self,
+            session_factory: Callable[[], Session],
+            lease_owner: str,
+            lease_seconds: float = 300,
+            interval: Optional[float] = None
+    ):
+        """
+        Продлевает аренду дат по таймеру в отдельном потоке со своей сессией.
+
+        Дата удерживается от аренды (hold) до освобождения (release). С фоновым
+        писателем это момент применения его отметки о завершении, поэтому аренда
+        не истекает, пока строки даты ждут записи в очереди отстающего писателя.
+
+        Args:
+            session_factory: Фабрика сессий (например, Database.SessionLocal).
+            lease_owner: ID воркера, чьи аренды продлеваются.
+            lease_seconds: Срок аренды, на который она продлевается.
+            interval: Период продления; по умолчанию треть срока аренды.
+        """
+        self.session_factory = session_factory
+        self.lease_owner = lease_owner
+        self.lease_seconds = lease_seconds
+        self.interval = interval if interval is not None else lease_seconds / 3
+        self._held: Set[datetime.date] = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.heartbeats = 0
+
+    def __enter__(self) -> "LeaseKeeper":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="lease-keeper", daemon=True)
+        self._thread.start()
+
+    def hold(self, dates: Iterable[datetime.date]):
+        """Начинает продлевать аренду дат."""
+        with self._lock:
+            self._held.update(dates)
+
+    def release(self, dates: Iterable[datetime.date]):
+        """Прекращает продлевать аренду дат (они освобождены или отмечены завершенными)."""
+        with self._lock:
+            self._held.difference_update(dates)
+
+    @property
+    def held_dates(self) -> Set[datetime.date]:
+        with self._lock:
+            return set(self._held)
+
+    def close(self):
+        """Останавливает поток. Неосвобожденные аренды истекут сами через lease_seconds."""
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        session = self.session_factory()
+        update_crud = LastUpdateTimeCRUD(session)
+        try:
+            while not self._stopped.wait(self.interval):
+                held = sorted(self.held_dates)
+                if not held:
+                    continue
+                try:
+                    update_crud.heartbeat(held, self.lease_owner, lease_seconds=self.lease_seconds)
+                    self.heartbeats += 1
+                except Exception:
+                    # Например, база занята писателем: повторим на следующем шаге, пока аренда не истекла
+                    logger.exception(f"Не удалось продлить аренду дат воркера {self.lease_owner}.")
+                    session.rollback()
+        finally:
+            session.close()
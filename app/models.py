@@ -1,19 +1,37 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean
-from sqlalchemy.orm import declarative_base
-from datetime import datetime
+import threading
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Boolean, ForeignKey, MetaData, Table
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import declarative_base, relationship
+from datetime import date, datetime, timedelta
 
 Base = declarative_base()
 
 
+class Campaign(Base):
+    __tablename__ = "campaigns"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    campaign_id = Column(String, nullable=False, unique=True)
+
+    def __repr__(self):
+        return f"<Campaign(id={self.id}, campaign_id='{self.campaign_id}')>"
+
+
 class DailyStats(Base):
     __tablename__ = "daily_stats"
 
     date = Column(Date, primary_key=True)
-    campaign_id = Column(String, primary_key=True)
+    campaign_key = Column(Integer, ForeignKey("campaigns.id"), primary_key=True)
     spend = Column(Float, nullable=False)
     conversions = Column(Integer, nullable=False)
     cpa = Column(Float, nullable=True)
 
+    campaign = relationship(Campaign, lazy="joined", innerjoin=True)
+    # Строковый ID кампании из API; в таблице хранится только целочисленный campaign_key
+    campaign_id = association_proxy(
+        "campaign", "campaign_id", creator=lambda campaign_id: Campaign(campaign_id=campaign_id)
+    )
+
     def __repr__(self):
         return (
             f"<DailyStats(date={self.date}, campaign_id='{self.campaign_id}', "
@@ -27,9 +45,107 @@ class LastUpdateTime(Base):
     date = Column(Date, primary_key=True)
     last_updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     is_complete = Column(Boolean, default=False)
+    # Аренда даты воркером при параллельной синхронизации (см. LastUpdateTimeCRUD.claim_dates)
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    # Интервал перепроверки даты, подобранный политикой свежести (см. app/freshness.py)
+    recheck_seconds = Column(Float, nullable=True)
 
     def __repr__(self):
         return (
             f"<LastUpdateTime(date={self.date}, last_updated_at={self.last_updated_at}, "
             f"is_complete={self.is_complete})>"
         )
+
+
+class DailyStatsChange(Base):
+    """Запись outbox: изменение строки daily_stats для потребителей ленты изменений."""
+    __tablename__ = "daily_stats_changes"
+    # AUTOINCREMENT гарантирует, что seq не переиспользуется после компакции
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    date = Column(Date, nullable=False)
+    campaign_key = Column(Integer, ForeignKey("campaigns.id"), nullable=False)
+    # old_* равны None, если строка появилась впервые
+    old_spend = Column(Float, nullable=True)
+    new_spend = Column(Float, nullable=False)
+    old_conversions = Column(Integer, nullable=True)
+    new_conversions = Column(Integer, nullable=False)
+    old_cpa = Column(Float, nullable=True)
+    new_cpa = Column(Float, nullable=True)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return (
+            f"<DailyStatsChange(seq={self.seq}, date={self.date}, campaign_key={self.campaign_key}, "
+            f"spend={self.old_spend}->{self.new_spend}, conversions={self.old_conversions}->{self.new_conversions}, "
+            f"cpa={self.old_cpa}->{self.new_cpa})>"
+        )
+
+
+class ArchivePartition(Base):
+    """Помесячная архивная партиция daily_stats (см. app/archive.py)."""
+    __tablename__ = "archive_partitions"
+
+    month = Column(Date, primary_key=True)  # первый день месяца
+    table_name = Column(String, nullable=False)
+    archived_through = Column(Date, nullable=False)  # последняя перенесенная в архив дата месяца
+    row_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return (
+            f"<ArchivePartition(month={self.month}, table_name='{self.table_name}', "
+            f"archived_through={self.archived_through}, row_count={self.row_count})>"
+        )
+
+
+class DailyStatsMonthly(Base):
+    """Помесячные итоги по кампаниям для архивных месяцев."""
+    __tablename__ = "daily_stats_monthly"
+
+    month = Column(Date, primary_key=True)
+    campaign_key = Column(Integer, ForeignKey("campaigns.id"), primary_key=True)
+    spend = Column(Float, nullable=False)
+    conversions = Column(Integer, nullable=False)
+    days = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<DailyStatsMonthly(month={self.month}, campaign_key={self.campaign_key}, "
+            f"spend={self.spend}, conversions={self.conversions}, days={self.days})>"
+        )
+
+
+# Архивные таблицы создаются командой maintain, а не миграциями, поэтому
+# живут в отдельной MetaData (alembic/env.py исключает их из autogenerate)
+ARCHIVE_TABLE_PREFIX = "daily_stats_archive_"
+archive_metadata = MetaData()
+_archive_tables_lock = threading.Lock()
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def month_end(day: date) -> date:
+    return (month_start(day) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+
+
+def archive_table(month: date) -> Table:
+    """Таблица daily_stats_archive_YYYYMM с архивными строками daily_stats за месяц."""
+    name = f"{ARCHIVE_TABLE_PREFIX}{month:%Y%m}"
+    with _archive_tables_lock:
+        table = archive_metadata.tables.get(name)
+        if table is None:
+            table = Table(
+                name,
+                archive_metadata,
+                Column("date", Date, primary_key=True),
+                Column("campaign_key", Integer, primary_key=True),
+                Column("spend", Float, nullable=False),
+                Column("conversions", Integer, nullable=False),
+                Column("cpa", Float, nullable=True)
+            )
+        return table
@@ -0,0 +1,373 @@
+import cProfile
+import datetime
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cpu", "alloc", "sql")
+
+
+class RunProfiler(ABC):
+    """
+    Профилировщик одного прогона синхронизации. Оборачивает прогон через profile(),
+    получает от DataLoader границы этапов (on_stage_start/on_stage_end) и по
+    завершении пишет отчет в report_dir с именем, уникальным для прогона.
+    """
+    mode = ""
+
+    def __init__(self, report_dir: str = "."):
+        self.report_dir = report_dir
+        stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.report_prefix = os.path.join(report_dir, f"profile-{self.mode}-{stamp}-{os.getpid()}")
+        self.report_paths: List[str] = []
+
+    @abstractmethod
+    def start(self):
+        """Начинает сбор данных."""
+
+    @abstractmethod
+    def stop(self):
+        """Прекращает сбор данных (вызывается и при ошибке прогона)."""
+
+    def on_stage_start(self, name: str):
+        """Начало этапа в вызывающем потоке; по умолчанию этапы не учитываются."""
+
+    def on_stage_end(self, name: str):
+        """Конец этапа в вызывающем потоке."""
+
+    @abstractmethod
+    def write_report(self) -> List[str]:
+        """Пишет отчет и возвращает пути созданных файлов."""
+
+    @contextmanager
+    def profile(self) -> Iterator["RunProfiler"]:
+        """Профилирует блок и пишет отчет, даже если прогон завершился ошибкой."""
+        os.makedirs(self.report_dir, exist_ok=True)
+        self.start()
+        try:
+            yield self
+        finally:
+            self.stop()
+            self.report_paths = self.write_report()
+            for path in self.report_paths:
+                logger.info(f"Отчет профилирования ({self.mode}): {path}")
+
+
+def _frame_label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":  # встроенные функции: ('~', 0, "<built-in method ...>")
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{line})"
+    # ';' разделяет кадры в формате collapsed stacks
+    return label.replace(";", ",")
+
+
+def collapsed_stacks(stats: pstats.Stats, max_depth: int = 64, min_microseconds: int = 1) -> List[str]:
+    """
+    Строки collapsed stacks ("кадр;кадр;кадр <микросекунды>") для flamegraph.pl/speedscope.
+
+    cProfile хранит только ребра вызывающий -> вызываемый, поэтому стеки
+    восстанавливаются обходом графа от корней: время вызываемой функции
+    делится между путями пропорционально времени ребер.
+    """
+    raw = stats.stats
+    callees: Dict[tuple, List[tuple]] = defaultdict(list)
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller in callers:
+            callees[caller].append(func)
+    lines: Dict[str, int] = defaultdict(int)
+
+    def walk(func, stack: List[str], path_seconds: float, on_stack: set):
+        _, _, total_self, total_cumulative, _ = raw[func]
+        if total_cumulative <= 0:
+            return
+        stack = stack + [_frame_label(func)]
+        self_us = int(path_seconds * total_self / total_cumulative * 1e6)
+        if self_us >= min_microseconds:
+            lines[";".join(stack)] += self_us
+        if len(stack) >= max_depth:
+            return
+        on_stack = on_stack | {func}
+        for callee in callees.get(func, []):
+            if callee in on_stack:
+                continue  # рекурсия: время уже учтено на внешнем уровне
+            edge_cumulative = raw[callee][4][func][3]
+            child_seconds = path_seconds * edge_cumulative / total_cumulative
+            if child_seconds * 1e6 >= min_microseconds:
+                walk(callee, stack, child_seconds, on_stack)
+
+    roots = [func for func, (_, _, _, _, callers) in raw.items() if not callers]
+    for root in roots:
+        walk(root, [], raw[root][3], set())
+    return [f"{stack} {microseconds}" for stack, microseconds in sorted(lines.items())]
+
+
+class CpuProfiler(RunProfiler):
+    """cProfile потока синхронизации: дамп pstats и collapsed stacks для flame graph."""
+    mode = "cpu"
+
+    def __init__(self, report_dir: str = "."):
+        super().__init__(report_dir)
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write_report(self) -> List[str]:
+        pstats_path = f"{self.report_prefix}.pstats"
+        collapsed_path = f"{self.report_prefix}.collapsed"
+        self._profile.dump_stats(pstats_path)
+        with open(collapsed_path, "w", encoding="utf-8") as stream:
+            for line in collapsed_stacks(pstats.Stats(self._profile)):
+                stream.write(line + "\n")
+        return [pstats_path, collapsed_path]
+
+
+@dataclass
+class _StageAllocations:
+    name: str
+    seconds: float
+    peak_bytes: int
+    top: List[tracemalloc.StatisticDiff]
+
+
+class AllocProfiler(RunProfiler):
+    """
+    tracemalloc: снимки на границах этапов и топ мест выделения памяти по каждому этапу.
+
+    Группировка снимка по строкам — проход по всем живым выделениям на Python,
+    поэтому снимок на границе этапов берется один раз: конец этапа служит началом
+    следующего, а выделения между этапами относятся к следующему этапу.
+    """
+    mode = "alloc"
+
+    _IGNORED_FILES = frozenset((
+        tracemalloc.__file__,
+        "<frozen importlib._bootstrap>",
+        "<frozen importlib._bootstrap_external>",
+        "<unknown>",
+    ))
+
+    def __init__(self, report_dir: str = ".", top: int = 15, frames: int = 1):
+        super().__init__(report_dir)
+        self.top = top
+        self.frames = frames
+        self._stage_started: Dict[str, Tuple[Dict[tracemalloc.Traceback, tracemalloc.Statistic], float]] = {}
+        self._boundary: Optional[Dict[tracemalloc.Traceback, tracemalloc.Statistic]] = None
+        self._stages: List[_StageAllocations] = []
+        self._final: List[tracemalloc.Statistic] = []
+        self._peak_bytes = 0
+
+    def _statistics(self) -> Dict[tracemalloc.Traceback, tracemalloc.Statistic]:
+        return {
+            stat.traceback: stat for stat in tracemalloc.take_snapshot().statistics("lineno")
+            if stat.traceback[0].filename not in self._IGNORED_FILES
+        }
+
+    def _compare(self, after, before) -> List[tracemalloc.StatisticDiff]:
+        diffs = []
+        for traceback in after.keys() | before.keys():
+            new, old = after.get(traceback), before.get(traceback)
+            size, count = (new.size, new.count) if new else (0, 0)
+            old_size, old_count = (old.size, old.count) if old else (0, 0)
+            if size != old_size or count != old_count:
+                diffs.append(tracemalloc.StatisticDiff(traceback, size, size - old_size, count, count - old_count))
+        # Тот же порядок, что у Snapshot.compare_to: по модулю изменения размера
+        diffs.sort(key=lambda diff: (abs(diff.size_diff), diff.size, abs(diff.count_diff)), reverse=True)
+        return diffs[:self.top]
+
+    def start(self):
+        tracemalloc.start(self.frames)
+
+    def stop(self):
+        self._peak_bytes = max(self._peak_bytes, tracemalloc.get_traced_memory()[1])
+        self._final = sorted(self._statistics().values(), key=lambda stat: stat.size, reverse=True)[:self.top]
+        tracemalloc.stop()
+
+    def on_stage_start(self, name: str):
+        self._peak_bytes = max(self._peak_bytes, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        before = self._boundary if self._boundary is not None else self._statistics()
+        self._boundary = None
+        self._stage_started[name] = (before, time.perf_counter())
+
+    def on_stage_end(self, name: str):
+        if name not in self._stage_started:
+            return
+        before, started = self._stage_started.pop(name)
+        seconds = time.perf_counter() - started
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        self._peak_bytes = max(self._peak_bytes, peak_bytes)
+        self._boundary = self._statistics()
+        self._stages.append(_StageAllocations(name, seconds, peak_bytes, self._compare(self._boundary, before)))
+
+    def write_report(self) -> List[str]:
+        path = f"{self.report_prefix}.txt"
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write(f"Пиковая отслеживаемая память: {self._peak_bytes / 2 ** 20:.1f} MiB\n")
+            for stage in self._stages:
+                stream.write(
+                    f"\n== Этап {stage.name}: {stage.seconds:.3f} с, пик {stage.peak_bytes / 2 ** 20:.1f} MiB ==\n")
+                for diff in stage.top:
+                    stream.write(f"{diff}\n")
+            stream.write("\n== Живые выделения в конце прогона ==\n")
+            for stat in self._final:
+                stream.write(f"{stat}\n")
+        return [path]
+
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SQL_PARAM = re.compile(r"\?|%\([^)]+\)s|%s|(?<!:):\w+|\$\d+")
+_SQL_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SQL_VALUES = re.compile(r"\b(VALUES\s+)(\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))*)", re.IGNORECASE)
+
+
+def _normalize(statement: str) -> Tuple[str, int]:
+    statement = _SQL_STRING.sub("?", statement)
+    statement = _SQL_PARAM.sub("?", statement)
+    statement = _SQL_NUMBER.sub("?", statement)
+    statement = " ".join(statement.split())
+    statement = _SQL_LIST.sub("(?...)", statement)
+    values = _SQL_VALUES.search(statement)
+    value_rows = values.group(2).count("(?...)") if values else 0
+    # Любое число строк VALUES, включая одну, дает один ключ
+    return _SQL_VALUES.sub(r"\1(?...), ...", statement), value_rows
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Нормализует текст SQL для группировки: литералы и параметры заменяются на ?,
+    списки IN (...) и строки VALUES любой длины схлопываются, пробелы сжимаются.
+    """
+    return _normalize(statement)[0]
+
+
+def _parameter_rows(value_rows: int, parameters, executemany: bool) -> int:
+    # executemany передает список наборов параметров; пакет insertmanyvalues —
+    # плоский кортеж значений всех строк одного INSERT ... VALUES (...), (...)
+    if executemany and parameters and isinstance(parameters[0], (tuple, list, dict)):
+        return len(parameters)
+    return max(1, value_rows)
+
+
+@dataclass
+class _StatementStats:
+    count: int = 0
+    rows: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class SqlProfiler(RunProfiler):
+    """
+    События before/after_cursor_execute движка: количество и длительность запросов,
+    сгруппированных по нормализованному SQL, и число переданных строк параметров.
+
+    Учитываются все потоки. Этап относится только к потоку, который его начал:
+    запросы фоновых потоков (писателя, продления аренды) учитываются отдельно,
+    под именем потока, а не под этапом, идущим в это время в потоке синхронизации.
+    """
+    mode = "sql"
+
+    def __init__(self, engine: Engine, report_dir: str = "."):
+        super().__init__(report_dir)
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._statements: Dict[str, _StatementStats] = defaultdict(_StatementStats)
+        self._thread_stages: Dict[int, str] = {}
+        self._stage_seconds: Dict[str, float] = defaultdict(float)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # Текст и параметры разбираются здесь: для пакетов insertmanyvalues
+        # after_cursor_execute получает исходный statement и параметры всех пакетов
+        key, value_rows = _normalize(statement)
+        rows = _parameter_rows(value_rows, parameters, executemany)
+        conn.info.setdefault("profiling_started", []).append((key, rows, time.perf_counter()))
+
+    def _handle_error(self, exception_context):
+        # after_cursor_execute для упавшего запроса не вызывается: снимаем его отметку,
+        # иначе следующий запрос на этом соединении получит чужие ключ и время начала
+        conn = exception_context.connection
+        if conn is not None and exception_context.execution_context is not None:
+            started = conn.info.get("profiling_started")
+            if started:
+                started.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        finished = time.perf_counter()
+        key, rows, started = conn.info["profiling_started"].pop()
+        elapsed = finished - started
+        with self._lock:
+            stats = self._statements[key]
+            stats.count += 1
+            stats.rows += rows
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            stage = self._thread_stages.get(threading.get_ident())
+            if stage is None:
+                # Вне этапа: фоновый поток или код между этапами
+                stage = f"[{threading.current_thread().name}]"
+            self._stage_seconds[stage] += elapsed
+
+    def start(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(self.engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(self.engine, "handle_error", self._handle_error)
+
+    def stop(self):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(self.engine, "after_cursor_execute", self._after_cursor_execute)
+        event.remove(self.engine, "handle_error", self._handle_error)
+
+    def on_stage_start(self, name: str):
+        with self._lock:
+            self._thread_stages[threading.get_ident()] = name
+
+    def on_stage_end(self, name: str):
+        with self._lock:
+            self._thread_stages.pop(threading.get_ident(), None)
+
+    def write_report(self) -> List[str]:
+        path = f"{self.report_prefix}.txt"
+        total = sum(stats.total_seconds for stats in self._statements.values()) or 1e-9
+        count = sum(stats.count for stats in self._statements.values())
+        with open(path, "w", encoding="utf-8") as stream:
+            stream.write(f"Запросов: {count}, время в базе: {total:.3f} с\n")
+            stream.write("По этапам и потокам вне этапов ([имя потока]): " + ", ".join(
+                f"{name}={seconds:.3f}s" for name, seconds in self._stage_seconds.items()) + "\n\n")
+            stream.write(f"{'count':>8} {'rows':>8} {'total_ms':>10} {'avg_ms':>8} {'max_ms':>8} {'share':>6}  sql\n")
+            for statement, stats in sorted(self._statements.items(), key=lambda item: -item[1].total_seconds):
+                stream.write(
+                    f"{stats.count:>8} {stats.rows:>8} {stats.total_seconds * 1000:>10.1f} "
+                    f"{stats.total_seconds / stats.count * 1000:>8.2f} {stats.max_seconds * 1000:>8.2f} "
+                    f"{stats.total_seconds / total:>6.1%}  {statement}\n")
+        return [path]
+
+
+def create_profiler(mode: str, engine: Engine, report_dir: str = ".") -> RunProfiler:
+    if mode == "cpu":
+        return CpuProfiler(report_dir)
+    if mode == "alloc":
+        return AllocProfiler(report_dir)
+    if mode == "sql":
+        return SqlProfiler(engine, report_dir)
+    raise ValueError(f"Неподдерживаемый режим профилирования: {mode}")
@@ -0,0 +1,191 @@
+import datetime
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.db import Database
+
+logger = logging.getLogger(__name__)
+
+
+class BadRequest(ValueError):
+    """Некорректные параметры запроса (HTTP 400)."""
+
+
+def _param_date(query: Dict[str, List[str]], name: str) -> Optional[datetime.date]:
+    values = query.get(name)
+    if not values:
+        return None
+    try:
+        return datetime.date.fromisoformat(values[0])
+    except ValueError:
+        raise BadRequest(f"Параметр {name} должен быть датой в формате YYYY-MM-DD")
+
+
+def _param_int(query: Dict[str, List[str]], name: str, default: int, max_value: int) -> int:
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise BadRequest(f"Параметр {name} должен быть целым числом")
+    if not 1 <= value <= max_value:
+        raise BadRequest(f"Параметр {name} должен быть в диапазоне 1..{max_value}")
+    return value
+
+
+class StatsQueryService:
+    def __init__(self, database: Database, cache_size: int = 256):
+        """
+        Сервис запросов к DailyStats только для чтения.
+        Ответы кэшируются в памяти и считаются актуальными, пока не изменится
+        максимальный LastUpdateTime.last_updated_at.
+
+        Args:
+            database: База данных; используется ее пул соединений только для чтения.
+            cache_size: Максимальное количество закэшированных ответов.
+        """
+        self.database = database
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, Tuple[Optional[datetime.datetime], str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Пул создается заранее, а не первым из параллельных запросов
+        database.get_read_only_engine()
+
+    def handle(
+        self,
+        path: str,
+        query: Dict[str, List[str]],
+        if_none_match: Optional[str] = None
+    ) -> Tuple[int, Dict[str, str], bytes]:
+        """Обрабатывает GET-запрос и возвращает (статус, заголовки, тело)."""
+        cache_key = (path, tuple(sorted((k, tuple(v)) for k, v in query.items())))
+        with self.database.get_read_only_db() as db_session:
+            version = LastUpdateTimeCRUD(db_session).get_data_version()
+
+            with self._lock:
+                cached = self._cache.get(cache_key)
+                if cached and cached[0] == version:
+                    self._cache.move_to_end(cache_key)
+                else:
+                    cached = None
+
+            if cached is None:
+                try:
+                    payload = self._route(DailyStatsCRUD(db_session), path, query)
+                except BadRequest as e:
+                    return self._json_response(400, {"error": str(e)})
+                if payload is None:
+                    return self._json_response(404, {"error": "Not found"})
+                body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+                etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+                cached = (version, etag, body)
+                with self._lock:
+                    self._cache[cache_key] = cached
+                    self._cache.move_to_end(cache_key)
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+        _, etag, body = cached
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return 304, headers, b""
+        headers["Content-Type"] = "application/json"
+        return 200, headers, body
+
+    @staticmethod
+    def _json_response(status: int, payload: Dict) -> Tuple[int, Dict[str, str], bytes]:
+        return status, {"Content-Type": "application/json"}, json.dumps(payload).encode("utf-8")
+
+    def _route(self, db_crud: DailyStatsCRUD, path: str, query: Dict[str, List[str]]) -> Optional[Dict]:
+        start_date = _param_date(query, "from")
+        end_date = _param_date(query, "to")
+        parts = [unquote(part) for part in path.strip("/").split("/")]
+
+        # /campaigns/<campaign_id>/cpa
+        if len(parts) == 3 and parts[0] == "campaigns" and parts[2] == "cpa":
+            series = db_crud.get_campaign_series(parts[1], start_date, end_date)
+            return {
+                "campaign_id": parts[1],
+                "series": [
+                    {"date": row.date.isoformat(), "spend": row.spend, "conversions": row.conversions, "cpa": row.cpa}
+                    for row in series
+                ]
+            }
+
+        # /totals
+        if parts == ["totals"]:
+            totals = db_crud.get_totals(start_date, end_date)
+            return {
+                "from": start_date,
+                "to": end_date,
+                "spend": totals.spend,
+                "conversions": totals.conversions,
+                "cpa": totals.spend / totals.conversions if totals.conversions > 0 else None,
+                "campaigns": totals.campaigns
+            }
+
+        # /top?n=10&by=spend|conversions|cpa
+        if parts == ["top"]:
+            limit = _param_int(query, "n", default=10, max_value=1000)
+            order_by = (query.get("by") or ["spend"])[0]
+            if order_by not in ("spend", "conversions", "cpa"):
+                raise BadRequest("Параметр by должен быть одним из: spend, conversions, cpa")
+            top = db_crud.get_top_campaigns(start_date, end_date, limit=limit, order_by=order_by)
+            return {
+                "from": start_date,
+                "to": end_date,
+                "by": order_by,
+                "campaigns": [
+                    {"campaign_id": row.campaign_id, "spend": row.spend, "conversions": row.conversions, "cpa": row.cpa}
+                    for row in top
+                ]
+            }
+
+        return None
+
+
+class _StatsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Заголовки и тело пишутся отдельно; без TCP_NODELAY keep-alive ответы ждут delayed ACK (~40 мс)
+    disable_nagle_algorithm = True
+    service: StatsQueryService
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            status, headers, body = self.service.handle(
+                url.path, parse_qs(url.query), self.headers.get("If-None-Match")
+            )
+        except Exception:
+            logger.exception(f"Ошибка обработки запроса {self.path}")
+            status, headers, body = 500, {"Content-Type": "application/json"}, b'{"error":"Internal error"}'
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def create_server(database: Database, host: str = "127.0.0.1", port: int = 8080,
+                  cache_size: int = 256) -> ThreadingHTTPServer:
+    """Создает HTTP-сервер запросов к DailyStats (запуск: server.serve_forever())."""
+    handler = type("StatsRequestHandler", (_StatsRequestHandler,), {
+        "service": StatsQueryService(database, cache_size=cache_size)
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,213 @@
+import datetime
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.changefeed import ChangeSegmentSink
+from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.data_models import CombinedDailyStatData
+
+logger = logging.getLogger(__name__)
+
+
+class StatsWriterError(RuntimeError):
+    """Ошибка записи в фоновом потоке BatchedStatsWriter."""
+
+
+@dataclass
+class _CompletionMark:
+    """Отметка LastUpdateTime, применяемая после записи всех ранее поставленных в очередь строк."""
+    dates: List[datetime.date]
+    lease_owner: Optional[str] = None
+    recheck_seconds: Dict[datetime.date, float] = field(default_factory=dict)
+    on_release: Optional[Callable[[List[datetime.date]], None]] = None
+
+
+_STOP = object()
+
+# Как часто put()/close() проверяют, жив ли поток писателя, пока очередь заполнена
+_PUT_POLL_SECONDS = 0.1
+
+
+class BatchedStatsWriter:
+    def __init__(
+            self,
+            session_factory: Callable[[], Session],
+            batch_size: int = 500,
+            max_batch_age: float = 1.0,
+            max_queue_size: int = 10000,
+            change_sink: Optional[ChangeSegmentSink] = None
+    ):
+        """
+        Фоновый писатель DailyStats со своей сессией и ограниченной очередью.
+
+        Args:
+            session_factory: Фабрика сессий (например, Database.SessionLocal).
+            batch_size: Размер пакета, при достижении которого он записывается.
+            max_batch_age: Максимальное время (в секундах) ожидания неполного пакета.
+            max_queue_size: Размер очереди; при ее заполнении put() блокирует производителя.
+            change_sink: Необязательный приемник NDJSON-сегментов ленты изменений.
+        """
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_batch_age = max_batch_age
+        self.change_sink = change_sink
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self.rows_written = 0
+        self.write_seconds = 0.0
+
+    def __enter__(self) -> "BatchedStatsWriter":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+            return
+        # Не подменяем исходное исключение ошибкой писателя
+        try:
+            self.close()
+        except StatsWriterError as e:
+            logger.error(f"Ошибка фоновой записи при аварийном завершении: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="stats-writer", daemon=True)
+        self._thread.start()
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise StatsWriterError(f"Фоновая запись DailyStats завершилась ошибкой: {self._error}") from self._error
+
+    def _enqueue(self, item) -> bool:
+        """
+        Ставит элемент в очередь, ожидая места, пока поток писателя жив.
+        Возвращает False, если поток остановился и очередь уже не разберут.
+        """
+        while True:
+            try:
+                self._queue.put(item, timeout=_PUT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                if self._thread is None or not self._thread.is_alive():
+                    return False
+
+    def _put(self, item):
+        self._raise_if_failed()
+        if not self._enqueue(item):
+            self._raise_if_failed()
+            raise StatsWriterError("Поток фоновой записи DailyStats остановлен, очередь не разбирается.")
+
+    def put(self, item: CombinedDailyStatData):
+        """
+        Ставит строку в очередь на запись. Блокирует, если очередь заполнена,
+        и поднимает StatsWriterError, если поток писателя упал.
+        """
+        self._put(item)
+
+    def mark_complete(
+            self,
+            dates: Sequence[datetime.date],
+            lease_owner: Optional[str] = None,
+            recheck_seconds: Optional[Dict[datetime.date, float]] = None,
+            on_release: Optional[Callable[[List[datetime.date]], None]] = None
+    ):
+        """
+        Отмечает даты как полностью загруженные после записи всех ранее
+        поставленных в очередь строк. Если задан lease_owner, аренда дат освобождается.
+        recheck_seconds — интервалы перепроверки дат от политики свежести.
+        on_release вызывается в потоке писателя непосредственно перед освобождением
+        аренды (например, LeaseKeeper.release, чтобы прекратить ее продление).
+        """
+        self._put(_CompletionMark(list(dates), lease_owner, dict(recheck_seconds or {}), on_release))
+
+    def close(self):
+        """
+        Записывает остаток очереди, применяет отметки о завершении и останавливает поток.
+        Поднимает StatsWriterError, если запись завершилась ошибкой.
+        """
+        if self._thread is not None:
+            # Если поток уже упал, _STOP некому разбирать: просто дожидаемся его
+            self._enqueue(_STOP)
+            self._thread.join()
+            self._thread = None
+        self._raise_if_failed()
+
+    def _run(self):
+        try:
+            session = self.session_factory()
+            try:
+                self._consume(session)
+            finally:
+                session.close()
+        except BaseException as e:
+            # Например, не удалось открыть сессию или откатить транзакцию: без записанной
+            # ошибки put() и close() не узнали бы, что очередь больше не разбирается
+            logger.exception("Поток фоновой записи DailyStats остановлен ошибкой.")
+            if self._error is None:
+                self._error = e
+
+    def _consume(self, session: Session):
+        db_crud = DailyStatsCRUD(session, change_sink=self.change_sink)
+        update_crud = LastUpdateTimeCRUD(session)
+        batch: List[CombinedDailyStatData] = []
+        batch_started = 0.0
+
+        def flush():
+            if batch and self._error is None:
+                started = time.perf_counter()
+                self.rows_written += db_crud.bulk_upsert_daily_stats(batch)
+                self.write_seconds += time.perf_counter() - started
+            batch.clear()
+
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0.0, self.max_batch_age - (time.monotonic() - batch_started))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            try:
+                if item is None:
+                    flush()
+                elif item is _STOP:
+                    flush()
+                    break
+                elif isinstance(item, _CompletionMark):
+                    flush()
+                    if self._error is None:
+                        self._apply_completion_mark(update_crud, item)
+                elif self._error is None:
+                    if not batch:
+                        batch_started = time.monotonic()
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        flush()
+            except Exception as e:
+                # После ошибки продолжаем разбирать очередь (без записи),
+                # чтобы производители не блокировались навсегда
+                logger.exception("Ошибка фоновой записи DailyStats.")
+                self._error = e
+                batch.clear()
+                session.rollback()
+
+    @staticmethod
+    def _apply_completion_mark(update_crud: LastUpdateTimeCRUD, mark: _CompletionMark):
+        if mark.on_release:
+            mark.on_release(mark.dates)
+        if mark.lease_owner:
+            update_crud.release_dates(mark.dates, mark.lease_owner, is_complete=True)
+        else:
+            for record_date in mark.dates:
+                update_crud.set_last_update_info(record_date, is_complete=True)
+        update_crud.set_recheck_intervals(mark.recheck_seconds)
@@ -0,0 +1,144 @@
+"""
+Сквозной нагрузочный тест синхронизации: run.run() против локального фейкового upstream.
+
+Для каждого сценария (1d / 30d / 1y) поднимается FakeUpstreamServer, создается
+чистая база SQLite, и синхронизация запускается в отдельном процессе, чтобы пиковая
+память (ru_maxrss) относилась только к ней. Печатается общее время, разбивка по
+этапам, пиковая память и скорость записи в базу.
+
+Запуск: python -m benchmarks.e2e_sync --campaigns 200 --page-size 1000 --latency-ms 20 --scenarios 1d 30d 1y
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import tempfile
+import time
+import traceback
+from dataclasses import asdict
+from typing import Dict, List, Optional
+
+from benchmarks.fake_upstream import FakeUpstreamConfig, FakeUpstreamServer
+
+SCENARIOS = {"1d": 1, "30d": 30, "1y": 365}
+
+# Как часто проверять, жив ли процесс синхронизации, пока нет результата
+_POLL_SECONDS = 1.0
+
+
+def _sync_in_child(work_dir: str, database_url: str, fb_spend_url: str, network_conv_url: str, result_queue):
+    # run.py при импорте пишет app_sync.log в текущий каталог
+    os.chdir(work_dir)
+    import logging
+    import run
+    from app.db import Database
+    from app.models import Base
+
+    logging.getLogger().setLevel(logging.WARNING)
+    Base.metadata.create_all(Database(database_url).engine)
+
+    started = time.perf_counter()
+    try:
+        stats = run.run(fb_spend_url=fb_spend_url, network_conv_url=network_conv_url, database_url=database_url)
+    except Exception:
+        result_queue.put({"error": traceback.format_exc()})
+        return
+    total = time.perf_counter() - started
+    result_queue.put({
+        "total_seconds": total,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        **asdict(stats)
+    })
+
+
+def _wait_for_result(process, result_queue, timeout: float) -> Dict:
+    """
+    Ждет результат дочернего процесса. Если процесс упал, не успев его отправить,
+    или не уложился в timeout, возвращает {"error": ...} вместо вечного ожидания.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return result_queue.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            # Результат мог прийти в очередь между get() и проверкой
+            try:
+                return result_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                return {"error": f"процесс синхронизации завершился с кодом {process.exitcode} без результата"}
+        if time.monotonic() > deadline:
+            process.terminate()
+            return {"error": f"сценарий не завершился за {timeout:.0f} с"}
+
+
+def run_scenario(name: str, config: FakeUpstreamConfig, timeout: float = 1800.0) -> Dict:
+    ctx = multiprocessing.get_context("spawn")
+    with FakeUpstreamServer(config) as upstream, tempfile.TemporaryDirectory() as work_dir:
+        database_url = f"sqlite:///{os.path.join(work_dir, 'e2e.sqlite3')}"
+        result_queue = ctx.Queue()
+        process = ctx.Process(
+            target=_sync_in_child,
+            args=(work_dir, database_url, upstream.fb_spend_url, upstream.network_conv_url, result_queue)
+        )
+        process.start()
+        result = _wait_for_result(process, result_queue, timeout)
+        process.join()
+        result.update(scenario=name, upstream_requests=upstream.requests, upstream_bytes=upstream.bytes_sent)
+        return result
+
+
+def print_report(result: Dict):
+    if "error" in result:
+        print(f"[{result['scenario']}] FAILED: {result['error'].rstrip()}")
+        return
+    stages = "  ".join(f"{stage}={seconds:.2f}s" for stage, seconds in result["stage_seconds"].items())
+    write_rate = result["rows_written"] / result["write_seconds"] if result["write_seconds"] else 0.0
+    print(
+        f"[{result['scenario']}] total={result['total_seconds']:.2f}s  rows={result['rows_written']}  "
+        f"peak_rss={result['peak_rss_mb']:.0f} MB  db_write={write_rate:.0f} rows/s  "
+        f"upstream: {result['upstream_requests']} req, {result['upstream_bytes'] / 1e6:.1f} MB"
+    )
+    print(f"    {stages}")
+    duplicates = {source: sum(counts.values()) for source, counts in result["duplicate_rows"].items()}
+    if duplicates:
+        print(f"    duplicates dropped: {duplicates}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--campaigns", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-gzip", action="store_true")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=1800.0, help="Лимит времени одного сценария, с")
+    args = parser.parse_args(argv)
+
+    failed = []
+    for name in args.scenarios:
+        config = FakeUpstreamConfig(
+            days=SCENARIOS[name],
+            campaigns=args.campaigns,
+            page_size=args.page_size,
+            latency_ms=args.latency_ms,
+            latency_sigma=args.latency_sigma,
+            error_rate=args.error_rate,
+            gzip=not args.no_gzip,
+            duplicate_rate=args.duplicate_rate
+        )
+        result = run_scenario(name, config, timeout=args.timeout)
+        print_report(result)
+        if "error" in result:
+            failed.append(name)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Локальная замена upstream API (fb_spend и network_conv) для воспроизводимых тестов.
+
+Отдает синтетические фиды заданного размера с настраиваемыми задержками
+(логнормальное распределение), долей ошибок 503, пагинацией, gzip-сжатием
+и повторами строк.
+
+Запуск: python -m benchmarks.fake_upstream --days 30 --campaigns 200 --page-size 1000 --latency-ms 20 --port 8081
+Затем: python run.py --fb-spend-url http://127.0.0.1:8081/fb_spend --network-conv-url http://127.0.0.1:8081/network_conv
+"""
+import argparse
+import datetime
+import gzip
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+
+@dataclass
+class FakeUpstreamConfig:
+    """Параметры синтетических фидов."""
+    days: int = 30
+    campaigns: int = 100
+    start_date: datetime.date = datetime.date(2025, 1, 1)
+    page_size: int = 0  # 0 — без пагинации: весь фид одним JSON-списком, как у mock-сервера
+    latency_ms: float = 0.0  # медиана задержки ответа
+    latency_sigma: float = 0.5  # разброс задержки (sigma логнормального распределения)
+    error_rate: float = 0.0  # доля ответов 503
+    gzip: bool = True  # сжимать ответ, если клиент присылает Accept-Encoding: gzip
+    duplicate_rate: float = 0.0  # доля строк, после которых повторяется предыдущая (в том числе с прошлой страницы)
+    row_ids: bool = False  # передавать row_id строк
+    seed: int = 42
+
+    @property
+    def total_rows(self) -> int:
+        return self.days * self.campaigns
+
+
+def _spend_row(config: FakeUpstreamConfig, i: int) -> Dict:
+    row = {
+        "date": (config.start_date + datetime.timedelta(days=i // config.campaigns)).isoformat(),
+        "campaign_id": f"CAMP-{i % config.campaigns}",
+        "spend": ((i * 2654435761 + config.seed) % 100000) / 100
+    }
+    if config.row_ids:
+        row["row_id"] = f"spend-{i}"
+    return row
+
+
+def _conversion_row(config: FakeUpstreamConfig, i: int) -> Dict:
+    row = {
+        "date": (config.start_date + datetime.timedelta(days=i // config.campaigns)).isoformat(),
+        "campaign_id": f"CAMP-{i % config.campaigns}",
+        "conversions": (i * 40503 + config.seed) % 20
+    }
+    if config.row_ids:
+        row["row_id"] = f"conv-{i}"
+    return row
+
+
+def _rows(config: FakeUpstreamConfig, row_factory, first: int, last: int) -> List[Dict]:
+    rows = []
+    threshold = int(config.duplicate_rate * 10000)
+    for i in range(first, last):
+        if i > 0 and (i * 7919 + config.seed) % 10000 < threshold:
+            rows.append(row_factory(config, i - 1))
+        rows.append(row_factory(config, i))
+    return rows
+
+
+FEEDS = {"/fb_spend": _spend_row, "/network_conv": _conversion_row}
+
+
+class _FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    upstream: "FakeUpstreamServer"
+
+    def do_GET(self):
+        upstream = self.upstream
+        config = upstream.config
+        url = urlsplit(self.path)
+        row_factory = FEEDS.get(url.path)
+        upstream.count_request()
+
+        if config.latency_ms > 0:
+            time.sleep(upstream.random_latency())
+        if row_factory is None:
+            return self._send(404, b'{"error":"Not found"}')
+        if upstream.random_error():
+            return self._send(503, b'{"error":"Service unavailable"}')
+
+        if config.page_size > 0:
+            page = int(parse_qs(url.query).get("page", ["0"])[0])
+            first = page * config.page_size
+            last = min(first + config.page_size, config.total_rows)
+            has_next = last < config.total_rows
+            payload = {
+                "data": _rows(config, row_factory, first, last),
+                "next": f"{url.path}?page={page + 1}" if has_next else None
+            }
+        else:
+            payload = _rows(config, row_factory, 0, config.total_rows)
+        self._send(200, json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+    def _send(self, status: int, body: bytes):
+        headers = {"Content-Type": "application/json"}
+        if self.upstream.config.gzip and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=1)
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.upstream.count_bytes(len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeUpstreamServer:
+    def __init__(self, config: Optional[FakeUpstreamConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Фейковый upstream. Запускается в фоновом потоке через start() или как контекстный менеджер.
+        port=0 — выбрать свободный порт.
+        """
+        self.config = config or FakeUpstreamConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        handler = type("FakeUpstreamHandler", (_FakeUpstreamHandler,), {"upstream": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def fb_spend_url(self) -> str:
+        return f"{self.base_url}/fb_spend"
+
+    @property
+    def network_conv_url(self) -> str:
+        return f"{self.base_url}/network_conv"
+
+    def random_latency(self) -> float:
+        with self._lock:
+            return self._rng.lognormvariate(math.log(self.config.latency_ms / 1000), self.config.latency_sigma)
+
+    def random_error(self) -> bool:
+        if self.config.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.config.error_rate
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_bytes(self, size: int):
+        with self._lock:
+            self.bytes_sent += size
+
+    def start(self) -> "FakeUpstreamServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self) -> "FakeUpstreamServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--campaigns", type=int, default=100)
+    parser.add_argument("--start-date", type=datetime.date.fromisoformat, default=datetime.date(2025, 1, 1))
+    parser.add_argument("--page-size", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--no-gzip", action="store_true")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    parser.add_argument("--row-ids", action="store_true")
+    args = parser.parse_args(argv)
+
+    config = FakeUpstreamConfig(
+        days=args.days,
+        campaigns=args.campaigns,
+        start_date=args.start_date,
+        page_size=args.page_size,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        gzip=not args.no_gzip,
+        duplicate_rate=args.duplicate_rate,
+        row_ids=args.row_ids
+    )
+    server = FakeUpstreamServer(config, host=args.host, port=args.port)
+    print(f"Fake upstream: {server.fb_spend_url} и {server.network_conv_url} ({config.total_rows} строк в фиде)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
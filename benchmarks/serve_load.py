@@ -0,0 +1,158 @@
+"""
+Нагрузочный тест HTTP-сервиса запросов к DailyStats (run.py serve).
+
+Создает синтетическую базу SQLite, поднимает сервис в отдельном процессе и
+измеряет пропускную способность и задержки в трех режимах:
+  cold    — кэш выключен (cache_size=0 у отдельного сервера), каждый запрос идет в базу;
+  cached  — повторные запросы отдаются из кэша в памяти;
+  etag    — повторные запросы с If-None-Match получают 304.
+
+Запуск: python -m benchmarks.serve_load --days 365 --campaigns 500 --requests 3000 --concurrency 8
+"""
+import argparse
+import datetime
+import http.client
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from app.db import Database
+from app.models import Base, Campaign, DailyStats, LastUpdateTime
+from app.server import create_server
+
+ENDPOINTS = [
+    "/campaigns/CAMP-{campaign}/cpa?from=2024-03-01&to=2024-05-31",
+    "/totals?from=2024-01-01&to=2024-12-31",
+    "/totals?from=2024-06-01&to=2024-06-30",
+    "/top?n=20&by=spend&from=2024-01-01&to=2024-12-31",
+    "/top?n=20&by=cpa&from=2024-07-01&to=2024-09-30",
+]
+
+
+def populate(database: Database, days: int, campaigns: int):
+    Base.metadata.create_all(database.engine)
+    start = datetime.date(2024, 1, 1)
+    rng = random.Random(42)
+    with database.engine.begin() as connection:
+        connection.execute(Campaign.__table__.insert(), [
+            {"id": n + 1, "campaign_id": f"CAMP-{n}"} for n in range(campaigns)
+        ])
+        for day in range(days):
+            rows = []
+            for n in range(campaigns):
+                conversions = rng.randint(0, 20)
+                spend = round(rng.uniform(1, 100), 2)
+                rows.append({
+                    "date": start + datetime.timedelta(days=day),
+                    "campaign_key": n + 1,
+                    "spend": spend,
+                    "conversions": conversions,
+                    "cpa": spend / conversions if conversions else None
+                })
+            connection.execute(DailyStats.__table__.insert(), rows)
+        connection.execute(LastUpdateTime.__table__.insert(), [
+            {"date": start + datetime.timedelta(days=day), "last_updated_at": datetime.datetime.utcnow(),
+             "is_complete": True}
+            for day in range(days)
+        ])
+
+
+def _serve(database_url: str, port: int, cache_size: int, ready):
+    server = create_server(Database(database_url), port=port, cache_size=cache_size)
+    ready.set()
+    server.serve_forever()
+
+
+def run_load(port: int, paths: List[str], requests: int, concurrency: int,
+             conditional: bool) -> Tuple[float, List[float], int]:
+    latencies: List[float] = []
+    not_modified = 0
+    lock = threading.Lock()
+    per_thread = requests // concurrency
+
+    def worker(seed: int):
+        nonlocal not_modified
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        etags = {}
+        local_latencies = []
+        local_not_modified = 0
+        for _ in range(per_thread):
+            path = rng.choice(paths)
+            headers = {"If-None-Match": etags[path]} if conditional and path in etags else {}
+            started = time.perf_counter()
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            local_latencies.append(time.perf_counter() - started)
+            if response.status == 304:
+                local_not_modified += 1
+            elif response.getheader("ETag"):
+                etags[path] = response.getheader("ETag")
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            not_modified += local_not_modified
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, not_modified
+
+
+def report(name: str, elapsed: float, latencies: List[float], not_modified: int):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<7} {len(latencies) / elapsed:>9.0f} req/s  "
+        f"p50={quantiles[49] * 1000:.2f} ms  p95={quantiles[94] * 1000:.2f} ms  "
+        f"p99={quantiles[98] * 1000:.2f} ms  304={not_modified}"
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--campaigns", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = f"sqlite:///{os.path.join(tmp_dir, 'load.sqlite3')}"
+        populate(Database(database_url), args.days, args.campaigns)
+        print(f"База: {args.days} дней x {args.campaigns} кампаний = {args.days * args.campaigns} строк")
+
+        paths = [endpoint.format(campaign=n) for endpoint in ENDPOINTS for n in range(10)]
+        paths = sorted(set(paths))
+
+        ctx = multiprocessing.get_context("spawn")
+        for name, cache_size, conditional in (("cold", 0, False), ("cached", 256, False), ("etag", 256, True)):
+            ready = ctx.Event()
+            port = 18000 + cache_size + int(conditional)
+            process = ctx.Process(target=_serve, args=(database_url, port, cache_size, ready), daemon=True)
+            process.start()
+            ready.wait(timeout=30)
+            time.sleep(0.2)
+            try:
+                if cache_size:
+                    run_load(port, paths, len(paths), 1, conditional=False)  # прогрев кэша
+                elapsed, latencies, not_modified = run_load(
+                    port, paths, args.requests, args.concurrency, conditional
+                )
+                report(name, elapsed, latencies, not_modified)
+            finally:
+                process.terminate()
+                process.join()
+
+
+if __name__ == "__main__":
+    main()
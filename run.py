@@ -1,12 +1,24 @@
 import argparse
 import datetime
 import logging
-from typing import Optional
+import sys
+import time
+from contextlib import nullcontext
+from typing import List, Optional
 
 from app.api import ApiDataSource
-from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.archive import DailyStatsArchiver
+from app.changefeed import ChangeSegmentSink, change_record_to_json
+from app.crud import ArchiveCRUD, DailyStatsChangeCRUD, DailyStatsCRUD, LastUpdateTimeCRUD
 from app.data_loader import DataLoader
-from app.db import database
+from app.data_models import SyncRunStats
+from app.db import Database, database
+from app.export import EXPORT_FORMATS, DailyStatsExporter
+from app.freshness import AdaptiveFreshnessPolicy, FixedIntervalPolicy, FreshnessPolicy
+from app.leases import LeaseKeeper
+from app.profiling import PROFILE_MODES, create_profiler
+from app.server import create_server
+from app.writer import BatchedStatsWriter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,10 +30,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+FRESHNESS_POLICIES = ("adaptive", "fixed")
 
-def run(start_date: Optional[datetime.date] = None, end_date: Optional[datetime.date] = None):
-    api_data_source = ApiDataSource()
+
+def _get_database(database_url: Optional[str]) -> Database:
+    return Database(database_url) if database_url else database
+
+
+def _get_freshness_policy(name: str, settle_days: int) -> FreshnessPolicy:
+    if name == "fixed":
+        return FixedIntervalPolicy()
+    return AdaptiveFreshnessPolicy(settle_days=settle_days)
+
+
+def run(
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    worker_id: Optional[str] = None,
+    lease_seconds: int = 300,
+    claim_batch_size: int = 1,
+    write_batch_size: int = 500,
+    write_batch_age: float = 1.0,
+    changes_dir: Optional[str] = None,
+    fb_spend_url: Optional[str] = None,
+    network_conv_url: Optional[str] = None,
+    database_url: Optional[str] = None,
+    freshness: str = "adaptive",
+    settle_days: int = 7,
+    dedup_exact_limit: int = 100000,
+    dedup_false_positive_rate: float = 0.001,
+    dedup_bloom_capacity: Optional[int] = None,
+    profile: Optional[str] = None,
+    profile_dir: str = "."
+) -> SyncRunStats:
+    db = _get_database(database_url)
+    profiler = create_profiler(profile, db.engine, profile_dir) if profile else None
+    api_data_source = ApiDataSource(fb_spend_url=fb_spend_url, network_conv_url=network_conv_url)
     logger.info("Запуск программы синхронизации данных.")
+    if worker_id:
+        logger.info(f"Параллельный режим: воркер {worker_id}, аренда дат на {lease_seconds} с.")
     if start_date and end_date:
         logger.info(f"Диапазон дат: з {start_date.isoformat()} по {end_date.isoformat()}.")
     elif start_date:
@@ -31,29 +78,379 @@ def run(start_date: Optional[datetime.date] = None, end_date: Optional[datetime.
     else:
         logger.info("Диапазон дат не указано (будут учтены все доступные даты, требующие обновления).")
 
-    with database.get_db() as db_session:
-        db_crud = DailyStatsCRUD(db_session)
-        update_crud = LastUpdateTimeCRUD(db_session)
-        data_loader = DataLoader(api_data_source, db_crud, update_crud)
+    change_sink = ChangeSegmentSink(changes_dir) if changes_dir else None
+    writer = BatchedStatsWriter(
+        db.SessionLocal,
+        batch_size=write_batch_size,
+        max_batch_age=write_batch_age,
+        change_sink=change_sink
+    )
+    lease_keeper = LeaseKeeper(db.SessionLocal, worker_id, lease_seconds=lease_seconds) if worker_id else None
+    with profiler.profile() if profiler else nullcontext(), db.get_db() as db_session, \
+            lease_keeper or nullcontext():
+        # Писатель закрывается первым: дожидаемся последнего пакета и отметок LastUpdateTime,
+        # аренда дат продлевается до их применения
+        with writer:
+            db_crud = DailyStatsCRUD(db_session, change_sink=change_sink)
+            update_crud = LastUpdateTimeCRUD(db_session)
+            data_loader = DataLoader(
+                api_data_source,
+                db_crud,
+                update_crud,
+                lease_owner=worker_id,
+                lease_seconds=lease_seconds,
+                claim_batch_size=claim_batch_size,
+                writer=writer,
+                freshness_policy=_get_freshness_policy(freshness, settle_days),
+                dedup_exact_limit=dedup_exact_limit,
+                dedup_false_positive_rate=dedup_false_positive_rate,
+                dedup_bloom_capacity=dedup_bloom_capacity,
+                archive_crud=ArchiveCRUD(db_session),
+                profiler=profiler,
+                lease_keeper=lease_keeper
+            )
 
-        data_loader.process_daily_stats(start_date=start_date, end_date=end_date)
+            stats = data_loader.process_daily_stats(start_date=start_date, end_date=end_date)
+            if profiler:
+                profiler.on_stage_start("write_drain")
+            drain_started = time.perf_counter()
+        stats.stage_seconds["write_drain"] = time.perf_counter() - drain_started
+        if profiler:
+            profiler.on_stage_end("write_drain")
+        stats.rows_written = writer.rows_written
+        stats.write_seconds = writer.write_seconds
 
+    stages = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in stats.stage_seconds.items())
+    logger.info(f"Этапы: {stages}. Записано строк: {stats.rows_written}.")
     logger.info("Завершение работы.")
+    return stats
+
+
+def export(
+    output_path: str,
+    fmt: str = "csv",
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+    campaign_ids: Optional[List[str]] = None,
+    compress: bool = False,
+    database_url: Optional[str] = None
+):
+    logger.info(f"Экспорт daily_stats в {output_path} (формат: {fmt}, gzip: {compress}).")
+    with _get_database(database_url).get_db() as db_session:
+        exporter = DailyStatsExporter(DailyStatsCRUD(db_session))
+        exporter.export(
+            output_path,
+            fmt=fmt,
+            start_date=start_date,
+            end_date=end_date,
+            campaign_ids=campaign_ids,
+            compress=compress
+        )
+
+
+def changes(
+    since_seq: int = 0,
+    batch_size: int = 1000,
+    compact_upto: Optional[int] = None,
+    changes_dir: Optional[str] = None,
+    database_url: Optional[str] = None
+):
+    """Выводит в stdout (NDJSON) изменения DailyStats с seq > since_seq и при необходимости компактирует ленту."""
+    with _get_database(database_url).get_db() as db_session:
+        change_crud = DailyStatsChangeCRUD(db_session)
+        count = 0
+        for batch in change_crud.iter_changes(since_seq, batch_size=batch_size):
+            for record in batch:
+                sys.stdout.write(change_record_to_json(record) + "\n")
+            count += len(batch)
+        logger.info(f"Выведено {count} изменений после seq={since_seq}.")
+
+        if compact_upto is not None:
+            change_crud.compact(compact_upto)
+            if changes_dir:
+                ChangeSegmentSink(changes_dir).compact(compact_upto)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8080, cache_size: int = 256, database_url: Optional[str] = None):
+    server = create_server(_get_database(database_url), host=host, port=port, cache_size=cache_size)
+    logger.info(f"HTTP-сервис запросов к DailyStats слушает http://{host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info("Сервис остановлен.")
+
+
+def maintain(
+    retention_days: int = 365,
+    max_days: Optional[int] = None,
+    full_vacuum: bool = False,
+    database_url: Optional[str] = None
+):
+    """Переносит даты старше retention_days в помесячные архивные таблицы, затем VACUUM/ANALYZE."""
+    archiver = DailyStatsArchiver(_get_database(database_url), retention_days=retention_days)
+    return archiver.run(max_days=max_days, full_vacuum=full_vacuum)
+
+
+def _parse_date(s: str) -> datetime.date:
+    return datetime.datetime.strptime(s, "%Y-%m-%d").date()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Скрипт для синхронизации рекламных данных.")
     parser.add_argument(
         "--start-date",
-        type=lambda s: datetime.datetime.strptime(s, "%Y-%m-%d").date(),
+        type=_parse_date,
         help="Начальная дата для загрузки данных (формат: YYYY-MM-DD). Влияет на фильтрацию сырых данных.",
         required=False
     )
     parser.add_argument(
         "--end-date",
-        type=lambda s: datetime.datetime.strptime(s, "%Y-%m-%d").date(),
+        type=_parse_date,
         help="Конечная дата для загрузки данных (формат: YYYY-MM-DD). Влияет на фильтрацию сырых данных.",
         required=False
     )
 
+    parser.add_argument(
+        "--database-url",
+        help="URL базы данных SQLAlchemy (по умолчанию sqlite:///./db.sqlite3).",
+        required=False
+    )
+    parser.add_argument(
+        "--fb-spend-url",
+        help="URL фида расходов (по умолчанию переменная окружения FB_SPEND_URL или mock-сервер).",
+        required=False
+    )
+    parser.add_argument(
+        "--network-conv-url",
+        help="URL фида конверсий (по умолчанию переменная окружения NETWORK_CONV_URL или mock-сервер).",
+        required=False
+    )
+    parser.add_argument(
+        "--worker-id",
+        help="ID воркера для параллельного запуска нескольких экземпляров на одной базе "
+             "(например, hostname-pid). Даты распределяются между воркерами через аренду.",
+        required=False
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=int,
+        default=300,
+        help="Срок аренды даты воркером в секундах."
+    )
+    parser.add_argument(
+        "--claim-batch-size",
+        type=int,
+        default=1,
+        help="Сколько дат воркер арендует за один раз."
+    )
+
+    parser.add_argument(
+        "--write-batch-size",
+        type=int,
+        default=500,
+        help="Размер пакета фоновой записи в базу данных."
+    )
+    parser.add_argument(
+        "--write-batch-age",
+        type=float,
+        default=1.0,
+        help="Максимальное время (в секундах) ожидания неполного пакета записи."
+    )
+
+    parser.add_argument(
+        "--freshness",
+        choices=FRESHNESS_POLICIES,
+        default="adaptive",
+        help="Политика свежести: adaptive — перепроверять только окно поздних данных с подбираемыми "
+             "интервалами; fixed — перезагружать каждую дату раз в 24 часа."
+    )
+    parser.add_argument(
+        "--settle-days",
+        type=int,
+        default=7,
+        help="Через сколько дней данные за дату считаются окончательными и больше не перезагружаются "
+             "(для --freshness adaptive)."
+    )
+
+    parser.add_argument(
+        "--dedup-exact-limit",
+        type=int,
+        default=100000,
+        help="До скольких уникальных строк фида повторы ищутся точным множеством в памяти; "
+             "для больших фидов используется фильтр Блума."
+    )
+    parser.add_argument(
+        "--dedup-false-positive-rate",
+        type=float,
+        default=0.001,
+        help="Доля ложных срабатываний фильтра Блума (они перепроверяются по временной базе на диске)."
+    )
+    parser.add_argument(
+        "--dedup-bloom-capacity",
+        type=int,
+        default=None,
+        help="Ожидаемое число уникальных строк фида: размер первой ступени фильтра Блума. "
+             "По умолчанию — 4 x --dedup-exact-limit; при заполнении фильтр растет ступенями."
+    )
+
+    parser.add_argument(
+        "--profile",
+        choices=PROFILE_MODES,
+        help="Профилировать прогон: cpu — cProfile (pstats и collapsed stacks для flame graph), "
+             "alloc — tracemalloc по этапам, sql — количество и длительность запросов по нормализованному SQL.",
+        required=False
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=".",
+        help="Каталог для отчетов профилирования (по одному на прогон)."
+    )
+
+    parser.add_argument(
+        "--changes-dir",
+        help="Каталог для NDJSON-сегментов ленты изменений DailyStats (по умолчанию только таблица outbox).",
+        required=False
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    export_parser = subparsers.add_parser("export", help="Потоковая выгрузка daily_stats в файл.")
+    export_parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default="csv",
+        help="Формат выгрузки."
+    )
+    export_parser.add_argument(
+        "--from",
+        dest="from_date",
+        type=_parse_date,
+        help="Начальная дата выгрузки (формат: YYYY-MM-DD).",
+        required=False
+    )
+    export_parser.add_argument(
+        "--to",
+        dest="to_date",
+        type=_parse_date,
+        help="Конечная дата выгрузки (формат: YYYY-MM-DD).",
+        required=False
+    )
+    export_parser.add_argument(
+        "--campaign",
+        action="append",
+        help="ID кампании для выгрузки (можно указать несколько раз).",
+        required=False
+    )
+    export_parser.add_argument(
+        "--output",
+        default="-",
+        help="Путь к файлу выгрузки ('-' для stdout)."
+    )
+    export_parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Сжимать выгрузку gzip."
+    )
+
+    changes_parser = subparsers.add_parser("changes", help="Чтение ленты изменений DailyStats (NDJSON в stdout).")
+    changes_parser.add_argument(
+        "--since",
+        type=int,
+        default=0,
+        help="Последний обработанный потребителем seq; выводятся изменения после него."
+    )
+    changes_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1000,
+        help="Размер пакета чтения из outbox."
+    )
+    changes_parser.add_argument(
+        "--compact-upto",
+        type=int,
+        help="Удалить из outbox (и из --changes-dir) изменения с seq не больше указанного.",
+        required=False
+    )
+
+    serve_parser = subparsers.add_parser("serve", help="HTTP-сервис запросов к DailyStats только для чтения.")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Адрес для прослушивания.")
+    serve_parser.add_argument("--port", type=int, default=8080, help="Порт для прослушивания.")
+    serve_parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        help="Максимальное количество закэшированных ответов."
+    )
+
+    maintain_parser = subparsers.add_parser(
+        "maintain", help="Перенос старых дат в помесячные архивные таблицы, VACUUM и ANALYZE."
+    )
+    maintain_parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=365,
+        help="Сколько последних дней оставлять в daily_stats; более старые переносятся в архив."
+    )
+    maintain_parser.add_argument(
+        "--max-days",
+        type=int,
+        help="Перенести не больше указанного количества дат за запуск (остальные — при следующем).",
+        required=False
+    )
+    maintain_parser.add_argument(
+        "--full-vacuum",
+        action="store_true",
+        help="Полный VACUUM с переключением SQLite в auto_vacuum=INCREMENTAL (однократно для старых баз)."
+    )
+
     args = parser.parse_args()
-    run(start_date=args.start_date, end_date=args.end_date)
+    if args.command == "maintain":
+        maintain(
+            retention_days=args.retention_days,
+            max_days=args.max_days,
+            full_vacuum=args.full_vacuum,
+            database_url=args.database_url
+        )
+    elif args.command == "serve":
+        serve(host=args.host, port=args.port, cache_size=args.cache_size, database_url=args.database_url)
+    elif args.command == "changes":
+        changes(
+            since_seq=args.since,
+            batch_size=args.batch_size,
+            compact_upto=args.compact_upto,
+            changes_dir=args.changes_dir,
+            database_url=args.database_url
+        )
+    elif args.command == "export":
+        export(
+            args.output,
+            fmt=args.format,
+            start_date=args.from_date,
+            end_date=args.to_date,
+            campaign_ids=args.campaign,
+            compress=args.gzip,
+            database_url=args.database_url
+        )
+    else:
+        run(
+            start_date=args.start_date,
+            end_date=args.end_date,
+            worker_id=args.worker_id,
+            lease_seconds=args.lease_seconds,
+            claim_batch_size=args.claim_batch_size,
+            write_batch_size=args.write_batch_size,
+            write_batch_age=args.write_batch_age,
+            changes_dir=args.changes_dir,
+            fb_spend_url=args.fb_spend_url,
+            network_conv_url=args.network_conv_url,
+            database_url=args.database_url,
+            freshness=args.freshness,
+            settle_days=args.settle_days,
+            dedup_exact_limit=args.dedup_exact_limit,
+            dedup_false_positive_rate=args.dedup_false_positive_rate,
+            dedup_bloom_capacity=args.dedup_bloom_capacity,
+            profile=args.profile,
+            profile_dir=args.profile_dir
+        )
@@ -0,0 +1,27 @@
+from typing import Callable
+
+import pytest
+
+from app.db import Database
+from app.models import Base
+
+
+@pytest.fixture
+def make_db(tmp_path) -> Callable[..., Database]:
+    """
+    Фабрика файловых баз SQLite во временном каталоге теста.
+    make_db(name, create_tables=False) создает базу без таблиц.
+    """
+    def make(name: str = "test", create_tables: bool = True) -> Database:
+        db = Database(f"sqlite:///{tmp_path / f'{name}.sqlite3'}")
+        if create_tables:
+            Base.metadata.create_all(db.engine)
+        return db
+
+    return make
+
+
+@pytest.fixture
+def db(make_db) -> Database:
+    """Пустая база со всеми таблицами. Модули с тестовыми данными расширяют ее своим фикстуром db(db)."""
+    return make_db()
@@ -0,0 +1,40 @@
+from app.api import ApiDataSource
+from benchmarks.fake_upstream import FakeUpstreamConfig, FakeUpstreamServer
+
+
+def _source(upstream, **kwargs):
+    return ApiDataSource(upstream.fb_spend_url, upstream.network_conv_url, retry_backoff=0, **kwargs)
+
+
+class TestApiDataSource:
+    def test_pagination(self):
+        """Тест сборки фида из нескольких страниц."""
+        config = FakeUpstreamConfig(days=3, campaigns=7, page_size=5)
+        with FakeUpstreamServer(config) as upstream:
+            spend = _source(upstream).fetch_fb_spend_data()
+        assert len(spend) == 21
+        assert upstream.requests == 5
+        assert spend[0].campaign_id == "CAMP-0" and spend[-1].date == "2025-01-03"
+
+    def test_retries_on_server_errors(self):
+        """Тест повторов при ответах 503."""
+        config = FakeUpstreamConfig(days=2, campaigns=10, page_size=4, error_rate=0.3)
+        with FakeUpstreamServer(config) as upstream:
+            conversions = _source(upstream, max_retries=10).fetch_network_conversions_data()
+        assert len(conversions) == 20
+        assert upstream.requests > 5
+
+    def test_gives_up_after_retries(self):
+        """Тест, что при исчерпании повторов возвращается пустой список, а не часть фида."""
+        config = FakeUpstreamConfig(days=2, campaigns=10, page_size=4, error_rate=1.0)
+        with FakeUpstreamServer(config) as upstream:
+            assert _source(upstream, max_retries=1).fetch_fb_spend_data() == []
+        assert upstream.requests == 2
+
+    def test_urls_from_environment(self, monkeypatch):
+        """Тест получения адресов upstream из переменных окружения."""
+        monkeypatch.setenv("FB_SPEND_URL", "http://upstream.local/fb")
+        monkeypatch.setenv("NETWORK_CONV_URL", "http://upstream.local/conv")
+        source = ApiDataSource()
+        assert source.fb_spend_url == "http://upstream.local/fb"
+        assert source.network_conv_url == "http://upstream.local/conv"
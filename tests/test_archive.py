@@ -0,0 +1,174 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+from app.archive import DailyStatsArchiver
+from app.crud import ArchiveCRUD, ArchivedDateError, DailyStatsCRUD, LastUpdateTimeCRUD
+from app.data_loader import DataLoader
+from app.data_models import CombinedDailyStatData, ConversionEntry, SpendEntry
+from app.models import DailyStats, LastUpdateTime
+
+START = date(2025, 1, 1)
+DATES = [START + timedelta(days=i) for i in range(90)]  # 2025-01-01 .. 2025-03-31
+
+
+@pytest.fixture
+def db(db):
+    with db.get_db() as session:
+        DailyStatsCRUD(session).bulk_upsert_daily_stats([
+            CombinedDailyStatData(date=d, campaign_id=f"CAMP-{n}", spend=1.0 + i + n, conversions=(i + n) % 4,
+                                  cpa=(1.0 + i + n) / ((i + n) % 4) if (i + n) % 4 else None)
+            for i, d in enumerate(DATES) for n in range(3)
+        ])
+        for d in DATES:
+            session.add(LastUpdateTime(date=d, last_updated_at=datetime(2025, 4, 1), is_complete=True))
+        session.commit()
+    return db
+
+
+def _archiver(db, **kwargs):
+    # Горизонт 2025-03-01: январь и февраль уходят в архив
+    return DailyStatsArchiver(db, retention_days=30, pause_seconds=0, clock=lambda: datetime(2025, 3, 31, 12), **kwargs)
+
+
+def _reads(db):
+    with db.get_db() as session:
+        crud = DailyStatsCRUD(session)
+        return {
+            "totals": [tuple(crud.get_totals(s, e)) for s, e in [
+                (None, None), (date(2025, 1, 1), date(2025, 2, 28)), (date(2025, 1, 15), date(2025, 3, 10))]],
+            "top": [tuple(row) for row in crud.get_top_campaigns(date(2025, 1, 10), date(2025, 3, 5), order_by="cpa")],
+            "series": [tuple(row) for row in crud.get_campaign_series("CAMP-1", date(2025, 2, 20), date(2025, 3, 3))],
+            "export": [tuple(row) for row in crud.iter_daily_stats_rows(date(2025, 1, 30), date(2025, 3, 2))]
+        }
+
+
+def _assert_same_reads(after, before):
+    for key in before:
+        assert len(after[key]) == len(before[key]), key
+        for row_after, row_before in zip(after[key], before[key]):
+            assert row_after == pytest.approx(row_before), key
+
+
+class TestDailyStatsArchiver:
+    def test_archive_is_resumable_and_reads_are_routed(self, db):
+        """Тест поэтапного переноса в архив и прозрачного чтения из архивных партиций."""
+        before = _reads(db)
+
+        stats = _archiver(db).archive(max_days=20)
+        assert (stats.days_archived, stats.rows_archived, stats.archived_through) == (20, 60, date(2025, 1, 20))
+        _assert_same_reads(_reads(db), before)
+
+        stats = _archiver(db).run()
+        assert (stats.days_archived, stats.archived_through) == (39, date(2025, 2, 28))
+        assert _archiver(db).archive().days_archived == 0
+
+        with db.get_db() as session:
+            assert session.query(DailyStats).filter(DailyStats.date < date(2025, 3, 1)).count() == 0
+            assert session.query(LastUpdateTime).count() == 31
+            partitions = ArchiveCRUD(session).get_partitions()
+            assert [(p.table_name, p.row_count) for p in partitions] == [
+                ("daily_stats_archive_202501", 93), ("daily_stats_archive_202502", 84)]
+            assert session.execute(text("SELECT count(*) FROM daily_stats_monthly")).scalar() == 6
+
+        _assert_same_reads(_reads(db), before)
+
+    def test_archived_dates_are_read_only(self, db):
+        """Тест, что точечное чтение идет в архив, а запись за архивную дату не создает второй живой строки."""
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session)
+            expected = crud.get_daily_stat(date(2025, 1, 5), "CAMP-1")
+            expected = (expected.spend, expected.conversions, expected.cpa)
+        before = _reads(db)
+        _archiver(db).archive()
+
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session)
+            archived = crud.get_daily_stat(date(2025, 1, 5), "CAMP-1")
+            assert (archived.spend, archived.conversions, archived.cpa) == expected
+            assert archived.campaign_id == "CAMP-1"
+            assert crud.get_daily_stat(date(2025, 1, 5), "CAMP-9") is None
+
+            with pytest.raises(ArchivedDateError):
+                crud.upsert_daily_stat(date(2025, 1, 5), "CAMP-1", 100.0, 1, 100.0)
+            # Пакет фонового писателя: архивная строка отбрасывается, живая записывается
+            assert crud.bulk_upsert_daily_stats([
+                CombinedDailyStatData(date=date(2025, 1, 5), campaign_id="CAMP-1", spend=100.0, conversions=1, cpa=100.0),
+                CombinedDailyStatData(date=date(2025, 3, 31), campaign_id="CAMP-1", spend=5.0, conversions=1, cpa=5.0),
+            ]) == 1
+            assert session.query(DailyStats).filter(DailyStats.date < date(2025, 3, 1)).count() == 0
+            assert len(crud.get_campaign_series("CAMP-1", date(2025, 1, 5), date(2025, 1, 5))) == 1
+
+        after = _reads(db)
+        _assert_same_reads({"totals": after["totals"][1:2]}, {"totals": before["totals"][1:2]})
+
+    def test_upsert_reads_archive_watermark_once(self, db):
+        """Тест, что одиночный upsert читает границу архива одним запросом."""
+        _archiver(db).archive()
+        watermark_queries = []
+
+        def count_watermark_queries(conn, cursor, statement, parameters, context, executemany):
+            if "max(archive_partitions.archived_through)" in statement:
+                watermark_queries.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_watermark_queries)
+        try:
+            with db.get_db() as session:
+                crud = DailyStatsCRUD(session)
+                crud.upsert_daily_stat(date(2025, 3, 10), "CAMP-1", 50.0, 5, 10.0)
+                crud.upsert_daily_stat(date(2025, 3, 10), "CAMP-7", 50.0, 5, 10.0)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_watermark_queries)
+
+        assert len(watermark_queries) == 2
+
+    def test_live_row_left_by_race_is_not_double_counted(self, db):
+        """Тест, что строка, попавшая в daily_stats после архивации даты, не удваивает итоги и вливается в архив."""
+        _archiver(db).archive()
+        before = _reads(db)
+        with db.get_db() as session:
+            key = DailyStatsCRUD(session).resolve_campaign_keys(["CAMP-1"])["CAMP-1"]
+            session.execute(text(
+                "INSERT INTO daily_stats (date, campaign_key, spend, conversions, cpa) "
+                "VALUES ('2025-01-15', :key, 999.0, 1, 999.0)"), {"key": key})
+            session.commit()
+        _assert_same_reads(_reads(db), before)
+
+        _archiver(db).archive()
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session)
+            assert session.query(DailyStats).filter(DailyStats.date < date(2025, 3, 1)).count() == 0
+            assert crud.get_daily_stat(date(2025, 1, 15), "CAMP-1").spend == 999.0
+            series = crud.get_campaign_series("CAMP-1", date(2025, 1, 15), date(2025, 1, 15))
+            assert [row.spend for row in series] == [999.0]
+
+    def test_loader_skips_archived_dates(self, db):
+        """Тест, что синк не загружает даты, уже перенесенные в архив."""
+        _archiver(db).archive()
+
+        class Api:
+            def fetch_fb_spend_data(self):
+                return [SpendEntry(date=d, campaign_id="CAMP-0", spend=100.0) for d in ("2025-01-05", "2025-03-05")]
+
+            def fetch_network_conversions_data(self):
+                return [ConversionEntry(date="2025-01-05", campaign_id="CAMP-0", conversions=1)]
+
+        with db.get_db() as session:
+            loader = DataLoader(Api(), DailyStatsCRUD(session), LastUpdateTimeCRUD(session),
+                                archive_crud=ArchiveCRUD(session))
+            stats = loader.process_daily_stats()
+            assert stats.dates_processed == 1
+            assert session.query(DailyStats).filter(DailyStats.date == date(2025, 1, 5)).count() == 0
+
+    def test_vacuum_and_analyze(self, db):
+        """Тест incremental_vacuum и ANALYZE после переноса в архив."""
+        with db.engine.connect() as connection:
+            assert connection.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+        _archiver(db).archive()
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("DROP TABLE daily_stats_archive_202501")
+        stats = _archiver(db).vacuum()
+        assert stats.pages_freed > 0
+        with db.engine.connect() as connection:
+            assert connection.exec_driver_sql("SELECT count(*) FROM sqlite_stat1").scalar() > 0
@@ -0,0 +1,119 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+
+from app.changefeed import ChangeSegmentSink
+from app.crud import DailyStatsChangeCRUD, DailyStatsCRUD
+from app.data_models import CombinedDailyStatData
+
+
+def _stat(campaign_id: str, spend: float, conversions: int) -> CombinedDailyStatData:
+    return CombinedDailyStatData(
+        date=date(2025, 6, 4),
+        campaign_id=campaign_id,
+        spend=spend,
+        conversions=conversions,
+        cpa=spend / conversions if conversions > 0 else None
+    )
+
+
+class TestChangeFeed:
+    def test_bulk_upsert_records_only_real_changes(self, db):
+        """Тест, что в outbox попадают только новые и изменившиеся строки со старыми и новыми значениями."""
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session)
+            assert crud.bulk_upsert_daily_stats([_stat("CAMP-1", 10.0, 2), _stat("CAMP-2", 5.0, 0)]) == 2
+            # CAMP-1 не изменилась, CAMP-2 изменилась
+            assert crud.bulk_upsert_daily_stats([_stat("CAMP-1", 10.0, 2), _stat("CAMP-2", 6.0, 3)]) == 1
+
+            changes = DailyStatsChangeCRUD(session).read_changes()
+            assert [(c.seq, c.campaign_id) for c in changes] == [(1, "CAMP-1"), (2, "CAMP-2"), (3, "CAMP-2")]
+            assert changes[0].old_spend is None and changes[0].new_spend == 10.0
+            last = changes[-1]
+            assert (last.old_spend, last.new_spend) == (5.0, 6.0)
+            assert (last.old_conversions, last.new_conversions) == (0, 3)
+            assert (last.old_cpa, last.new_cpa) == (None, 2.0)
+
+    def test_single_upsert_records_changes(self, db):
+        """Тест, что upsert_daily_stat тоже пишет outbox и не пишет его для неизменившейся строки."""
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session)
+            crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-1", 10.0, 2, 5.0)
+            crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-1", 10.0, 2, 5.0)
+            crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-1", 12.0, 2, 6.0)
+
+            changes = DailyStatsChangeCRUD(session).read_changes()
+            assert [(c.old_spend, c.new_spend) for c in changes] == [(None, 10.0), (10.0, 12.0)]
+
+    def test_cursor_batches_and_compaction(self, db):
+        """Тест курсора по seq и компакции: seq остается монотонным после удаления прочитанного."""
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session)
+            crud.bulk_upsert_daily_stats([_stat(f"CAMP-{n}", 1.0, 1) for n in range(5)])
+            change_crud = DailyStatsChangeCRUD(session)
+
+            batches = list(change_crud.iter_changes(since_seq=1, batch_size=2))
+            assert [[c.seq for c in batch] for batch in batches] == [[2, 3], [4, 5]]
+
+            assert change_crud.compact(upto_seq=5) == 5
+            crud.bulk_upsert_daily_stats([_stat("CAMP-0", 2.0, 1)])
+            assert [c.seq for c in change_crud.read_changes(since_seq=5)] == [6]
+            assert change_crud.get_last_seq() == 6
+
+    def test_segment_sink(self, db, tmp_path):
+        """Тест NDJSON-сегментов: один сегмент на транзакцию, чтение после seq и удаление прочитанных."""
+        sink = ChangeSegmentSink(str(tmp_path / "changes"))
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session, change_sink=sink)
+            crud.bulk_upsert_daily_stats([_stat("CAMP-1", 1.0, 1), _stat("CAMP-2", 1.0, 1)])
+            crud.bulk_upsert_daily_stats([_stat("CAMP-1", 3.0, 1)])
+
+        assert [(first, last) for first, last, _ in sink.segments()] == [(1, 2), (3, 3)]
+        records = list(sink.read_since(1))
+        assert [(r.seq, r.campaign_id, r.old_spend, r.new_spend) for r in records] == [
+            (2, "CAMP-2", None, 1.0),
+            (3, "CAMP-1", 1.0, 3.0),
+        ]
+        assert records[0].date == date(2025, 6, 4)
+
+        assert sink.compact(upto_seq=2) == 1
+        assert [(first, last) for first, last, _ in sink.segments()] == [(3, 3)]
+
+    def test_outbox_insert_is_batched(self, db, tmp_path):
+        """Тест, что outbox пишется пакетом, а не запросом на строку, и seq в ленте совпадают с базой."""
+        executions = []
+
+        def count_outbox_inserts(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO daily_stats_changes"):
+                executions.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_outbox_inserts)
+        sink = ChangeSegmentSink(str(tmp_path / "changes"))
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session, change_sink=sink)
+            crud.bulk_upsert_daily_stats([_stat("CAMP-0", 1.0, 1)])
+            crud.bulk_upsert_daily_stats([_stat(f"CAMP-{n}", 2.0, 1) for n in range(1200)])
+            stored = [(c.seq, c.campaign_id, c.new_spend) for c in DailyStatsChangeCRUD(session).read_changes(limit=2000)]
+        event.remove(db.engine, "before_cursor_execute", count_outbox_inserts)
+
+        # По одному INSERT на транзакцию bulk_upsert_daily_stats
+        assert len(executions) == 2
+        assert len(stored) == 1201
+        assert [(r.seq, r.campaign_id, r.new_spend) for r in sink.read_since(0)] == stored
+
+    @pytest.mark.parametrize("dialect_name, returning", [("sqlite", True), ("other", True), ("other", False)])
+    def test_outbox_seqs_match_rows_for_every_dialect_path(self, db, tmp_path, monkeypatch, dialect_name, returning):
+        """Тест, что seq в ленте совпадают с базой в ветках SQLite, INSERT ... RETURNING и построчной вставки."""
+        # Ветки других диалектов проверяются на SQLite, подменив признаки диалекта
+        monkeypatch.setattr(db.engine.dialect, "name", dialect_name)
+        monkeypatch.setattr(db.engine.dialect, "insert_executemany_returning_sort_by_parameter_order", returning)
+        sink = ChangeSegmentSink(str(tmp_path / "changes"))
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session, change_sink=sink)
+            crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-2", 1.0, 1, 1.0)
+            crud.bulk_upsert_daily_stats([_stat(f"CAMP-{n}", 2.0 + n, 1) for n in range(5)])
+            stored = [(c.seq, c.campaign_id, c.new_spend) for c in DailyStatsChangeCRUD(session).read_changes()]
+
+        assert [campaign_id for _, campaign_id, _ in stored] == ["CAMP-2"] + [f"CAMP-{n}" for n in range(5)]
+        assert [(r.seq, r.campaign_id, r.new_spend) for r in sink.read_since(0)] == stored
@@ -0,0 +1,81 @@
+from datetime import date
+
+from sqlalchemy import event, select
+
+from app.crud import CampaignCRUD, DailyStatsCRUD
+from app.data_models import CombinedDailyStatData
+from app.models import Campaign, DailyStats
+
+
+class TestCampaignCRUD:
+    def test_resolve_campaign_keys_creates_missing_in_bulk(self, db):
+        """Тест пакетного создания кампаний: недостающие создаются, существующие переиспользуются."""
+        with db.get_db() as session:
+            crud = CampaignCRUD(session)
+            first = crud.resolve_campaign_keys(["CAMP-1", "CAMP-2"])
+            second = CampaignCRUD(session).resolve_campaign_keys(["CAMP-2", "CAMP-3"])
+
+            assert second["CAMP-2"] == first["CAMP-2"]
+            assert len({first["CAMP-1"], first["CAMP-2"], second["CAMP-3"]}) == 3
+            assert session.execute(select(Campaign.campaign_id)).scalars().all() == ["CAMP-1", "CAMP-2", "CAMP-3"]
+
+    def test_resolved_keys_are_served_from_cache(self, db):
+        """Тест, что повторное разрешение ключей не обращается к базе данных."""
+        statements = []
+        event.listen(db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+        with db.get_db() as session:
+            crud = CampaignCRUD(session)
+            crud.resolve_campaign_keys(["CAMP-1", "CAMP-2"])
+            statements.clear()
+
+            assert crud.get_campaign_key("CAMP-1") is not None
+            crud.resolve_campaign_keys(["CAMP-2"])
+            assert statements == []
+
+    def test_get_campaign_key_unknown(self, db):
+        """Тест, что для неизвестной кампании ключ не создается."""
+        with db.get_db() as session:
+            assert CampaignCRUD(session).get_campaign_key("CAMP-404") is None
+            assert session.execute(select(Campaign)).first() is None
+
+
+class TestDailyStatsCRUD:
+    def test_upsert_accepts_string_campaign_ids(self, db):
+        """Тест, что CRUD по-прежнему работает со строковыми ID кампаний."""
+        with db.get_db() as session:
+            crud = DailyStatsCRUD(session)
+            crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-123", 37.5, 14, 37.5 / 14)
+            updated = crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-123", 40.0, 16, 2.5)
+
+            assert updated.campaign_id == "CAMP-123"
+            assert crud.get_daily_stat(date(2025, 6, 4), "CAMP-123").spend == 40.0
+            assert crud.get_daily_stat(date(2025, 6, 4), "CAMP-404") is None
+            assert session.query(DailyStats).count() == 1
+
+    def test_bulk_upsert_is_one_statement(self, db):
+        """Тест, что пакет любого размера записывается одним оператором INSERT ... ON CONFLICT."""
+        upserts = []
+
+        def count_upserts(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO daily_stats "):
+                upserts.append(len(parameters) if executemany else 1)
+
+        items = [
+            CombinedDailyStatData(date=date(2025, 6, 4), campaign_id=f"CAMP-{n}", spend=1.0 + n, conversions=1, cpa=None)
+            for n in range(1200)
+        ]
+        event.listen(db.engine, "after_cursor_execute", count_upserts)
+        try:
+            with db.get_db() as session:
+                crud = DailyStatsCRUD(session)
+                assert crud.bulk_upsert_daily_stats(items) == 1200
+                items[7] = CombinedDailyStatData(date=date(2025, 6, 4), campaign_id="CAMP-7", spend=99.0, conversions=2, cpa=49.5)
+                assert crud.bulk_upsert_daily_stats(items) == 1
+        finally:
+            event.remove(db.engine, "after_cursor_execute", count_upserts)
+
+        assert upserts == [1200, 1]
+        with db.get_db() as session:
+            assert session.query(DailyStats).count() == 1200
+            assert DailyStatsCRUD(session).get_daily_stat(date(2025, 6, 4), "CAMP-7").spend == 99.0
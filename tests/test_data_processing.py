@@ -39,6 +39,17 @@ class MockDailyStatsCRUD:
     def __init__(self, db_session=None):
         # Хранилище для данных, которые были бы "вставлены или обновлены" в БД
         self.upserted_data = []
+        self.resolved_campaign_ids = set()
+
+    def resolve_campaign_keys(self, campaign_ids):
+        self.resolved_campaign_ids.update(campaign_ids)
+        return {cid: i for i, cid in enumerate(sorted(self.resolved_campaign_ids), start=1)}
+
+    def get_daily_values(self, dates):
+        return {
+            (item["date"], item["campaign_id"]): (item["spend"], item["conversions"], item["cpa"])
+            for item in self.upserted_data if item["date"] in dates
+        }
 
     def upsert_daily_stat(self, record_date, campaign_id, spend, conversions, cpa):
         # Имитируем логику upsert: если запись уже есть, обновляем, иначе добавляем.
@@ -117,6 +128,8 @@ def test_cpa_calculation_and_merge_all_data():
     }
 
     assert len(upserted_data) == len(expected_results)
+    # Ключи всех кампаний запрошены одним пакетом перед сохранением
+    assert mock_db_crud.resolved_campaign_ids == {campaign_id for _, campaign_id in expected_results}
 
     for item in upserted_data:
         key = (item["date"], item["campaign_id"])
@@ -202,7 +215,7 @@ def test_data_reprocessing_if_outdated():
     mock_update_crud = MockLastUpdateTimeCRUD()
 
     # Устанавливаем, что данные за 2025-06-04 были загружены, но ОЧЕНЬ давно
-    outdated_time = datetime.now() - timedelta(hours=25)  # 25 часов назад
+    outdated_time = datetime.utcnow() - timedelta(hours=25)  # 25 часов назад
     mock_update_crud.update_info[date(2025, 6, 4)] = type('LastUpdateTimeMock', (object,), {
         'date': date(2025, 6, 4),
         'last_updated_at': outdated_time,
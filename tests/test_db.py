@@ -1,6 +1,10 @@
+import threading
+import time
 from unittest.mock import MagicMock, patch
 from sqlalchemy.orm import Session
 
+import app.db
+
 from app.db import Database, database
 
 
@@ -43,6 +47,35 @@ class TestDatabase:
         mock_SessionLocal.assert_called_once()
         mock_session_instance.close.assert_called_once()
 
+    def test_read_only_engine_is_created_once_under_concurrency(self, tmp_path):
+        """Тест, что параллельные первые запросы получают один и тот же пул только для чтения."""
+        db = Database(f"sqlite:///{tmp_path / 'read_only.sqlite3'}")
+        original_create_engine = app.db.create_engine
+        created = []
+
+        def slow_create_engine(*args, **kwargs):
+            time.sleep(0.05)  # расширяем окно гонки
+            engine = original_create_engine(*args, **kwargs)
+            created.append(engine)
+            return engine
+
+        barrier = threading.Barrier(8)
+        engines = []
+
+        def first_request():
+            barrier.wait()
+            engines.append(db.get_read_only_engine())
+
+        with patch('app.db.create_engine', side_effect=slow_create_engine):
+            threads = [threading.Thread(target=first_request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert len(created) == 1
+        assert all(engine is created[0] for engine in engines)
+
     def test_global_database_instance_exists(self):
         """Тест, что глобальный экземпляр 'database' существует."""
         # Поскольку 'database = Database()' вызывается при импорте app.db,
@@ -0,0 +1,93 @@
+import os
+from datetime import date
+
+import pytest
+
+from app.data_loader import DataLoader
+from app.data_models import ConversionEntry, SpendEntry
+from app.dedup import BloomFilter, RowDeduplicator, row_fingerprint
+from tests.test_data_processing import MockDailyStatsCRUD, MockLastUpdateTimeCRUD
+
+
+def _spend(n: int, day: int = 4, row_id=None) -> SpendEntry:
+    return SpendEntry(date=f"2025-06-0{day}", campaign_id=f"CAMP-{n % 50}", spend=float(n), row_id=row_id)
+
+
+class TestRowDeduplicator:
+    def test_exact_set(self):
+        """Тест точной дедупликации и подсчета дублей по источникам и датам."""
+        with RowDeduplicator() as deduplicator:
+            assert not deduplicator.is_duplicate("fb_spend", _spend(1))
+            assert deduplicator.is_duplicate("fb_spend", _spend(1))
+            assert not deduplicator.is_duplicate("fb_spend", _spend(1, day=5))
+            assert deduplicator.is_duplicate("fb_spend", _spend(1, day=5))
+            assert deduplicator.is_duplicate("fb_spend", _spend(1))
+            # Та же строка в другом источнике не дубль
+            assert not deduplicator.is_duplicate("other", _spend(1))
+            assert not deduplicator.uses_bloom_filter
+            assert deduplicator.duplicate_counts() == {"fb_spend": {"2025-06-04": 2, "2025-06-05": 1}}
+
+    def test_row_id_takes_precedence(self):
+        """Тест, что при наличии row_id дубли определяются по нему, а не по содержимому."""
+        assert row_fingerprint("fb_spend", _spend(1, row_id="r1")) == row_fingerprint("fb_spend", _spend(2, row_id="r1"))
+        assert row_fingerprint("fb_spend", _spend(1, row_id="r1")) != row_fingerprint("fb_spend", _spend(1, row_id="r2"))
+
+    def test_bloom_filter_mode_is_exact(self, tmp_path):
+        """Тест, что после переключения на фильтр Блума дубли находятся точно, без потери уникальных строк."""
+        with RowDeduplicator(exact_limit=100, false_positive_rate=0.05, bloom_capacity=1000,
+                             spill_dir=str(tmp_path)) as deduplicator:
+            unique = sum(not deduplicator.is_duplicate("fb_spend", _spend(n)) for n in range(5000))
+            duplicates = sum(deduplicator.is_duplicate("fb_spend", _spend(n)) for n in range(0, 5000, 7))
+            assert deduplicator.uses_bloom_filter
+            assert (unique, duplicates) == (5000, 715)
+            # При 5% ложных срабатываний они неизбежны, но все проверены на диске
+            assert deduplicator.false_positives > 0
+            assert len(os.listdir(tmp_path)) == 1
+        assert os.listdir(tmp_path) == []
+
+    def test_bloom_filter_grows_with_feed(self, tmp_path):
+        """Тест, что размер фильтра Блума следует за числом строк, а не фиксирован заранее."""
+        with RowDeduplicator(exact_limit=100, bloom_capacity=500, spill_dir=str(tmp_path)) as deduplicator:
+            for n in range(600):
+                deduplicator.is_duplicate("fb_spend", _spend(n))
+            small = deduplicator.bloom_memory_bytes
+            for n in range(600, 20000):
+                deduplicator.is_duplicate("fb_spend", _spend(n))
+            # Ступени 500, 2000, 8000, 32000 строк
+            assert len(deduplicator._blooms) == 4
+            # ~200 КБ против ~36 МБ у фильтра фиксированного размера на 10 млн строк
+            assert small < deduplicator.bloom_memory_bytes < 256 * 1024
+            assert sum(deduplicator.is_duplicate("fb_spend", _spend(n)) for n in range(0, 20000, 100)) == 200
+            assert deduplicator.duplicate_counts()["fb_spend"]["2025-06-04"] == 200
+
+    def test_bloom_filter_false_positive_rate(self):
+        """Тест, что доля ложных срабатываний фильтра близка к заданной."""
+        bloom = BloomFilter(10000, false_positive_rate=0.01)
+        for n in range(10000):
+            bloom.add(row_fingerprint("a", _spend(n)))
+        assert all(row_fingerprint("a", _spend(n)) in bloom for n in range(10000))
+        false_positives = sum(row_fingerprint("b", _spend(n)) in bloom for n in range(20000))
+        assert false_positives / 20000 < 0.02
+
+
+class DuplicatingApiDataSource:
+    def fetch_fb_spend_data(self):
+        rows = [SpendEntry(date="2025-06-04", campaign_id="CAMP-1", spend=10.0),
+                SpendEntry(date="2025-06-05", campaign_id="CAMP-1", spend=20.0)]
+        return rows + rows[:1]  # повтор строки, например, на следующей странице
+
+    def fetch_network_conversions_data(self):
+        return [ConversionEntry(date="2025-06-04", campaign_id="CAMP-1", conversions=2, row_id="c-1"),
+                ConversionEntry(date="2025-06-04", campaign_id="CAMP-1", conversions=2, row_id="c-1"),
+                ConversionEntry(date="2025-06-04", campaign_id="CAMP-1", conversions=3, row_id="c-2")]
+
+
+def test_data_loader_drops_duplicates():
+    """Тест, что повторные строки фидов не завышают spend и conversions и попадают в статистику."""
+    mock_db_crud = MockDailyStatsCRUD()
+    stats = DataLoader(DuplicatingApiDataSource(), mock_db_crud, MockLastUpdateTimeCRUD()).process_daily_stats()
+
+    stored = {(item["date"], item["campaign_id"]): item for item in mock_db_crud.upserted_data}
+    assert stored[(date(2025, 6, 4), "CAMP-1")]["spend"] == pytest.approx(10.0)
+    assert stored[(date(2025, 6, 4), "CAMP-1")]["conversions"] == 5
+    assert stats.duplicate_rows == {"fb_spend": {"2025-06-04": 1}, "network_conv": {"2025-06-04": 1}}
@@ -0,0 +1,67 @@
+import csv
+import gzip
+import json
+from datetime import date
+
+import pytest
+
+from app.crud import DailyStatsCRUD
+from app.export import DailyStatsExporter
+
+
+@pytest.fixture
+def db_crud(db):
+    with db.get_db() as session:
+        crud = DailyStatsCRUD(session)
+        crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-123", 37.5, 14, 37.5 / 14)
+        crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-456", 19.9, 3, 19.9 / 3)
+        crud.upsert_daily_stat(date(2025, 6, 5), "CAMP-123", 42.1, 10, 4.21)
+        crud.upsert_daily_stat(date(2025, 6, 6), "CAMP-999", 5.25, 0, None)
+        yield crud
+
+
+class TestDailyStatsExporter:
+    def test_iter_daily_stats_rows_filters_and_orders(self, db_crud):
+        """Тест потокового чтения: фильтры по датам и кампаниям, упорядочивание по (date, campaign_id)."""
+        rows = list(db_crud.iter_daily_stats_rows(
+            start_date=date(2025, 6, 4),
+            end_date=date(2025, 6, 5),
+            campaign_ids=["CAMP-123"],
+            batch_size=1
+        ))
+        assert [(r.date, r.campaign_id) for r in rows] == [
+            (date(2025, 6, 4), "CAMP-123"),
+            (date(2025, 6, 5), "CAMP-123"),
+        ]
+        # Строки читаются через Core и не попадают в identity map сессии
+        assert len(db_crud.db.identity_map) == 0
+
+    def test_export_csv(self, db_crud, tmp_path):
+        """Тест выгрузки в CSV: заголовок, все строки, пустое значение для cpa=None."""
+        output = tmp_path / "stats.csv"
+        count = DailyStatsExporter(db_crud, batch_size=2).export(str(output), fmt="csv")
+
+        with open(output, newline="") as f:
+            rows = list(csv.reader(f))
+        assert count == 4
+        assert rows[0] == ["date", "campaign_id", "spend", "conversions", "cpa"]
+        assert rows[-1] == ["2025-06-06", "CAMP-999", "5.25", "0", ""]
+
+    def test_export_ndjson_gzip(self, db_crud, tmp_path):
+        """Тест выгрузки в NDJSON со сжатием gzip."""
+        output = tmp_path / "stats.ndjson.gz"
+        count = DailyStatsExporter(db_crud).export(
+            str(output), fmt="ndjson", start_date=date(2025, 6, 6), compress=True
+        )
+
+        with gzip.open(output, "rt") as f:
+            records = [json.loads(line) for line in f]
+        assert count == 1
+        assert records == [
+            {"date": "2025-06-06", "campaign_id": "CAMP-999", "spend": 5.25, "conversions": 0, "cpa": None}
+        ]
+
+    def test_export_unknown_format(self, db_crud, tmp_path):
+        """Тест, что неизвестный формат приводит к ValueError."""
+        with pytest.raises(ValueError):
+            DailyStatsExporter(db_crud).export(str(tmp_path / "stats.bin"), fmt="parquet")
@@ -0,0 +1,130 @@
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.data_loader import DataLoader
+from app.data_models import ConversionEntry, SpendEntry
+from app.freshness import AdaptiveFreshnessPolicy, FixedIntervalPolicy, FreshnessPolicy
+from app.models import LastUpdateTime
+
+HOUR = 3600
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+def _last_update(updated_at: datetime, is_complete: bool = True, recheck_seconds=None):
+    return SimpleNamespace(last_updated_at=updated_at, is_complete=is_complete, recheck_seconds=recheck_seconds)
+
+
+class TestFreshnessPolicies:
+    def test_fixed_interval(self):
+        """Тест стратегии "раз в 24 часа"."""
+        clock = FakeClock(datetime(2025, 6, 10, 12))
+        policy = FixedIntervalPolicy(clock=clock)
+        assert policy.should_fetch(date(2025, 6, 1), None)
+        assert not policy.should_fetch(date(2025, 6, 1), _last_update(datetime(2025, 6, 10)))
+        assert policy.should_fetch(date(2025, 6, 1), _last_update(datetime(2025, 6, 10), is_complete=False))
+        clock.now += timedelta(days=1)
+        assert policy.should_fetch(date(2025, 6, 1), _last_update(datetime(2025, 6, 10)))
+
+    def test_policies_use_utc_clock(self):
+        """Тест, что политики по умолчанию сравнивают last_updated_at (UTC) с часами в UTC."""
+        assert FixedIntervalPolicy().clock == datetime.utcnow
+        assert AdaptiveFreshnessPolicy().clock == datetime.utcnow
+        with pytest.raises(TypeError):
+            FreshnessPolicy()
+
+    def test_settled_dates_are_immutable(self):
+        """Тест, что дата за пределами окна загружается последний раз и больше не перепроверяется."""
+        clock = FakeClock(datetime(2025, 6, 20, 12))
+        policy = AdaptiveFreshnessPolicy(settle_days=7, clock=clock)
+        record_date = date(2025, 6, 5)  # окончательна с 2025-06-13 00:00
+
+        assert policy.should_fetch(record_date, _last_update(datetime(2025, 6, 12, 23)))
+        assert not policy.should_fetch(record_date, _last_update(datetime(2025, 6, 13, 1)))
+        clock.now += timedelta(days=365)
+        assert not policy.should_fetch(record_date, _last_update(datetime(2025, 6, 13, 1)))
+
+    def test_recheck_interval_inside_window(self):
+        """Тест перепроверки внутри окна по сохраненному интервалу."""
+        clock = FakeClock(datetime(2025, 6, 10, 12))
+        policy = AdaptiveFreshnessPolicy(settle_days=7, initial_interval=6 * HOUR, clock=clock)
+        last_update = _last_update(datetime(2025, 6, 10, 8))
+
+        assert not policy.should_fetch(date(2025, 6, 9), last_update)
+        clock.now += timedelta(hours=2)
+        assert policy.should_fetch(date(2025, 6, 9), last_update)
+
+        last_update.recheck_seconds = 12 * HOUR
+        assert not policy.should_fetch(date(2025, 6, 9), last_update)
+
+    def test_learned_interval(self):
+        """Тест подбора интервала: сокращение при изменениях, рост без них, в заданных пределах."""
+        policy = AdaptiveFreshnessPolicy(initial_interval=6 * HOUR, min_interval=HOUR, max_interval=24 * HOUR)
+        record_date = date(2025, 6, 9)
+        updated_at = datetime(2025, 6, 10)
+
+        assert policy.next_recheck_seconds(record_date, None, changed=True) == 6 * HOUR
+        assert policy.next_recheck_seconds(record_date, _last_update(updated_at), changed=True) == 3 * HOUR
+        assert policy.next_recheck_seconds(record_date, _last_update(updated_at), changed=False) == 12 * HOUR
+        assert policy.next_recheck_seconds(record_date, _last_update(updated_at, recheck_seconds=HOUR), True) == HOUR
+        assert policy.next_recheck_seconds(
+            record_date, _last_update(updated_at, recheck_seconds=20 * HOUR), False
+        ) == 24 * HOUR
+
+
+class MutableApiDataSource:
+    def __init__(self, dates):
+        self.spend = {(d.isoformat(), f"CAMP-{n}"): 10.0 * (n + 1) for d in dates for n in range(2)}
+
+    def fetch_fb_spend_data(self):
+        return [SpendEntry(date=d, campaign_id=c, spend=spend) for (d, c), spend in self.spend.items()]
+
+    def fetch_network_conversions_data(self):
+        return [ConversionEntry(date=d, campaign_id=c, conversions=2) for d, c in self.spend]
+
+
+class TestAdaptiveSync:
+    def test_skip_recheck_and_change_counts(self, db):
+        """Тест счетчиков прогона и сохранения подобранных интервалов перепроверки."""
+        today = datetime.utcnow().date()
+        recent = [today - timedelta(days=1), today - timedelta(days=2)]
+        settled = today - timedelta(days=30)
+        api = MutableApiDataSource(recent + [settled])
+        policy = AdaptiveFreshnessPolicy(settle_days=7, initial_interval=6 * HOUR)
+
+        def sync():
+            with db.get_db() as session:
+                return DataLoader(
+                    api, DailyStatsCRUD(session), LastUpdateTimeCRUD(session), freshness_policy=policy
+                ).process_daily_stats()
+
+        stats = sync()
+        assert (stats.dates_processed, stats.dates_skipped, stats.dates_rechecked) == (3, 0, 0)
+
+        stats = sync()
+        assert (stats.dates_processed, stats.dates_skipped) == (0, 3)
+
+        # Прошло 7 часов, а по одной из недавних дат пришли поздние данные
+        with db.get_db() as session:
+            session.query(LastUpdateTime).filter(LastUpdateTime.date.in_(recent)).update(
+                {"last_updated_at": datetime.utcnow() - timedelta(hours=7)}, synchronize_session=False
+            )
+            session.commit()
+        api.spend[(recent[0].isoformat(), "CAMP-0")] = 99.0
+
+        stats = sync()
+        assert (stats.dates_skipped, stats.dates_rechecked, stats.dates_changed) == (1, 2, 1)
+        with db.get_db() as session:
+            update_crud = LastUpdateTimeCRUD(session)
+            assert update_crud.get_last_update_info(recent[0]).recheck_seconds == 3 * HOUR
+            assert update_crud.get_last_update_info(recent[1]).recheck_seconds == 12 * HOUR
+            assert DailyStatsCRUD(session).get_daily_stat(recent[0], "CAMP-0").spend == 99.0
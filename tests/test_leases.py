@@ -0,0 +1,197 @@
+import multiprocessing
+import queue
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+import pytest
+from sqlalchemy import event
+
+from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.data_loader import DataLoader
+from app.data_models import SpendEntry, ConversionEntry
+from app.db import Database
+from app.leases import LeaseKeeper
+from app.models import DailyStats, LastUpdateTime
+from app.writer import BatchedStatsWriter
+
+DATES = [date(2025, 6, 1) + timedelta(days=i) for i in range(12)]
+
+
+class SyntheticApiDataSource:
+    """Источник данных: по две кампании на каждую дату из DATES."""
+
+    def fetch_fb_spend_data(self) -> List[SpendEntry]:
+        return [
+            SpendEntry(date=d.isoformat(), campaign_id=f"CAMP-{n}", spend=10.0 * (n + 1))
+            for d in DATES for n in range(2)
+        ]
+
+    def fetch_network_conversions_data(self) -> List[ConversionEntry]:
+        return [
+            ConversionEntry(date=d.isoformat(), campaign_id=f"CAMP-{n}", conversions=n + 1)
+            for d in DATES for n in range(2)
+        ]
+
+
+class RecordingLastUpdateTimeCRUD(LastUpdateTimeCRUD):
+    """Отправляет в очередь каждую успешно арендованную дату."""
+
+    def __init__(self, db_session, claims_queue, worker_id):
+        super().__init__(db_session)
+        self.claims_queue = claims_queue
+        self.worker_id = worker_id
+
+    def claim_dates(self, *args, **kwargs):
+        claimed = super().claim_dates(*args, **kwargs)
+        for claimed_date in claimed:
+            self.claims_queue.put((self.worker_id, claimed_date))
+        return claimed
+
+
+def _run_worker(database_url, worker_id, barrier, claims_queue):
+    db = Database(database_url)
+    barrier.wait()
+    with db.get_db() as session:
+        DataLoader(
+            SyntheticApiDataSource(),
+            DailyStatsCRUD(session),
+            RecordingLastUpdateTimeCRUD(session, claims_queue, worker_id),
+            lease_owner=worker_id
+        ).process_daily_stats()
+
+
+@pytest.fixture
+def database_url(db):
+    # Воркеры в отдельных процессах открывают базу по URL
+    return db.database_url
+
+
+class TestLeases:
+    def test_claims_are_disjoint(self, database_url):
+        """Тест, что дата, арендованная одним воркером, недоступна другому до истечения аренды."""
+        with Database(database_url).get_db() as session:
+            crud = LastUpdateTimeCRUD(session)
+            first = crud.claim_dates(DATES[:3], "worker-a", limit=2)
+            second = crud.claim_dates(DATES[:3], "worker-b")
+
+            assert first == DATES[:2]
+            assert second == [DATES[2]]
+            assert crud.heartbeat(first, "worker-a") == 2
+            assert crud.heartbeat(first, "worker-b") == 0
+
+    def test_expired_lease_can_be_reclaimed(self, database_url):
+        """Тест, что просроченную аренду (упавший воркер) может забрать другой воркер."""
+        with Database(database_url).get_db() as session:
+            crud = LastUpdateTimeCRUD(session)
+            crud.claim_dates([DATES[0]], "worker-a", lease_seconds=-1)
+
+            assert crud.claim_dates([DATES[0]], "worker-b") == [DATES[0]]
+            assert crud.get_last_update_info(DATES[0]).lease_owner == "worker-b"
+
+    def test_release_marks_complete_and_skips_reprocessing(self, database_url):
+        """Тест, что завершенную после начала прогона дату не арендуют повторно."""
+        with Database(database_url).get_db() as session:
+            crud = LastUpdateTimeCRUD(session)
+            run_started_at = datetime.utcnow() - timedelta(seconds=1)
+            crud.claim_dates([DATES[0]], "worker-a")
+            assert crud.release_dates([DATES[0]], "worker-a", is_complete=True) == 1
+
+            info = crud.get_last_update_info(DATES[0])
+            assert info.is_complete is True
+            assert info.lease_owner is None and info.lease_expires_at is None
+            assert crud.claim_dates([DATES[0]], "worker-b", stale_before=run_started_at) == []
+
+    def test_date_rows_are_created_once_per_sync(self, database_url):
+        """Тест, что строки дат создаются одним INSERT на прогон, а не при каждой аренде."""
+        db = Database(database_url)
+        inserts = []
+
+        def count_inserts(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO last_update_time"):
+                inserts.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", count_inserts)
+        try:
+            with db.get_db() as session:
+                DataLoader(
+                    SyntheticApiDataSource(),
+                    DailyStatsCRUD(session),
+                    LastUpdateTimeCRUD(session),
+                    lease_owner="worker-a",
+                    claim_batch_size=1
+                ).process_daily_stats()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_inserts)
+
+        assert len(inserts) == 1
+        with db.get_db() as session:
+            infos = session.query(LastUpdateTime).all()
+            assert len(infos) == len(DATES)
+            assert all(info.is_complete and info.lease_owner is None for info in infos)
+
+    def test_parallel_workers_process_disjoint_dates(self, database_url):
+        """Тест нескольких процессов на одной базе: каждая дата обрабатывается ровно одним воркером."""
+        ctx = multiprocessing.get_context("spawn")
+        workers_count = 3
+        barrier = ctx.Barrier(workers_count)
+        claims_queue = ctx.Queue()
+        processes = [
+            ctx.Process(target=_run_worker, args=(database_url, f"worker-{i}", barrier, claims_queue))
+            for i in range(workers_count)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=60)
+            assert process.exitcode == 0
+
+        claims = []
+        try:
+            while True:
+                claims.append(claims_queue.get(timeout=1))
+        except queue.Empty:
+            pass
+        claimed_dates = [claimed_date for _, claimed_date in claims]
+        assert sorted(claimed_dates) == DATES  # каждая дата арендована ровно один раз
+
+        with Database(database_url).get_db() as session:
+            assert session.query(DailyStats).count() == len(DATES) * 2
+            infos = session.query(LastUpdateTime).all()
+            assert len(infos) == len(DATES)
+            assert all(info.is_complete and info.lease_owner is None for info in infos)
+
+    def test_lease_is_held_while_writer_lags(self, database_url, monkeypatch):
+        """Тест, что аренда продлевается, пока отстающий писатель не применит отметку о завершении."""
+        original_upsert = DailyStatsCRUD.bulk_upsert_daily_stats
+
+        def slow_upsert(crud, rows):
+            time.sleep(1.5)
+            return original_upsert(crud, rows)
+
+        monkeypatch.setattr(DailyStatsCRUD, "bulk_upsert_daily_stats", slow_upsert)
+        db = Database(database_url)
+        keeper = LeaseKeeper(db.SessionLocal, "worker-a", lease_seconds=0.6, interval=0.1)
+        with keeper, db.get_db() as session:
+            with BatchedStatsWriter(db.SessionLocal, batch_size=2) as writer:
+                DataLoader(
+                    SyntheticApiDataSource(),
+                    DailyStatsCRUD(session),
+                    LastUpdateTimeCRUD(session),
+                    lease_owner="worker-a",
+                    lease_seconds=0.6,
+                    writer=writer,
+                    lease_keeper=keeper
+                ).process_daily_stats()
+                # Загрузчик уже закончил, а писатель еще пишет: срок первой аренды прошел
+                time.sleep(1.0)
+                with db.get_db() as other_session:
+                    assert LastUpdateTimeCRUD(other_session).claim_dates(DATES, "worker-b") == []
+                assert keeper.heartbeats > 0
+            assert keeper.held_dates == set()
+
+        with db.get_db() as session:
+            infos = session.query(LastUpdateTime).all()
+            assert len(infos) == len(DATES)
+            assert all(info.is_complete and info.lease_owner is None for info in infos)
+            assert session.query(DailyStats).count() == len(DATES) * 2
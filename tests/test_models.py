@@ -2,7 +2,7 @@ from datetime import date, datetime
 
 from sqlalchemy import Column
 
-from app.models import Base, DailyStats, LastUpdateTime
+from app.models import Base, Campaign, DailyStats, LastUpdateTime
 
 
 class TestModels:
@@ -18,9 +18,11 @@ class TestModels:
         assert DailyStats.date.prop.columns[0].type.python_type == date
         assert DailyStats.date.primary_key is True
 
-        assert isinstance(DailyStats.campaign_id.prop.columns[0], Column)
-        assert DailyStats.campaign_id.prop.columns[0].type.python_type == str
-        assert DailyStats.campaign_id.primary_key is True
+        assert isinstance(DailyStats.campaign_key.prop.columns[0], Column)
+        assert DailyStats.campaign_key.prop.columns[0].type.python_type == int
+        assert DailyStats.campaign_key.primary_key is True
+        foreign_keys = DailyStats.campaign_key.prop.columns[0].foreign_keys
+        assert {fk.target_fullname for fk in foreign_keys} == {"campaigns.id"}
 
         assert isinstance(DailyStats.spend.prop.columns[0], Column)
         assert DailyStats.spend.prop.columns[0].type.python_type == float
@@ -37,6 +39,30 @@ class TestModels:
         # Проверка, что DailyStats является подклассом Base
         assert issubclass(DailyStats, Base)
 
+    def test_campaign_model_definition(self):
+        """
+        Тест объявления модели Campaign:
+        Проверяет целочисленный ключ и уникальный строковый ID кампании.
+        """
+        assert Campaign.__tablename__ == "campaigns"
+
+        assert Campaign.id.prop.columns[0].type.python_type == int
+        assert Campaign.id.primary_key is True
+
+        assert Campaign.campaign_id.prop.columns[0].type.python_type == str
+        assert Campaign.campaign_id.nullable is False
+        assert Campaign.campaign_id.prop.columns[0].unique is True
+
+        assert issubclass(Campaign, Base)
+
+    def test_daily_stats_campaign_id_proxy(self):
+        """Тест, что DailyStats.campaign_id читается через связанную кампанию."""
+        campaign = Campaign(id=7, campaign_id="CAMP-ABC")
+        daily_stat = DailyStats(date=date(2025, 6, 11), campaign=campaign, spend=1.0, conversions=1)
+
+        assert daily_stat.campaign_id == "CAMP-ABC"
+        assert repr(campaign) == "<Campaign(id=7, campaign_id='CAMP-ABC')>"
+
     def test_daily_stats_repr(self):
         """Тест метода __repr__ для DailyStats."""
         daily_stat = DailyStats(
@@ -0,0 +1,130 @@
+import re
+import threading
+
+import pytest
+from sqlalchemy import event, text
+
+from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.data_loader import DataLoader
+from app.data_models import ConversionEntry, SpendEntry
+from app.profiling import RunProfiler, SqlProfiler, create_profiler, normalize_sql
+
+
+class ProfiledApiDataSource:
+    def fetch_fb_spend_data(self):
+        return [SpendEntry(date=f"2025-06-0{day}", campaign_id=f"CAMP-{n}", spend=10.0 + n)
+                for day in range(1, 4) for n in range(20)]
+
+    def fetch_network_conversions_data(self):
+        return [ConversionEntry(date=f"2025-06-0{day}", campaign_id=f"CAMP-{n}", conversions=n % 3)
+                for day in range(1, 4) for n in range(20)]
+
+
+def _profiled_run(db, tmp_path, mode):
+    profiler = create_profiler(mode, db.engine, str(tmp_path / "profiles"))
+    with profiler.profile(), db.get_db() as session:
+        loader = DataLoader(ProfiledApiDataSource(), DailyStatsCRUD(session), LastUpdateTimeCRUD(session),
+                            profiler=profiler)
+        stats = loader.process_daily_stats()
+    assert stats.dates_processed == 3
+    return profiler
+
+
+class TestNormalizeSql:
+    def test_literals_and_lists(self):
+        """Тест, что литералы, параметры и списки IN схлопываются в один шаблон."""
+        assert normalize_sql("SELECT * FROM t WHERE a = 'x' AND b IN (?, ?, ?)\n  LIMIT 10") == \
+            normalize_sql("SELECT * FROM t WHERE a = 'y''z' AND b IN (:p1, :p2) LIMIT 5") == \
+            "SELECT * FROM t WHERE a = ? AND b IN (?...) LIMIT ?"
+
+    def test_multi_row_values(self):
+        """Тест, что пакеты INSERT ... VALUES разной длины группируются вместе."""
+        assert normalize_sql("INSERT INTO t (a, b) VALUES (?, ?), (?, ?), (?, ?)") == \
+            normalize_sql("INSERT INTO t (a, b) VALUES (?, ?), (?, ?)") == \
+            "INSERT INTO t (a, b) VALUES (?...), ..."
+
+    def test_single_item_lists_and_rows(self):
+        """Тест, что списки и VALUES из одного элемента группируются вместе с длинными."""
+        assert normalize_sql("SELECT a FROM t WHERE b IN (?)") == \
+            normalize_sql("SELECT a FROM t WHERE b IN (?, ?)") == \
+            "SELECT a FROM t WHERE b IN (?...)"
+        assert normalize_sql("INSERT INTO t (a) VALUES (?)") == \
+            normalize_sql("INSERT INTO t (a) VALUES (?), (?), (?)") == \
+            normalize_sql("INSERT INTO t (a) VALUES (?, ?)") == \
+            "INSERT INTO t (a) VALUES (?...), ..."
+
+    def test_base_profiler_is_abstract(self):
+        """Тест, что базовый профилировщик нельзя создать без write_report."""
+        with pytest.raises(TypeError):
+            RunProfiler()
+
+    def test_unknown_mode(self, tmp_path):
+        """Тест ошибки для неподдерживаемого режима профилирования."""
+        with pytest.raises(ValueError):
+            create_profiler("io", None, str(tmp_path))
+
+
+class TestRunProfilers:
+    def test_cpu(self, db, tmp_path):
+        """Тест, что режим cpu пишет дамп pstats и collapsed stacks для flame graph."""
+        pstats_path, collapsed_path = _profiled_run(db, tmp_path, "cpu").report_paths
+        assert pstats_path.endswith(".pstats") and collapsed_path.endswith(".collapsed")
+        with open(collapsed_path, encoding="utf-8") as stream:
+            lines = stream.read().splitlines()
+        assert lines and all(re.fullmatch(r".+ \d+", line) for line in lines)
+        assert any("process_daily_stats (data_loader.py" in line for line in lines)
+
+    def test_alloc(self, db, tmp_path):
+        """Тест, что режим alloc пишет отчет по выделениям памяти для каждого этапа."""
+        [path] = _profiled_run(db, tmp_path, "alloc").report_paths
+        with open(path, encoding="utf-8") as stream:
+            report = stream.read()
+        for stage in ("fetch_spend", "fetch_conversions", "aggregate", "save"):
+            assert f"== Этап {stage}:" in report
+
+    def test_sql(self, db, tmp_path):
+        """Тест, что режим sql группирует запросы по шаблону и снимает обработчики событий."""
+        profiler = _profiled_run(db, tmp_path, "sql")
+        [path] = profiler.report_paths
+        with open(path, encoding="utf-8") as stream:
+            report = stream.read()
+        assert "INSERT INTO daily_stats " in report
+        assert "SELECT " in report
+        # Одна строка отчета на шаблон: повторные запросы не дублируются
+        statements = [line.split("  ")[-1] for line in report.splitlines()[3:]]
+        assert len(statements) == len(set(statements))
+        assert not event.contains(profiler.engine, "after_cursor_execute", profiler._after_cursor_execute)
+
+    def test_sql_background_thread_is_not_attributed_to_stage(self, db, tmp_path):
+        """Тест, что запросы фонового потока не попадают в этап, идущий в потоке синхронизации."""
+        profiler = SqlProfiler(db.engine, str(tmp_path))
+
+        def background_query():
+            with db.engine.connect() as connection:
+                connection.execute(text("SELECT 2"))
+
+        with profiler.profile():
+            profiler.on_stage_start("save")
+            with db.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            writer = threading.Thread(target=background_query, name="stats-writer")
+            writer.start()
+            writer.join()
+            profiler.on_stage_end("save")
+
+        assert set(profiler._stage_seconds) == {"save", "[stats-writer]"}
+        with open(profiler.report_paths[0], encoding="utf-8") as stream:
+            assert "[stats-writer]=" in stream.readlines()[1]
+
+    def test_sql_failed_statement_does_not_shift_timings(self, db, tmp_path):
+        """Тест, что упавший запрос не оставляет отметку начала, которую заберет следующий запрос."""
+        profiler = SqlProfiler(db.engine, str(tmp_path))
+
+        with profiler.profile(), db.engine.connect() as connection:
+            with pytest.raises(Exception):
+                connection.execute(text("SELECT * FROM missing_table"))
+            connection.execute(text("SELECT 1"))
+            assert connection.info["profiling_started"] == []
+
+        assert set(profiler._statements) == {"SELECT ?"}
+        assert profiler._statements["SELECT ?"].count == 1
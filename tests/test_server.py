@@ -0,0 +1,99 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.server import create_server
+
+
+@pytest.fixture
+def db(db):
+    with db.get_db() as session:
+        crud = DailyStatsCRUD(session)
+        crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-123", 37.5, 15, 2.5)
+        crud.upsert_daily_stat(date(2025, 6, 4), "CAMP-456", 20.0, 4, 5.0)
+        crud.upsert_daily_stat(date(2025, 6, 5), "CAMP-123", 40.0, 10, 4.0)
+        crud.upsert_daily_stat(date(2025, 6, 5), "CAMP-999", 5.0, 0, None)
+        LastUpdateTimeCRUD(session).set_last_update_info(date(2025, 6, 5), is_complete=True)
+    return db
+
+
+@pytest.fixture
+def base_url(db):
+    server = create_server(db, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url, headers=None):
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+class TestStatsServer:
+    def test_campaign_cpa_series(self, base_url):
+        """Тест временного ряда CPA кампании с фильтром по датам."""
+        status, _, body = _get(f"{base_url}/campaigns/CAMP-123/cpa?from=2025-06-05")
+        assert status == 200
+        assert body == {
+            "campaign_id": "CAMP-123",
+            "series": [{"date": "2025-06-05", "spend": 40.0, "conversions": 10, "cpa": 4.0}]
+        }
+
+    def test_totals_and_top(self, base_url):
+        """Тест итогов за период и топ-N кампаний по spend и по CPA."""
+        _, _, totals = _get(f"{base_url}/totals?from=2025-06-04&to=2025-06-05")
+        assert totals["spend"] == pytest.approx(102.5)
+        assert totals["conversions"] == 29
+        assert totals["campaigns"] == 3
+
+        _, _, top = _get(f"{base_url}/top?n=2&by=spend")
+        assert [c["campaign_id"] for c in top["campaigns"]] == ["CAMP-123", "CAMP-456"]
+
+        _, _, top_cpa = _get(f"{base_url}/top?by=cpa")
+        assert [c["campaign_id"] for c in top_cpa["campaigns"]] == ["CAMP-123", "CAMP-456"]  # CAMP-999 без конверсий
+
+    def test_bad_request_and_not_found(self, base_url):
+        """Тест ответов 400 и 404."""
+        assert _get(f"{base_url}/totals?from=yesterday")[0] == 400
+        assert _get(f"{base_url}/top?by=clicks")[0] == 400
+        assert _get(f"{base_url}/unknown")[0] == 404
+
+    def test_etag_and_invalidation(self, db, base_url):
+        """Тест 304 по If-None-Match и инвалидации кэша при обновлении LastUpdateTime."""
+        status, headers, body = _get(f"{base_url}/totals")
+        etag = headers["ETag"]
+        assert status == 200 and etag.startswith('"')
+
+        assert _get(f"{base_url}/totals", {"If-None-Match": etag})[0] == 304
+
+        with db.get_db() as session:
+            DailyStatsCRUD(session).upsert_daily_stat(date(2025, 6, 6), "CAMP-123", 10.0, 1, 10.0)
+        # Пока LastUpdateTime не изменился, отдается закэшированный ответ
+        assert _get(f"{base_url}/totals")[2] == body
+
+        with db.get_db() as session:
+            LastUpdateTimeCRUD(session).set_last_update_info(date(2025, 6, 6), is_complete=True)
+        status, headers, new_body = _get(f"{base_url}/totals", {"If-None-Match": etag})
+        assert status == 200
+        assert headers["ETag"] != etag
+        assert new_body["spend"] == pytest.approx(112.5)
+
+    def test_read_only_engine_rejects_writes(self, db):
+        """Тест, что пул только для чтения не позволяет изменять данные."""
+        with db.get_read_only_db() as session:
+            with pytest.raises(OperationalError):
+                session.execute(text("DELETE FROM daily_stats"))
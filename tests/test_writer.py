@@ -0,0 +1,118 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from app.crud import DailyStatsCRUD, LastUpdateTimeCRUD
+from app.data_loader import DataLoader
+from app.data_models import CombinedDailyStatData, ConversionEntry, SpendEntry
+from app.db import Database
+from app.models import DailyStats
+from app.writer import BatchedStatsWriter, StatsWriterError
+
+
+class MockApiDataSource:
+    def fetch_fb_spend_data(self):
+        return [SpendEntry(date=f"2025-06-0{day}", campaign_id=f"CAMP-{n}", spend=5.0) for day in (4, 5, 6) for n in range(3)]
+
+    def fetch_network_conversions_data(self):
+        return [ConversionEntry(date="2025-06-04", campaign_id="CAMP-0", conversions=2)]
+
+
+def _stat(day: int, campaign_id: str, spend: float = 10.0) -> CombinedDailyStatData:
+    return CombinedDailyStatData(date=date(2025, 6, day), campaign_id=campaign_id, spend=spend, conversions=2, cpa=spend / 2)
+
+
+def _count_stats(db: Database) -> int:
+    with db.get_db() as session:
+        return session.query(DailyStats).count()
+
+
+class TestBatchedStatsWriter:
+    def test_close_flushes_and_marks_complete(self, db):
+        """Тест, что close() записывает остаток очереди, а затем применяет отметки LastUpdateTime."""
+        with BatchedStatsWriter(db.SessionLocal, batch_size=3, max_batch_age=60) as writer:
+            for n in range(7):
+                writer.put(_stat(4, f"CAMP-{n}"))
+            writer.put(_stat(4, "CAMP-0", spend=99.0))  # повтор ключа: побеждает последнее значение
+            writer.mark_complete([date(2025, 6, 4)])
+
+        assert writer.rows_written == 8
+        with db.get_db() as session:
+            assert session.query(DailyStats).count() == 7
+            assert DailyStatsCRUD(session).get_daily_stat(date(2025, 6, 4), "CAMP-0").spend == 99.0
+            assert LastUpdateTimeCRUD(session).get_last_update_info(date(2025, 6, 4)).is_complete is True
+
+    def test_flushes_partial_batch_by_age(self, db):
+        """Тест, что неполный пакет записывается по истечении max_batch_age."""
+        with BatchedStatsWriter(db.SessionLocal, batch_size=100, max_batch_age=0.05) as writer:
+            writer.put(_stat(4, "CAMP-1"))
+            deadline = time.monotonic() + 5
+            while _count_stats(db) == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert _count_stats(db) == 1
+
+    def test_put_blocks_when_queue_is_full(self, db, monkeypatch):
+        """Тест обратного давления: при заполненной очереди put() ждет писателя."""
+        release = threading.Event()
+        original = DailyStatsCRUD.bulk_upsert_daily_stats
+
+        def slow_bulk_upsert(self, items):
+            release.wait(timeout=5)
+            return original(self, items)
+
+        monkeypatch.setattr(DailyStatsCRUD, "bulk_upsert_daily_stats", slow_bulk_upsert)
+
+        with BatchedStatsWriter(db.SessionLocal, batch_size=1, max_queue_size=1) as writer:
+            producer = threading.Thread(target=lambda: [writer.put(_stat(4, f"CAMP-{n}")) for n in range(4)])
+            producer.start()
+            producer.join(timeout=0.3)
+            assert producer.is_alive()  # производитель заблокирован
+            release.set()
+            producer.join(timeout=5)
+            assert not producer.is_alive()
+
+        assert _count_stats(db) == 4
+
+    def test_write_error_is_surfaced_and_completion_skipped(self, make_db):
+        """Тест, что ошибка записи поднимается у вызывающего, а даты не отмечаются завершенными."""
+        db = make_db("empty", create_tables=False)
+
+        writer = BatchedStatsWriter(db.SessionLocal, batch_size=1)
+        writer.start()
+        writer.put(_stat(4, "CAMP-1"))
+        writer.mark_complete([date(2025, 6, 4)])
+        with pytest.raises(StatsWriterError):
+            writer.close()
+        with pytest.raises(StatsWriterError):
+            writer.put(_stat(5, "CAMP-1"))
+
+    def test_failing_session_factory_does_not_block_producer(self, db):
+        """Тест, что при падении потока до начала записи put() и close() поднимают ошибку, а не висят."""
+        def broken_session_factory():
+            raise RuntimeError("база недоступна")
+
+        writer = BatchedStatsWriter(broken_session_factory, max_queue_size=2)
+        writer.start()
+        with pytest.raises(StatsWriterError, match="база недоступна"):
+            for n in range(10):
+                writer.put(_stat(4, f"CAMP-{n}"))
+        with pytest.raises(StatsWriterError):
+            writer.close()
+
+    def test_data_loader_with_writer(self, db):
+        """Тест DataLoader с фоновым писателем: все строки записаны, даты отмечены завершенными."""
+        with db.get_db() as session, BatchedStatsWriter(db.SessionLocal, batch_size=2) as writer:
+            DataLoader(
+                MockApiDataSource(),
+                DailyStatsCRUD(session),
+                LastUpdateTimeCRUD(session),
+                writer=writer
+            ).process_daily_stats()
+
+        with db.get_db() as session:
+            assert session.query(DailyStats).count() == 9
+            update_crud = LastUpdateTimeCRUD(session)
+            for day in (4, 5, 6):
+                assert update_crud.get_last_update_info(date(2025, 6, day)).is_complete is True